@@ -0,0 +1,187 @@
+"""
+    本地模拟的TqApi：合成的合约目录（期货+期权）和tick流，不连网，用于基准测试
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from tqsdk.objs import Quote, Account, Position
+
+
+class _FakeBacktest:
+    """
+        只提供TqBacktest的_current_dt（纳秒），TqOption以此作为当前时间筛选未到期合约
+    """
+
+    def __init__(self, api: "FakeApi"):
+        self._api = api
+
+    @property
+    def _current_dt(self) -> int:
+        return int(self._api._now.timestamp() * 1e9)
+
+
+class FakeApi:
+    """
+        模拟TqApi的一小部分接口：_data["quotes"]、get_quote、is_changing、wait_update、get_account、get_position
+
+        每个品种n_months个期货合约，每个期货合约挂n_strikes档行权价的认购、认沽期权。第偶数个月份的期权与期货同日到期
+        （TqOption.future_opt_matched_dates非空，隐含利率曲线可以计算），其余月份的期权早于期货到期。
+        当前时间为模拟的行情时间（_backtest._current_dt），按品种筛选合约时不会因合约已过期而为空。
+        wait_update()推进一步行情：随机挑选change_ratio比例的合约做随机游走，is_changing对这些合约返回True。
+    """
+
+    def __init__(self, n_products: int = 20, n_months: int = 6, n_strikes: int = 40, start: datetime = datetime(2020, 2, 3, 9), change_ratio: float = 0.05, seed: int = 0):
+        """
+
+            Args:
+
+                n_products (int): 品种数
+
+                n_months (int): 每个品种的期货合约数
+
+                n_strikes (int): 每个期货合约的期权行权价档数
+
+                start (datetime): 起始行情时间
+
+                change_ratio (float): 每次wait_update有行情变化的合约比例
+
+                seed (int): 随机数种子
+
+        """
+        self._backtest = _FakeBacktest(self)
+        self._data = {"quotes": {}}
+        self._rng = np.random.default_rng(seed)
+        self._now = start
+        self._changed = set()
+        self._change_ratio = change_ratio
+        self._account = Account(self)
+        self._positions = dict()
+        self.futures = []  # 期货合约代码
+        self.options = dict()  # {期货合约代码: [期权合约代码]}
+        for p in range(n_products):
+            product_id = "P{:02d}".format(p)
+            price = 1000.0 * (1 + p % 7)
+            step = price * 0.01
+            for m in range(n_months):
+                year = start.year + (start.month + m) // 12
+                month = (start.month + m) % 12 + 1
+                expire = datetime(year, month, 14, 15)
+                future_id = "FAKE.{}{:02d}{:02d}".format(product_id, year % 100, month)
+                self._add(future_id, ins_class="FUTURE", product_id=product_id, expire_datetime=expire.timestamp(),
+                          delivery_year=year, delivery_month=month, volume_multiple=10, price_tick=1.0,
+                          last_price=price, margin=price * 10 * 0.08, pre_settlement=price, pre_close=price)
+                self.futures.append(future_id)
+                self.options[future_id] = []
+                # 偶数月份与期货同日到期；其余月份提前到上月17~20日，不会与任何期货的到期日相同
+                option_expire = expire if m % 2 == 0 else expire - timedelta(days=25)
+                for k in range(n_strikes):
+                    strike = round(price + (k - n_strikes // 2) * step)
+                    for option_class in ("CALL", "PUT"):
+                        intrinsic = max(price - strike, 0) if option_class == "CALL" else max(strike - price, 0)
+                        option_id = "{}-{}-{}".format(future_id, option_class[0], strike)
+                        self._add(option_id, ins_class="FUTURE_OPTION", product_id=product_id + "_o", option_class=option_class,
+                                  strike_price=float(strike), underlying_symbol=future_id, expire_datetime=option_expire.timestamp(),
+                                  delivery_year=year, delivery_month=month, volume_multiple=10, price_tick=0.5,
+                                  last_price=intrinsic + step, pre_settlement=intrinsic + step, pre_close=intrinsic + step)
+                        self.options[future_id].append(option_id)
+
+    def _add(self, symbol: str, last_price: float, price_tick: float, **kwargs):
+        quote = Quote(self)
+        quote.instrument_id = symbol
+        quote.expired = False
+        quote.datetime = self._now.strftime("%Y-%m-%d %H:%M:%S.%f")
+        quote.last_price = last_price
+        quote.bid_price1 = last_price - price_tick
+        quote.ask_price1 = last_price + price_tick
+        quote.price_tick = price_tick
+        for k, v in kwargs.items():
+            setattr(quote, k, v)
+        self._data["quotes"][symbol] = quote
+
+    def get_quote(self, symbol: str) -> Quote:
+        return self._data["quotes"][symbol]
+
+    def get_account(self) -> Account:
+        return self._account
+
+    def get_position(self, symbol: str = None) -> Position:
+        if symbol is None:
+            return self._positions
+        position = self._positions.get(symbol, None)
+        if position is None:
+            position = Position(self)
+            position.instrument_id = symbol
+            self._positions[symbol] = position
+        return position
+
+    def create_task(self, coro):
+        coro.close()
+
+    def wait_update(self, deadline: float = None) -> bool:
+        """
+            推进一步行情，返回True
+        """
+        self._now += timedelta(milliseconds=500)
+        dt = self._now.strftime("%Y-%m-%d %H:%M:%S.%f")
+        quotes = self._data["quotes"]
+        symbols = list(quotes.keys())
+        n = max(int(len(symbols) * self._change_ratio), 1)
+        picked = self._rng.choice(len(symbols), n, replace=False)
+        moves = self._rng.integers(-2, 3, n)
+        self._changed = set()
+        for i, move in zip(picked.tolist(), moves.tolist()):
+            quote = quotes[symbols[i]]
+            quote.last_price = max(quote.last_price + move * quote.price_tick, quote.price_tick)
+            quote.bid_price1 = quote.last_price - quote.price_tick
+            quote.ask_price1 = quote.last_price + quote.price_tick
+            quote.volume += abs(move)
+            quote.datetime = dt
+            self._changed.add(quote.instrument_id)
+        return True
+
+    def is_changing(self, obj, key=None) -> bool:
+        return getattr(obj, "instrument_id", None) in self._changed
+
+    def close(self):
+        pass
+
+
+def make_ticks(n: int, start: datetime = datetime(2020, 2, 3, 9), price: float = 2000.0, seed: int = 0) -> pd.DataFrame:
+    """
+        合成tick序列，字段同get_tick_serial（datetime为纳秒时间戳）
+    """
+    rng = np.random.default_rng(seed)
+    last_price = price + np.cumsum(rng.integers(-1, 2, n)).astype(np.float64)
+    spread = rng.integers(0, 2, n)
+    volume = np.cumsum(rng.integers(0, 20, n))
+    oi_diff = rng.integers(-10, 11, n)
+    return pd.DataFrame({
+        'id': np.arange(n, dtype=np.int64),
+        'datetime': np.int64(start.timestamp() * 1e9) + np.arange(n, dtype=np.int64) * 500_000_000,
+        'last_price': last_price,
+        'bid_price1': last_price - spread,
+        'ask_price1': last_price + 1 - spread,
+        'volume': volume,
+        'open_interest': 100000 + np.cumsum(oi_diff),
+    })
+
+
+def make_klines(n: int, start: datetime = datetime(2019, 7, 1, 9), duration: int = 15 * 60, price: float = 3800.0, seed: int = 0) -> pd.DataFrame:
+    """
+        合成K线序列，字段同get_kline_serial（datetime为纳秒时间戳）
+    """
+    rng = np.random.default_rng(seed)
+    close = price + np.cumsum(rng.normal(0, price * 0.002, n))
+    open_ = np.concatenate([[price], close[:-1]])
+    high = np.maximum(open_, close) + np.abs(rng.normal(0, price * 0.001, n))
+    low = np.minimum(open_, close) - np.abs(rng.normal(0, price * 0.001, n))
+    return pd.DataFrame({
+        'id': np.arange(n, dtype=np.int64),
+        'datetime': np.int64(start.timestamp() * 1e9) + np.arange(n, dtype=np.int64) * duration * 1_000_000_000,
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': rng.integers(100, 10000, n),
+    })
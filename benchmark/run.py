@@ -0,0 +1,262 @@
+"""
+    离线基准测试：在FakeApi上测量各模块热点，结果写入json文件以便跨版本对比
+
+    python benchmark/run.py --output bench.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "option"))
+sys.path.append(os.path.join(ROOT, "ta"))
+sys.path.append(os.path.join(ROOT, "tqexcel"))
+
+from fake_api import FakeApi, make_ticks, make_klines
+from opt import TqOption, OptionTrade
+from dispatcher import ParityDispatcher
+from greeks import implied_vol
+from tafunc_tick_msg import cal_ticks_msg
+from tafunc_incremental import IncrementalMA, CrossDetector, KlineCursor
+from tqsdk.tafunc import ma, crossup, crossdown
+from server import MarketDataServer, RangeSync, QUOTE
+
+
+def _measure(fn, number: int = 1, repeat: int = 3) -> float:
+    """
+        调用fn共number次为一轮，取repeat轮中最快一轮的单次耗时（秒），计时期间关闭gc（同timeit）
+    """
+    best = float("inf")
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            best = min(best, (time.perf_counter() - start) / number)
+    finally:
+        gc.enable()
+    return best
+
+
+def _result(name: str, seconds: float, n: int = 1, **extra) -> dict:
+    """
+        n为单次调用处理的条数（如tick数），per_item_us为每条的耗时
+    """
+    res = {'name': name, 'seconds': seconds, 'n': n, 'per_item_us': seconds / n * 1e6, 'items_per_s': n / seconds if seconds > 0 else None}
+    res.update(extra)
+    return res
+
+
+def bench_option(n_products: int, n_months: int, n_strikes: int, repeat: int) -> list:
+    results = []
+    api = FakeApi(n_products=n_products, n_months=n_months, n_strikes=n_strikes)
+    n_quotes = len(api._data["quotes"])
+    future_id = api.futures[0]
+    product_id = future_id.split(".")[1][:3]
+    # 首次构造需要建合约目录，每轮用一个新的api
+    cold_apis = [FakeApi(n_products=n_products, n_months=n_months, n_strikes=n_strikes) for _ in range(repeat)]
+    results.append(_result("TqOption.__init__/cold_catalog", _measure(
+        lambda: TqOption(cold_apis.pop(), underlying_future_id=future_id, option_product_id=product_id + "_o"),
+        repeat=repeat), quotes=n_quotes))
+    snapshot_dir = tempfile.mkdtemp(prefix="bench_snapshot_")
+    TqOption(FakeApi(n_products=n_products, n_months=n_months, n_strikes=n_strikes), underlying_future_id=future_id, option_product_id=product_id + "_o", snapshot_dir=snapshot_dir)
+    cold_apis = [FakeApi(n_products=n_products, n_months=n_months, n_strikes=n_strikes) for _ in range(repeat)]
+    results.append(_result("TqOption.__init__/snapshot", _measure(
+        lambda: TqOption(cold_apis.pop(), underlying_future_id=future_id, option_product_id=product_id + "_o", snapshot_dir=snapshot_dir),
+        repeat=repeat), quotes=n_quotes))
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    results.append(_result("TqOption.__init__/underlying", _measure(
+        lambda: TqOption(api, underlying_future_id=future_id, option_product_id=product_id + "_o"), number=20, repeat=repeat), quotes=n_quotes))
+    results.append(_result("TqOption.__init__/product", _measure(
+        lambda: TqOption(api, future_product_id=product_id, option_product_id=product_id + "_o"), number=20, repeat=repeat), quotes=n_quotes))
+    future = api.get_quote(future_id)
+    opt_api = TqOption(api, underlying_future_id=future_id, option_product_id=product_id + "_o")
+    results.append(_result("TqOption.get_future_opt_symbols", _measure(
+        lambda: opt_api.get_future_opt_symbols(strike_year=future.delivery_year, strike_month=future.delivery_month), number=20, repeat=repeat), n=n_strikes))
+    _, opts = opt_api.get_future_opt_symbols(strike_year=future.delivery_year, strike_month=future.delivery_month)
+    groups = [(opt['K'], api.get_quote(opt['c']), api.get_quote(opt['p'])) for opt in opts.values()]
+
+    def parity_all():
+        for strike_price, call_quote, put_quote in groups:
+            opt_api.get_parity_residual(future, strike_price, call_quote, put_quote)
+    results.append(_result("TqOption.get_parity_residual", _measure(parity_all, number=10, repeat=repeat), n=len(groups)))
+    chain = opt_api.get_option_chain(strike_year=future.delivery_year, strike_month=future.delivery_month)
+    results.append(_result("TqOption.get_chain_parity_residuals", _measure(
+        lambda: opt_api.get_chain_parity_residuals(future, chain), number=10, repeat=repeat), n=len(chain)))
+    # 隐含波动率：整条链全部重算，以及行情不变时直接返回
+    prices = chain.price_arrays()
+    strikes = np.concatenate([chain.strikes, chain.strikes])
+    option_prices = np.concatenate([prices['call_last'], prices['put_last']])
+    is_call = np.arange(len(strikes)) < len(chain)
+    results.append(_result("greeks.implied_vol", _measure(
+        lambda: implied_vol(option_prices, future.last_price, strikes, 0.1, 0.02, is_call), number=10, repeat=repeat), n=len(strikes)))
+    opt_api.get_chain_greeks(future, chain)
+    results.append(_result("TqOption.get_chain_greeks/unchanged", _measure(
+        lambda: opt_api.get_chain_greeks(future, chain), number=10, repeat=repeat), n=len(chain)))
+    trade = OptionTrade(api, opt_api, future_id, opts, return_threshold=None)
+
+    def on_quote_all():
+        for strike_price, call_quote, put_quote in groups:
+            trade.on_quote(future, strike_price, call_quote, put_quote)
+    results.append(_result("OptionTrade.on_quote", _measure(on_quote_all, number=10, repeat=repeat), n=len(groups)))
+    results.append(_result("OptionTrade.on_quotes", _measure(lambda: trade.on_quotes(future, chain), number=10, repeat=repeat), n=len(chain)))
+    # 滚动统计+自适应折溢价临界值
+    rolling_trade = OptionTrade(api, opt_api, future_id, opts, return_threshold=None, window=300, z_threshold=2.0)
+
+    def rolling_on_quote_all():
+        for strike_price, call_quote, put_quote in groups:
+            rolling_trade.on_quote(future, strike_price, call_quote, put_quote)
+    results.append(_result("OptionTrade.on_quote/rolling", _measure(rolling_on_quote_all, number=10, repeat=repeat), n=len(groups)))
+    results.append(_result("OptionTrade.on_quotes/rolling", _measure(lambda: rolling_trade.on_quotes(future, chain), number=10, repeat=repeat), n=len(chain)))
+    trade.save_data = True
+    results.append(_result("OptionTrade.on_quote/save_data", _measure(on_quote_all, number=10, repeat=repeat), n=len(groups)))
+    trade.save_data = False
+    # 合成tick流经dispatcher分发：每个周期先推进行情再分发，耗时含FakeApi.wait_update
+    dispatcher = ParityDispatcher(api)
+    for strike_price, call_quote, put_quote in groups:
+        dispatcher.add(trade, strike_price, future, call_quote, put_quote, None, None, None)
+
+    def cycle():
+        api.wait_update()
+        dispatcher.dispatch()
+    results.append(_result("ParityDispatcher/cycle", _measure(cycle, number=100, repeat=repeat), quotes=n_quotes))
+
+    def greeks_cycle():
+        api.wait_update()
+        opt_api.get_chain_greeks(future, chain)
+    results.append(_result("TqOption.get_chain_greeks/cycle", _measure(greeks_cycle, number=100, repeat=repeat), quotes=n_quotes))
+    # 隐含利率曲线：按品种构造，全部期货期权同到期日的期权链一起求解
+    product_api = TqOption(api, future_product_id=product_id, option_product_id=product_id + "_o")
+    n_matched = sum(len(product_api.get_option_chain(strike_day=day)) for day in product_api.future_opt_matched_dates)
+    product_api.get_implied_risk_free_curve()
+    results.append(_result("TqOption.get_implied_risk_free_curve/unchanged", _measure(
+        lambda: product_api.get_implied_risk_free_curve(), number=10, repeat=repeat), n=n_matched))
+
+    def rate_cycle():
+        api.wait_update()
+        product_api.get_implied_risk_free_curve()
+    results.append(_result("TqOption.get_implied_risk_free_curve/cycle", _measure(rate_cycle, number=20, repeat=repeat), n=n_matched))
+    return results
+
+
+def bench_ta(n_ticks: int, repeat: int) -> list:
+    ticks = make_ticks(n_ticks)
+    return [_result("cal_ticks_msg", _measure(lambda: cal_ticks_msg(ticks), repeat=repeat), n=n_ticks)]
+
+
+def bench_triple_ma(data_length: int, n_updates: int, repeat: int) -> list:
+    """
+        triple_ma.py每次K线更新时的计算
+    """
+    klines = make_klines(data_length)
+
+    def loop():
+        for _ in range(n_updates):
+            ma120 = ma(klines.close, 120).iloc[-1]
+            up_cross = crossup(ma(klines.close, 10), ma(klines.close, 20)).iloc[-1]
+            down_cross = crossdown(ma(klines.close, 10), ma(klines.close, 20)).iloc[-1]
+            _ = klines.close.iloc[-1] > ma120, up_cross, down_cross
+
+    # 增量版本：每次更新最后一根K线
+    ma10, ma20, ma120 = IncrementalMA(10), IncrementalMA(20), IncrementalMA(120)
+    cross = CrossDetector()
+    cursor = KlineCursor()
+    cursor.updates(klines)
+
+    def incremental_loop():
+        for _ in range(n_updates):
+            for close, new_bar in cursor.updates(klines):
+                ma120.update(close, new_bar)
+                cross.update(ma10.update(close, new_bar), ma20.update(close, new_bar), new_bar)
+            _ = klines.close.iloc[-1] > ma120.value, cross.up, cross.down
+    return [_result("triple_ma/update", _measure(loop, repeat=repeat), n=n_updates, data_length=data_length),
+            _result("triple_ma/update_incremental", _measure(incremental_loop, repeat=repeat), n=n_updates, data_length=data_length)]
+
+
+def bench_tqexcel(n_products: int, n_months: int, n_strikes: int, repeat: int) -> list:
+    """
+        tqexcel数据服务：整个区域读一次快照，以及每个周期只写变化的单元格
+    """
+    server = MarketDataServer(lambda: FakeApi(n_products=n_products, n_months=n_months, n_strikes=n_strikes), account=False)
+    server.open()
+    symbols = list(server._api._data["quotes"].keys())
+    fields = ['last_price', 'bid_price1', 'ask_price1', 'volume', 'datetime']
+    server.quote_table(symbols, fields)
+    server.step()
+    n_cells = len(symbols) * len(fields)
+    results = [_result("tqexcel.quote_table", _measure(lambda: server.quote_table(symbols, fields), number=10, repeat=repeat), n=n_cells)]
+    cells = dict()
+    sync = RangeSync(server, QUOTE, symbols, fields, lambda r, c, v: cells.__setitem__((r, c), v))
+    sync.sync()
+    written = []
+
+    def cycle():
+        server.step()
+        written.append(sync.sync())
+    results.append(_result("tqexcel.step+RangeSync/cycle", _measure(cycle, number=20, repeat=repeat), cells=n_cells,
+                           written_per_cycle=sum(written) / len(written)))
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tqsdk-python-applications离线基准测试")
+    parser.add_argument("--output", default="bench.json", help="结果json文件")
+    parser.add_argument("--products", type=int, default=20, help="合成品种数")
+    parser.add_argument("--months", type=int, default=6, help="每个品种的期货合约数")
+    parser.add_argument("--strikes", type=int, default=40, help="每个期货合约的行权价档数")
+    parser.add_argument("--ticks", type=int, default=1000000, help="cal_ticks_msg的tick数")
+    parser.add_argument("--klines", type=int, default=8000, help="triple_ma的K线长度")
+    parser.add_argument("--updates", type=int, default=200, help="triple_ma的更新次数")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复轮数，取最快一轮")
+    parser.add_argument("--only", nargs="*", choices=["option", "ta", "triple_ma", "tqexcel"], help="只跑部分测试")
+    args = parser.parse_args()
+    suites = args.only or ["option", "ta", "triple_ma", "tqexcel"]
+    results = []
+    if "option" in suites:
+        results += bench_option(args.products, args.months, args.strikes, args.repeat)
+    if "ta" in suites:
+        results += bench_ta(args.ticks, args.repeat)
+    if "triple_ma" in suites:
+        results += bench_triple_ma(args.klines, args.updates, args.repeat)
+    if "tqexcel" in suites:
+        results += bench_tqexcel(args.products, args.months, args.strikes, args.repeat)
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    for res in results:
+        print("{:<48} {:>12.3f} us/item {:>10} items".format(res['name'], res['per_item_us'], res['n']))
+
+
+if __name__ == "__main__":
+    main()
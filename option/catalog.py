@@ -0,0 +1,136 @@
+"""
+    合约目录：对api._data["quotes"]建立一次索引，后续按product_id、标的、到期日、行权价、CALL/PUT直接查表。
+"""
+from datetime import datetime
+from itertools import islice
+import weakref
+
+from tqsdk import TqApi
+from tqsdk.objs import Quote
+
+#每个api共用一份合约目录
+_catalogs = weakref.WeakKeyDictionary()
+#expire_dt中区分"未收录"与"已收录但没有到期日(None)"
+_MISSING = object()
+
+
+def get_catalog(api: TqApi) -> "ContractCatalog":
+    """
+        取api对应的合约目录，不存在则创建；已存在则补录新上市的合约
+    """
+    catalog = _catalogs.get(api)
+    if catalog is None:
+        catalog = ContractCatalog(api)
+        _catalogs[api] = catalog
+    else:
+        catalog.refresh()
+    return catalog
+
+
+class ContractCatalog:
+    """
+        天勤合约目录
+
+        只在构造时扫描一次全部合约，之后refresh()只处理新加入api._data["quotes"]的合约（dict按插入顺序排列，
+        新合约在末尾，从末尾反向取新增的个数，耗时与新合约数成正比），以及上次扫描时还没有合约信息（ins_class为空）的合约。
+    """
+
+    def __init__(self, api: TqApi):
+        """
+
+            Args:
+
+                api (TqApi): 天勤Api
+
+        """
+        self._api = api
+        self._seen = 0                  # 已扫描的合约数
+        self._pending = dict()          # {合约代码: Quote}，合约信息尚未到达
+        self._expire_dts = dict()       # {合约代码: 到期datetime}
+        self._by_product = dict()       # {product_id: [Quote]}
+        self._by_underlying = dict()    # {标的代码: [期货期权Quote]}
+        self._by_expiry = dict()        # {(标的代码, 到期datetime): [期权Quote]}
+        self._options = dict()          # {(标的代码, 到期datetime, 行权价, CALL/PUT): Quote}
+        self.refresh()
+
+    def refresh(self) -> int:
+        """
+            补录新上市的合约
+
+            Return:
+
+                (int) 新收录的合约数
+
+        """
+        quotes = self._api._data.get("quotes", {})
+        added = 0
+        for symbol, quote in list(self._pending.items()):
+            if self._add(quote):
+                del self._pending[symbol]
+                added += 1
+        if len(quotes) > self._seen:
+            new_items = list(islice(reversed(quotes.items()), len(quotes) - self._seen))
+            for symbol, quote in reversed(new_items):
+                if self._add(quote):
+                    added += 1
+                else:
+                    self._pending[symbol] = quote
+            self._seen = len(quotes)
+        return added
+
+    def _add(self, quote: Quote) -> bool:
+        """
+            收录单个合约，合约信息未到达时返回False
+        """
+        if not quote.get("ins_class", ""):
+            return False
+        expire_dt = datetime.fromtimestamp(quote.expire_datetime) if quote.expire_datetime == quote.expire_datetime else None
+        self._expire_dts[quote.instrument_id] = expire_dt
+        self._by_product.setdefault(quote.product_id, []).append(quote)
+        if quote.ins_class == "FUTURE_OPTION":
+            self._by_underlying.setdefault(quote.underlying_symbol, []).append(quote)
+        if quote.ins_class.endswith("OPTION"):
+            self._by_expiry.setdefault((quote.underlying_symbol, expire_dt), []).append(quote)
+            self._options[(quote.underlying_symbol, expire_dt, quote.strike_price, quote.option_class)] = quote
+        return True
+
+    def expire_dt(self, quote: Quote) -> datetime:
+        """
+            合约到期日，已收录的合约不再重复调用datetime.fromtimestamp；没有到期日（nan）时返回None
+        """
+        expire_dt = self._expire_dts.get(quote.instrument_id, _MISSING)
+        if expire_dt is _MISSING:
+            expire_dt = datetime.fromtimestamp(quote.expire_datetime) if quote.expire_datetime == quote.expire_datetime else None
+        return expire_dt
+
+    def get_by_product(self, product_id: list, now: datetime = None) -> list:
+        """
+            根据product_id取未到期合约
+
+            Args:
+
+                product_id (list): product_id列表
+
+                now (datetime): 当前时间，到期日在此之前的合约不返回
+
+        """
+        return [quote for pid in product_id for quote in self._by_product.get(pid, [])
+                if not quote.expired and (now is None or (self._expire_dts[quote.instrument_id] or now) > now)]
+
+    def get_by_underlying(self, underlying_symbol: str) -> list:
+        """
+            根据标的期货代码取期货期权
+        """
+        return list(self._by_underlying.get(underlying_symbol, []))
+
+    def get_by_expiry(self, underlying_symbol: str, expire_dt: datetime) -> list:
+        """
+            根据标的代码和到期日取期权
+        """
+        return list(self._by_expiry.get((underlying_symbol, expire_dt), []))
+
+    def get_option(self, underlying_symbol: str, expire_dt: datetime, strike_price: float, option_class: str) -> Quote:
+        """
+            根据标的代码、到期日、行权价和CALL/PUT取期权，不存在返回None
+        """
+        return self._options.get((underlying_symbol, expire_dt, strike_price, option_class), None)
@@ -0,0 +1,158 @@
+"""
+    期权链：按行权价排序的数组结构
+"""
+import numpy as np
+
+
+class OptionChain:
+    """
+        同一标的、同一到期日的期权链
+
+        strikes为升序行权价数组，call_symbols/put_symbols、call_index/put_index与之逐位对齐，
+        call_index/put_index为对应期权在quotes中的下标。只收录认购、认沽都存在的行权价。
+    """
+
+    def __init__(self, future_id: str, quotes: list, strikes: np.ndarray, call_index: np.ndarray, put_index: np.ndarray):
+        """
+
+            Args:
+
+                future_id (str): 标的期货合约代码
+
+                quotes (list): 期权合约信息
+
+                strikes (np.ndarray): 升序行权价
+
+                call_index (np.ndarray): 认购期权在quotes中的下标
+
+                put_index (np.ndarray): 认沽期权在quotes中的下标
+
+        """
+        self.future_id = future_id
+        self.quotes = quotes
+        self.strikes = strikes
+        self.call_index = call_index
+        self.put_index = put_index
+        self.call_symbols = np.array([quotes[i].instrument_id for i in call_index], dtype=object)
+        self.put_symbols = np.array([quotes[i].instrument_id for i in put_index], dtype=object)
+
+    @classmethod
+    def from_quotes(cls, future_id: str, quotes: list) -> "OptionChain":
+        """
+            由期权合约信息构造期权链
+
+            Args:
+
+                future_id (str): 标的期货合约代码
+
+                quotes (list): 同一到期日的期权合约信息
+
+        """
+        calls = dict()
+        puts = dict()
+        for i, quote in enumerate(quotes):
+            if quote.option_class == "CALL":
+                calls[quote.strike_price] = i
+            elif quote.option_class == "PUT":
+                puts[quote.strike_price] = i
+        strikes = sorted(calls.keys() & puts.keys())
+        return cls(future_id, quotes,
+                   np.array(strikes, dtype=np.float64),
+                   np.array([calls[k] for k in strikes], dtype=np.int64),
+                   np.array([puts[k] for k in strikes], dtype=np.int64))
+
+    def __len__(self):
+        return len(self.strikes)
+
+    @property
+    def key(self) -> tuple:
+        """
+            期权链的标识：(标的期货合约代码, 认购合约代码, 认沽合约代码)，合约相同的期权链key相同，可作为缓存的key
+        """
+        key = self.__dict__.get("_key", None)
+        if key is None:
+            key = self._key = (self.future_id, tuple(self.call_symbols.tolist()), tuple(self.put_symbols.tolist()))
+        return key
+
+    def slice(self, min_strike: float = None, max_strike: float = None) -> "OptionChain":
+        """
+            按行权价范围二分截取，返回共享底层数组的期权链
+
+            Args:
+
+                min_strike (float): 最小行权价
+
+                max_strike (float): 最大行权价
+
+        """
+        lo = 0 if min_strike is None else int(np.searchsorted(self.strikes, min_strike, side="left"))
+        hi = len(self.strikes) if max_strike is None else int(np.searchsorted(self.strikes, max_strike, side="right"))
+        return self._subset(slice(lo, hi))
+
+    def take(self, index: np.ndarray) -> "OptionChain":
+        """
+            按位置取部分行权价，如只重算行情有变化的行权价
+
+            Args:
+
+                index (np.ndarray): 升序位置下标
+
+        """
+        return self._subset(index)
+
+    def _subset(self, index) -> "OptionChain":
+        chain = OptionChain.__new__(OptionChain)
+        chain.future_id = self.future_id
+        chain.quotes = self.quotes
+        chain.strikes = self.strikes[index]
+        chain.call_index = self.call_index[index]
+        chain.put_index = self.put_index[index]
+        chain.call_symbols = self.call_symbols[index]
+        chain.put_symbols = self.put_symbols[index]
+        return chain
+
+    def call_quotes(self) -> list:
+        """
+            认购期权合约信息，与strikes对齐
+        """
+        return [self.quotes[i] for i in self.call_index]
+
+    def put_quotes(self) -> list:
+        """
+            认沽期权合约信息，与strikes对齐
+        """
+        return [self.quotes[i] for i in self.put_index]
+
+    def price_arrays(self) -> dict:
+        """
+            读取认购、认沽的买一价、卖一价、最新价
+
+            Return:
+
+                {call_bid, call_ask, call_last, put_bid, put_ask, put_last}，均为与strikes对齐的np.ndarray
+
+        """
+        calls = self.call_quotes()
+        puts = self.put_quotes()
+        return {
+            'call_bid': np.array([q.bid_price1 for q in calls], dtype=np.float64),
+            'call_ask': np.array([q.ask_price1 for q in calls], dtype=np.float64),
+            'call_last': np.array([q.last_price for q in calls], dtype=np.float64),
+            'put_bid': np.array([q.bid_price1 for q in puts], dtype=np.float64),
+            'put_ask': np.array([q.ask_price1 for q in puts], dtype=np.float64),
+            'put_last': np.array([q.last_price for q in puts], dtype=np.float64),
+        }
+
+    def to_dict(self) -> dict:
+        """
+            兼容TqOption.get_future_opt_symbols的旧格式
+
+            Return:
+
+                {行权价:{K:行权价,c:认购合约代码,p:认沽合约代码}}
+
+        """
+        return {
+            strike_price: {'K': strike_price, 'c': call, 'p': put}
+            for strike_price, call, put in zip(self.strikes.tolist(), self.call_symbols, self.put_symbols)
+        }
@@ -0,0 +1,192 @@
+"""
+    行情分发：一个task持有合约→行权价组的反向索引，每次更新只批量重算受影响的行权价组
+"""
+import time
+
+import numpy as np
+from tqsdk import TqApi
+from tqsdk.lib import TargetPosTask
+from tqsdk.objs import Quote
+
+from chain import OptionChain
+
+
+class _StrikeBook:
+    """
+        一个OptionTrade登记到dispatcher上的全部行权价组
+    """
+
+    def __init__(self, trade, future_quote: Quote, future_target_pos: TargetPosTask):
+        self.trade = trade
+        self.future_quote = future_quote
+        self.future_target_pos = future_target_pos
+        self.legs = []  # [认购Quote, 认沽Quote, ...]
+        self.targets = dict()  # {行权价: (认购TargetPosTask, 认沽TargetPosTask)}
+        self._chain = None
+        self._positions = None  # {行权价: 期权链上的位置}
+
+    def strikes(self) -> list:
+        return list(self.targets.keys())
+
+    def add(self, strike_price: float, call_quote: Quote, put_quote: Quote, call_target_pos: TargetPosTask, put_target_pos: TargetPosTask):
+        self.legs += [call_quote, put_quote]
+        self.targets[strike_price] = (call_target_pos, put_target_pos)
+        self._chain = None
+
+    def chain(self) -> OptionChain:
+        if self._chain is None:
+            self._chain = OptionChain.from_quotes(self.future_quote.instrument_id, self.legs)
+            self._positions = {k: i for i, k in enumerate(self._chain.strikes.tolist())}
+        return self._chain
+
+    def evaluate(self, strikes: set):
+        """
+            批量计算strikes的折溢价，有开仓信号且可交易时下单
+        """
+        chain = self.chain()
+        index = None if len(strikes) == len(chain) else np.array(sorted(self._positions[k] for k in strikes), dtype=np.int64)
+        directions = self.trade.on_quotes(self.future_quote, chain, index)
+        if self.trade.can_trade:
+            strike_prices = chain.strikes if index is None else chain.strikes[index]
+            for i in np.flatnonzero(directions):
+                strike_price = float(strike_prices[i])
+                call_target_pos, put_target_pos = self.targets[strike_price]
+                self.trade.trade_group(strike_price, int(directions[i]), self.future_target_pos, call_target_pos, put_target_pos)
+
+
+class EvalScheduler:
+    """
+        折溢价计算调度：一个更新周期内只登记脏的行权价组，周期结束时flush()，每组只计算一次
+
+        登记的对象需实现strikes()和evaluate(行权价set)，如dispatcher的行权价组、OptionTrade。
+        min_interval>0时同一行权价组两次计算至少间隔min_interval秒，未到间隔的组保持为脏，留到之后的flush()再算。
+        hooks中的无参函数在每次flush()计算完后依次调用，如ExposureLedger.flush合并本周期的期货对冲。
+    """
+
+    def __init__(self, min_interval: float = 0, clock=time.monotonic):
+        """
+
+            Args:
+
+                min_interval (float): 同一行权价组的最小重算间隔（秒）
+
+                clock: 计时函数
+
+        """
+        self.min_interval = min_interval
+        self._clock = clock
+        self._dirty = dict()  # {登记对象: 行权价set}
+        self._last_eval = dict()  # {(登记对象, 行权价): 上次计算时间}
+        self.hooks = []
+
+    def mark(self, owner, strike_price: float = None):
+        """
+            登记脏的行权价组，strike_price为None表示owner下全部行权价（如期货行情变化）
+        """
+        strikes = self._dirty.setdefault(owner, set())
+        if strike_price is None:
+            strikes.update(owner.strikes())
+        else:
+            strikes.add(strike_price)
+
+    def flush(self) -> int:
+        """
+            计算全部脏的行权价组
+
+            Return:
+
+                (int) 本次计算的行权价组数
+
+        """
+        dirty = self._dirty
+        self._dirty = dict()
+        count = 0
+        now = self._clock()
+        for owner, strikes in dirty.items():
+            if self.min_interval > 0:
+                due = {k for k in strikes if now - self._last_eval.get((owner, k), -np.inf) >= self.min_interval}
+                if len(due) < len(strikes):
+                    self._dirty[owner] = strikes - due
+                strikes = due
+                for k in strikes:
+                    self._last_eval[(owner, k)] = now
+            if strikes:
+                owner.evaluate(strikes)
+                count += len(strikes)
+        for hook in self.hooks:
+            hook()
+        return count
+
+    def pending(self) -> int:
+        """
+            尚未计算的脏行权价组数
+        """
+        return sum(len(strikes) for strikes in self._dirty.values())
+
+
+class ParityDispatcher:
+    """
+        put-call parity行情分发器
+
+        取代每个行权价一个quote_watcher的做法：整个dispatcher只起一个task、只注册一次行情通知，
+        每个合约每次更新只调用一次is_changing；期货变化时重算该期货下的全部行权价，期权变化时只重算所在行权价组，
+        同一OptionTrade受影响的行权价合成一批调用OptionTrade.on_quotes。
+        可以每个OptionTrade一个，也可以整个进程共用一个。
+        task在每次wait_update的全部行情更新之后才运行，脏的行权价组经EvalScheduler合并，每个周期每组只算一次。
+    """
+
+    def __init__(self, api: TqApi, min_interval: float = 0):
+        """
+
+            Args:
+
+                api (TqApi): 天勤Api
+
+                min_interval (float): 同一行权价组的最小重算间隔（秒），0为每次更新都算
+
+        """
+        self.api = api
+        self.scheduler = EvalScheduler(min_interval)
+        self._books = dict()  # {OptionTrade: _StrikeBook}
+        self._quotes = dict()  # {合约代码: Quote}
+        self._by_symbol = dict()  # {合约代码: [(_StrikeBook, 行权价)]}，行权价为None表示期货
+        self._task = None
+
+    def add(self, trade, strike_price: float, future_quote: Quote, call_quote: Quote, put_quote: Quote, future_target_pos: TargetPosTask, call_target_pos: TargetPosTask, put_target_pos: TargetPosTask):
+        """
+            登记一个行权价组，参数同OptionTrade.quote_watcher
+        """
+        book = self._books.get(trade, None)
+        if book is None:
+            book = _StrikeBook(trade, future_quote, future_target_pos)
+            self._books[trade] = book
+            self._index(future_quote, book, None)
+        book.add(strike_price, call_quote, put_quote, call_target_pos, put_target_pos)
+        self._index(call_quote, book, strike_price)
+        self._index(put_quote, book, strike_price)
+        if self._task is None:
+            self._task = self.api.create_task(self._run())
+
+    def _index(self, quote: Quote, book: _StrikeBook, strike_price: float):
+        self._quotes[quote.instrument_id] = quote
+        self._by_symbol.setdefault(quote.instrument_id, []).append((book, strike_price))
+
+    async def _run(self):
+        while True:
+            registered = len(self._quotes)
+            async with self.api.register_update_notify(list(self._quotes.values())) as update_chan:
+                async for _ in update_chan:
+                    self.dispatch()
+                    # 有新登记的合约时重新注册行情通知
+                    if len(self._quotes) != registered:
+                        break
+
+    def dispatch(self):
+        """
+            找出本次更新中行情时间变化的合约，批量重算受影响的行权价组
+        """
+        for symbol, quote in self._quotes.items():
+            if self.api.is_changing(quote, "datetime"):
+                for book, strike_price in self._by_symbol[symbol]:
+                    self.scheduler.mark(book, strike_price)
+        self.scheduler.flush()
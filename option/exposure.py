@@ -0,0 +1,85 @@
+"""
+敞口账本：按标的增量维护期权、期货的净头寸，同一更新周期内各行权价的对冲调整合并为一次期货下单
+"""
+from tqsdk.lib import TargetPosTask
+
+
+class ExposureLedger:
+    """
+        敞口账本
+
+        set_position()只更新对应行权价的头寸和该标的的累计值（O(1)），并把标的记为待对冲；
+        flush()对每个待对冲的标的计算一次期货目标持仓，和上次下单的目标不同时才调用set_target_volume。
+        可以多个OptionTrade共用一个账本。
+    """
+
+    def __init__(self):
+        self._calls = dict()  # {标的: {行权价: 认购头寸}}
+        self._puts = dict()  # {标的: {行权价: 认沽头寸}}
+        self._call_sums = dict()  # {标的: 认购头寸合计}
+        self._put_sums = dict()  # {标的: 认沽头寸合计}
+        self._hedges = dict()  # {标的: (期货TargetPosTask, 期权/期货套利乘数)}
+        self._sent = dict()  # {标的: 上次下单的期货目标持仓}
+        self._dirty = set()
+        self.orders = 0  # 期货下单次数
+
+    def bind(self, underlying: str, future_target_pos: TargetPosTask, option_multiplier: int = 1):
+        """
+            设置标的的对冲期货TargetPosTask，已设置则忽略
+        """
+        if underlying not in self._hedges:
+            self._hedges[underlying] = (future_target_pos, option_multiplier)
+
+    def set_position(self, underlying: str, strike_price: float, call_vol: int = None, put_vol: int = None, hedge: bool = True):
+        """
+            更新某行权价的期权头寸，None为不变；hedge为False时不记为待对冲（如登记已有持仓）
+        """
+        if call_vol is not None:
+            self._update(self._calls, self._call_sums, underlying, strike_price, call_vol)
+        if put_vol is not None:
+            self._update(self._puts, self._put_sums, underlying, strike_price, put_vol)
+            if hedge:
+                self._dirty.add(underlying)
+
+    @staticmethod
+    def _update(vols: dict, sums: dict, underlying: str, strike_price: float, vol: int):
+        strikes = vols.setdefault(underlying, dict())
+        sums[underlying] = sums.get(underlying, 0) + vol - strikes.get(strike_price, 0)
+        strikes[strike_price] = vol
+
+    def option_exposure(self, underlying: str) -> (int, int):
+        """
+            (认购头寸合计, 认沽头寸合计)
+        """
+        return self._call_sums.get(underlying, 0), self._put_sums.get(underlying, 0)
+
+    def future_target(self, underlying: str) -> int:
+        """
+            期货目标持仓：认沽头寸合计 / 套利乘数，long call组合（short put）对应空期货
+        """
+        _, multiplier = self._hedges.get(underlying, (None, 1))
+        return int(self._put_sums.get(underlying, 0) / multiplier)
+
+    def flush(self, underlying: str = None) -> int:
+        """
+            对待对冲的标的下单，underlying为None时处理全部标的
+
+            Return:
+
+                int: 下单次数
+
+        """
+        underlyings = list(self._dirty) if underlying is None else [underlying] if underlying in self._dirty else []
+        count = 0
+        for u in underlyings:
+            hedge = self._hedges.get(u, None)
+            if hedge is None:
+                continue
+            self._dirty.discard(u)
+            target = self.future_target(u)
+            if self._sent.get(u, None) != target:
+                hedge[0].set_target_volume(target)
+                self._sent[u] = target
+                count += 1
+        self.orders += count
+        return count
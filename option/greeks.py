@@ -0,0 +1,210 @@
+"""
+Black-76隐含波动率和希腊字母：对整条期权链做向量运算，只重算价格有变化的期权
+"""
+import numpy as np
+from scipy.special import ndtr
+
+_SQRT_2PI = np.sqrt(2 * np.pi)
+
+
+def _pdf(x: np.ndarray) -> np.ndarray:
+    return np.exp(-0.5 * x * x) / _SQRT_2PI
+
+
+#求隐含波动率初值用的波动率网格
+_VOL_GRID = np.array([0.01, 0.03, 0.06, 0.1, 0.15, 0.2, 0.3, 0.45, 0.7, 1.0, 1.5, 2.5])
+
+
+def _otm_price(F, K, log_fk, total_sd, sign, d1=None):
+    """
+        不贴现的虚值期权价格，sign为1时是认购（K > F），-1时是认沽
+    """
+    if d1 is None:
+        d1 = log_fk / total_sd + 0.5 * total_sd
+    return sign * (F * ndtr(sign * d1) - K * ndtr(sign * (d1 - total_sd)))
+
+
+def _d1(F, K, T, sigma):
+    sqrt_t = np.sqrt(T)
+    return (np.log(F / K) + 0.5 * sigma * sigma * T) / (sigma * sqrt_t)
+
+
+def black76_price(F, K, T, r, sigma, is_call) -> np.ndarray:
+    """
+        Black-76期权价格，参数均可为数组
+
+        Args:
+
+            F: 期货价格
+
+            K: 行权价
+
+            T: 剩余期限（年）
+
+            r: 无风险利率
+
+            sigma: 波动率
+
+            is_call: 是否认购
+
+    """
+    d1 = _d1(F, K, T, sigma)
+    d2 = d1 - sigma * np.sqrt(T)
+    call = F * ndtr(d1) - K * ndtr(d2)
+    return np.exp(-r * T) * np.where(is_call, call, call - F + K)
+
+
+def implied_vol(price, F, K, T, r, is_call, tol: float = 1e-8, max_iter: int = 50, lower: float = 1e-4, upper: float = 5.0) -> np.ndarray:
+    """
+        Black-76隐含波动率：在波动率网格上插值作初值，对虚值期权价格的对数做Newton迭代，步长越出所在区间时改为二分
+
+        Args:
+
+            price: 期权价格
+
+            F, K, T, r, is_call: 同black76_price
+
+            tol (float): 收敛条件：时间价值的相对误差 < tol
+
+            max_iter (int): 最大迭代次数
+
+            lower, upper (float): 波动率的搜索区间
+
+        Return:
+
+            np.ndarray: 隐含波动率，价格不满足无套利边界（不高于内在价值或不低于上限）或未收敛时为nan
+
+    """
+    price, F, K, T, r, is_call = np.broadcast_arrays(*[np.asarray(x, dtype=np.float64) if i < 5 else np.asarray(x, dtype=bool)
+                                                      for i, x in enumerate((price, F, K, T, r, is_call))])
+    shape = price.shape
+    price, F, K, T, r, is_call = [x.ravel() for x in (price, F, K, T, r, is_call)]
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        # 不贴现的虚值期权价格（时间价值）：实值期权用平价关系换成同行权价的虚值期权，深度实值时也不损失精度
+        otm_call = K > F
+        target = price * np.exp(r * T) - np.where(is_call, np.maximum(F - K, 0), np.maximum(K - F, 0))
+        valid = (target > 0) & (target < np.minimum(F, K)) & (T > 0) & (K > 0)
+        sqrt_t = np.sqrt(T)
+        log_fk = np.log(F / K)
+        sign = np.where(otm_call, 1.0, -1.0)
+        log_target = np.log(target)
+        # 初值：在一组波动率上一次算出全部期权的价格，由所在区间线性插值，同时得到二分的上下界
+        grid = _VOL_GRID[(_VOL_GRID > lower) & (_VOL_GRID < upper)]
+        grid = np.concatenate([[lower], grid, [upper]])
+        log_grid = np.log(_otm_price(F[:, None], K[:, None], log_fk[:, None], sqrt_t[:, None] * grid, sign[:, None]))
+        j = np.clip((log_grid < log_target[:, None]).sum(axis=1) - 1, 0, len(grid) - 2)
+        rows = np.arange(len(j))
+        lo = grid[j]
+        hi = grid[j + 1]
+        lo_price, hi_price = log_grid[rows, j], log_grid[rows, j + 1]
+        guess = lo + (log_target - lo_price) * (hi - lo) / (hi_price - lo_price)
+        sigma = np.where(valid, np.where(np.isfinite(guess), np.clip(guess, lo, hi), (lo + hi) / 2), np.nan)
+        pending = valid
+        # 对log(价格)做Newton迭代，虚值期权价格很小时也收敛得快；整条链一起迭代，已收敛的位置保持不变
+        for _ in range(max_iter):
+            total_sd = sigma * sqrt_t
+            d1 = log_fk / total_sd + 0.5 * total_sd
+            model = _otm_price(F, K, log_fk, total_sd, sign, d1)
+            diff = np.log(model) - log_target
+            pending = np.abs(diff) >= tol  # nan（无效价格）不参与迭代
+            if not pending.any():
+                break
+            lo = np.where(diff < 0, sigma, lo)
+            hi = np.where(diff > 0, sigma, hi)
+            step = sigma - diff * model / (F * _pdf(d1) * sqrt_t)
+            step = np.where((step > lo) & (step < hi), step, (lo + hi) / 2)
+            sigma = np.where(pending, step, sigma)
+        else:
+            sigma = np.where(pending, np.nan, sigma)  # 未收敛
+    return sigma.reshape(shape)
+
+
+def black76_greeks(F, K, T, r, sigma, is_call) -> dict:
+    """
+        Black-76希腊字母
+
+        Return:
+
+            dict: delta, gamma, vega（波动率变化1.0的价格变化）, theta（每年）
+
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sqrt_t = np.sqrt(T)
+        d1 = _d1(F, K, T, sigma)
+        d2 = d1 - sigma * sqrt_t
+        df = np.exp(-r * T)
+        pdf = _pdf(d1)
+        nd1 = ndtr(d1)
+        price = df * np.where(is_call, F * nd1 - K * ndtr(d2), K * ndtr(-d2) - F * (1 - nd1))
+        return {
+            'delta': df * np.where(is_call, nd1, nd1 - 1),
+            'gamma': df * pdf / (F * sigma * sqrt_t),
+            'vega': df * F * pdf * sqrt_t,
+            'theta': -df * F * pdf * sigma / (2 * sqrt_t) + r * price,
+        }
+
+
+class GreeksEngine:
+    """
+        一条期权链的隐含波动率和希腊字母
+
+        update()与上次的期权价格逐个比较，期货价格、剩余期限、利率不变时只重算价格变化了的期权；都不变时直接返回上次的结果。
+    """
+
+    FIELDS = ['iv', 'delta', 'gamma', 'vega', 'theta']
+
+    def __init__(self, strikes: np.ndarray):
+        """
+
+            Args:
+
+                strikes (np.ndarray): 期权链的行权价
+
+        """
+        n = len(strikes)
+        self.n = n
+        self._K = np.concatenate([strikes, strikes]).astype(np.float64)  # 前n个认购，后n个认沽
+        self._is_call = np.arange(2 * n) < n
+        self._key = None  # (期货价格, 剩余期限, 利率)
+        self._prices = np.full(2 * n, np.nan)
+        self._values = {name: np.full(2 * n, np.nan) for name in self.FIELDS}
+        self._result = None
+        self.recomputed = 0  # 上次update重算的期权数
+
+    def update(self, F: float, T: float, r: float, call_prices: np.ndarray, put_prices: np.ndarray) -> dict:
+        """
+            Return:
+
+                dict: call_iv, put_iv, call_delta, put_delta, ...，与行权价逐位对齐
+
+        """
+        prices = np.concatenate([call_prices, put_prices])
+        key = (F, T, r)
+        if key == self._key:
+            changed = ~((prices == self._prices) | (np.isnan(prices) & np.isnan(self._prices)))
+            if not changed.any():
+                self.recomputed = 0
+                return self._result
+            index = np.flatnonzero(changed)
+        else:
+            index = None
+        self._key = key
+        self._prices = prices
+        K = self._K if index is None else self._K[index]
+        is_call = self._is_call if index is None else self._is_call[index]
+        p = prices if index is None else prices[index]
+        iv = implied_vol(p, F, K, T, r, is_call)
+        values = black76_greeks(F, K, T, r, iv, is_call)
+        values['iv'] = iv
+        for name in self.FIELDS:
+            if index is None:
+                self._values[name] = values[name]
+            else:
+                # 复制后再改写，之前返回的结果不受影响
+                self._values[name] = self._values[name].copy()
+                self._values[name][index] = values[name]
+        self.recomputed = len(p)
+        n = self.n
+        self._result = {prefix + name: self._values[name][sl] for name in self.FIELDS
+                        for prefix, sl in (("call_", slice(0, n)), ("put_", slice(n, None)))}
+        return self._result
@@ -0,0 +1,203 @@
+"""
+    热路径延迟统计：低开销的对数分桶直方图，按指标、标的、行权价分别统计
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+#交易所行情时间为北京时间
+_CST = timezone(timedelta(hours=8))
+
+#延迟指标
+TICK_TO_SIGNAL = "tick_to_signal"       # 行情时间 -> on_quote给出开仓方向
+SIGNAL_TO_ORDER = "signal_to_order"     # 给出开仓方向 -> 调用set_target_volume
+PARITY_COMPUTE = "parity_compute"       # get_parity_residual(s)计算耗时
+
+
+#{行情时间字符串: 纳秒时间戳}，同一次推送里各合约的行情时间大多相同，只解析一次
+_tick_ns = dict()
+_TICK_NS_CACHE_SIZE = 4096
+
+
+def tick_time_ns(dt: str) -> int:
+    """
+        行情时间（北京时间字符串，如"2017-07-26 23:04:21.000001"）转为纳秒时间戳，解析结果按字符串缓存
+    """
+    ns = _tick_ns.get(dt, None)
+    if ns is None:
+        if len(_tick_ns) >= _TICK_NS_CACHE_SIZE:
+            _tick_ns.clear()
+        ns = _tick_ns[dt] = int(datetime.strptime(dt, "%Y-%m-%d %H:%M:%S.%f").replace(tzinfo=_CST).timestamp() * 1e6) * 1000
+    return ns
+
+
+class LatencyHistogram:
+    """
+        对数分桶直方图：每个2的幂区间再等分为sub_buckets个桶，记录一次为O(1)，分位数的相对误差不超过1/sub_buckets
+    """
+
+    def __init__(self, sub_buckets: int = 8):
+        """
+
+            Args:
+
+                sub_buckets (int): 每个2的幂区间的桶数，须为2的幂
+
+        """
+        self._sub_bits = sub_buckets.bit_length() - 1
+        self._sub_buckets = sub_buckets
+        self.counts = [0] * (64 * sub_buckets)  # list比numpy数组逐个累加更快
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, value: int) -> int:
+        if value < self._sub_buckets:
+            return value
+        exp = value.bit_length() - 1 - self._sub_bits
+        return (exp + 1) * self._sub_buckets + ((value >> exp) - self._sub_buckets)
+
+    def _bucket_value(self, bucket: int) -> int:
+        """
+            桶的上界
+        """
+        if bucket < self._sub_buckets:
+            return bucket
+        exp = bucket // self._sub_buckets - 1
+        return ((bucket % self._sub_buckets + self._sub_buckets + 1) << exp) - 1
+
+    def record(self, value: int):
+        """
+            记录一次延迟（纳秒），负值记为0
+        """
+        value = max(int(value), 0)
+        self.counts[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """
+            分位数（纳秒），q取0~100
+        """
+        if self.count == 0:
+            return np.nan
+        rank = max(int(np.ceil(q / 100 * self.count)), 1)
+        bucket = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return float(min(self._bucket_value(bucket), self.max))
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else np.nan
+
+    def merge(self, other: "LatencyHistogram"):
+        """
+            合并另一个直方图
+        """
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+
+class LatencyStats:
+    """
+        延迟统计：{(指标, 标的, 行权价): LatencyHistogram}
+
+        行权价为None的记录为该标的的汇总（如批量计算的耗时）；summary()可以按指标、标的筛选并汇总。
+    """
+
+    def __init__(self, dump_interval: float = None, sub_buckets: int = 8):
+        """
+
+            Args:
+
+                dump_interval (float): maybe_dump()打印汇总的间隔（秒），None为不打印
+
+                sub_buckets (int): 直方图每个2的幂区间的桶数
+
+        """
+        self.dump_interval = dump_interval
+        self._sub_buckets = sub_buckets
+        self._histograms = dict()
+        self._last_dump = time.monotonic()
+
+    def record(self, metric: str, underlying: str, strike_price: float, value_ns: int):
+        """
+            记录一次延迟（纳秒）
+        """
+        key = (metric, underlying, strike_price)
+        histogram = self._histograms.get(key, None)
+        if histogram is None:
+            histogram = LatencyHistogram(self._sub_buckets)
+            self._histograms[key] = histogram
+        histogram.record(value_ns)
+
+    def histogram(self, metric: str, underlying: str = None, strike_price: float = None) -> LatencyHistogram:
+        """
+            合并符合条件的直方图，underlying/strike_price为None时不按其筛选
+        """
+        merged = LatencyHistogram(self._sub_buckets)
+        for (m, u, k), histogram in self._histograms.items():
+            if m == metric and (underlying is None or u == underlying) and (strike_price is None or k == strike_price):
+                merged.merge(histogram)
+        return merged
+
+    def summary(self, metric: str = None, underlying: str = None, by_strike: bool = False) -> pd.DataFrame:
+        """
+            延迟汇总（微秒）
+
+            Args:
+
+                metric (str): 只看该指标，None为全部
+
+                underlying (str): 只看该标的，None为全部
+
+                by_strike (bool): 是否按行权价分行，否则按标的汇总
+
+            Return:
+
+                pd.DataFrame: metric, underlying, strike, count, mean_us, p50_us, p90_us, p99_us, max_us
+
+        """
+        groups = dict()
+        for (m, u, k), histogram in self._histograms.items():
+            if (metric is None or m == metric) and (underlying is None or u == underlying):
+                key = (m, u, k if by_strike else None)
+                groups.setdefault(key, LatencyHistogram(self._sub_buckets)).merge(histogram)
+        rows = [{
+            'metric': m,
+            'underlying': u,
+            'strike': k,
+            'count': h.count,
+            'mean_us': h.mean() / 1e3,
+            'p50_us': h.percentile(50) / 1e3,
+            'p90_us': h.percentile(90) / 1e3,
+            'p99_us': h.percentile(99) / 1e3,
+            'max_us': h.max / 1e3,
+        } for (m, u, k), h in sorted(groups.items(), key=lambda item: tuple(str(x) for x in item[0]))]
+        return pd.DataFrame(rows, columns=['metric', 'underlying', 'strike', 'count', 'mean_us', 'p50_us', 'p90_us', 'p99_us', 'max_us'])
+
+    def maybe_dump(self) -> bool:
+        """
+            距上次打印超过dump_interval时打印按标的汇总的延迟，在主线程wait_update之后调用
+        """
+        if self.dump_interval is None or time.monotonic() - self._last_dump < self.dump_interval:
+            return False
+        self._last_dump = time.monotonic()
+        print("latency ts:{}\n{}".format(datetime.now(), self.summary().to_string(index=False)))
+        return True
+
+    def reset(self):
+        """
+            清空统计
+        """
+        self._histograms = dict()
@@ -0,0 +1,185 @@
+"""
+    保证金计算：按合约与交易日缓存，整条期权链一次向量计算
+"""
+import numpy as np
+from tqsdk import TqApi
+from tqsdk.objs import Quote
+
+from chain import OptionChain
+from tradingday import tick_trading_day
+
+
+def io_margin_rates(is_call: np.ndarray, strike_price: np.ndarray, pre_settle: np.ndarray, pre_close: np.ndarray, multiplier: np.ndarray, margin_adj_factor: float = 0.1, min_risk_factor: float = 0.5) -> np.ndarray:
+    """
+        TqOption._cal_io_margin_rate的向量版本
+
+        Args:
+
+            is_call (np.ndarray): 是否认购
+
+            其余参数同TqOption._cal_io_margin_rate
+
+    """
+    in_money_rate = np.where(is_call, np.maximum(strike_price - pre_close, 0), np.maximum(pre_close - strike_price, 0))
+    min_risk = min_risk_factor * np.where(is_call, pre_close, strike_price) * margin_adj_factor
+    return multiplier * (pre_settle + np.maximum(pre_close * margin_adj_factor - in_money_rate, min_risk))
+
+
+def future_opt_margin_rates(is_call: np.ndarray, strike_price: np.ndarray, pre_settle: np.ndarray, multiplier: np.ndarray, future_margin: float) -> np.ndarray:
+    """
+        TqOption._cal_future_opt_margin_rate的向量版本，前结算价为0或nan的位置返回nan
+
+        Args:
+
+            is_call (np.ndarray): 是否认购
+
+            其余参数同TqOption._cal_future_opt_margin_rate
+
+    """
+    in_money_val = np.where(is_call, np.maximum(strike_price - pre_settle, 0), np.maximum(pre_settle - strike_price, 0)) * multiplier
+    margin = pre_settle * multiplier + np.maximum(future_margin - 0.5 * in_money_val, future_margin * 0.5)
+    return np.where((pre_settle == 0) | np.isnan(pre_settle), np.nan, margin)
+
+
+class MarginEngine:
+    """
+        保证金引擎
+
+        单个合约的缓存以(交易日, 前结算价, 标的期货保证金)为key，任一变化即重新计算；
+        期权链的保证金数组以(交易日, 标的期货保证金, 各期权前结算价)为key整体缓存，热路径上只比较key、读数组。
+    """
+
+    def __init__(self, api: TqApi):
+        """
+
+            Args:
+
+                api (TqApi): 天勤Api
+
+        """
+        self._api = api
+        self.margin_rates = dict()  # {合约代码: 每手保证金}
+        self._margin_keys = dict()  # {合约代码: 缓存key}
+        self._chain_margins = dict()  # {OptionChain.key: (缓存key, 认购保证金数组, 认沽保证金数组)}
+        self._epoch = 0  # 保证金版本，任一期货的交易日或保证金变化时加一
+        self._future_epochs = dict()  # {期货合约代码: (交易日, 期货保证金, 保证金版本)}
+        self._future_ticks = dict()  # {期货合约代码: (行情时间, 期货每手保证金, 保证金版本)}
+        self._option_rates = dict()  # {期权合约代码: (保证金版本, 前结算价, 每手保证金)}
+
+    def _quote_margin(self, instrument_id: str) -> float:
+        """
+            行情推送的保证金，没有返回None
+        """
+        quote = self._api._data["quotes"].get(instrument_id, None)
+        return quote.get("margin", None) if quote is not None else None
+
+    def get(self, quote: Quote) -> float:
+        """
+            计算合约的保证金率，同TqOption.get_margin_rate
+
+            Return:
+                (float) 保证金率
+
+        """
+        instrument_id = quote.instrument_id
+        future_margin = self._quote_margin(quote.underlying_symbol) if quote.ins_class == "FUTURE_OPTION" else None
+        key = (tick_trading_day(quote.datetime), quote.pre_settlement, future_margin)
+        margin_rate = self.margin_rates.get(instrument_id, None)
+        if margin_rate is not None and margin_rate > 0 and self._margin_keys[instrument_id] == key:
+            return margin_rate
+        margin_from_dict = self._quote_margin(instrument_id)
+        if margin_from_dict is not None and margin_from_dict > 0:
+            margin_rate = margin_from_dict
+        elif quote.product_id == "IO_o":
+            margin_rate = float(io_margin_rates(quote.option_class == "CALL", quote.strike_price, quote.pre_settlement, quote.pre_close, quote.volume_multiple))
+        elif quote.ins_class == "FUTURE_OPTION":
+            margin_rate = float(future_opt_margin_rates(quote.option_class == "CALL", quote.strike_price, quote.pre_settlement, quote.volume_multiple, future_margin))
+        else:
+            return None
+        self.margin_rates[instrument_id] = margin_rate
+        self._margin_keys[instrument_id] = key
+        return margin_rate
+
+    def tick(self, future_quote: Quote) -> (float, int):
+        """
+            期货tick的保证金：同一期货行情时间只算一次交易日和期货保证金，供on_quote逐个行权价调用
+
+            Return:
+
+                (期货每手保证金, 保证金版本)，交易日或标的期货保证金变化时版本改变，交给option_rate判断期权缓存是否有效
+
+        """
+        future_id = future_quote.instrument_id
+        dt = future_quote.datetime
+        cached = self._future_ticks.get(future_id, None)
+        if cached is not None and cached[0] == dt:
+            return cached[1], cached[2]
+        trading_day = tick_trading_day(dt)
+        future_margin = self._quote_margin(future_id)
+        epoch = self._future_epochs.get(future_id, None)
+        if epoch is None or epoch[0] != trading_day or epoch[1] != future_margin:
+            self._epoch += 1
+            epoch = self._future_epochs[future_id] = (trading_day, future_margin, self._epoch)
+        margin_rate = self.get(future_quote)
+        self._future_ticks[future_id] = (dt, margin_rate, epoch[2])
+        return margin_rate, epoch[2]
+
+    def option_rate(self, quote: Quote, epoch: int) -> float:
+        """
+            期权每手保证金，epoch为tick()返回的保证金版本；版本和前结算价都不变时只查一次dict，不构造key
+
+            Return:
+                (float) 保证金率
+
+        """
+        cached = self._option_rates.get(quote.instrument_id, None)
+        if cached is not None and cached[0] == epoch and cached[1] == quote.pre_settlement:
+            return cached[2]
+        margin_rate = self.get(quote)
+        self._option_rates[quote.instrument_id] = (epoch, quote.pre_settlement, margin_rate)
+        return margin_rate
+
+    def chain_margins(self, chain: OptionChain, future_quote: Quote) -> (np.ndarray, np.ndarray):
+        """
+            期权链上认购、认沽的每手保证金
+
+            Args:
+
+                chain (OptionChain): 期权链
+
+                future_quote (Quote): 标的期货行情
+
+            Return:
+
+                (认购保证金数组, 认沽保证金数组)
+
+        """
+        calls, puts = chain.call_quotes(), chain.put_quotes()
+        # 换日后期权前结算价可能晚于期货行情到达，前结算价也在key中，到达后重新计算
+        pre_settle = tuple([q.pre_settlement for q in calls] + [q.pre_settlement for q in puts])
+        key = (tick_trading_day(future_quote.datetime), self._quote_margin(future_quote.instrument_id), pre_settle)
+        cached = self._chain_margins.get(chain.key, None)
+        if cached is not None and cached[0] == key:
+            return cached[1], cached[2]
+        call_margin = self._compute(calls, key[1])
+        put_margin = self._compute(puts, key[1])
+        # 前结算价未到齐时不缓存，下次再算
+        if not (np.isnan(call_margin).any() or np.isnan(put_margin).any()):
+            self._chain_margins[chain.key] = (key, call_margin, put_margin)
+        return call_margin, put_margin
+
+    def _compute(self, quotes: list, future_margin: float) -> np.ndarray:
+        """
+            一组期权的保证金数组，行情推送了保证金的合约以推送值为准
+        """
+        is_call = np.array([q.option_class == "CALL" for q in quotes], dtype=bool)
+        strike_price = np.array([q.strike_price for q in quotes], dtype=np.float64)
+        pre_settle = np.array([q.pre_settlement for q in quotes], dtype=np.float64)
+        multiplier = np.array([q.volume_multiple for q in quotes], dtype=np.float64)
+        if quotes and quotes[0].product_id == "IO_o":
+            pre_close = np.array([q.pre_close for q in quotes], dtype=np.float64)
+            margins = io_margin_rates(is_call, strike_price, pre_settle, pre_close, multiplier)
+        else:
+            margins = future_opt_margin_rates(is_call, strike_price, pre_settle, multiplier, np.nan if future_margin is None else future_margin)
+        pushed = np.array([self._quote_margin(q.instrument_id) or np.nan for q in quotes], dtype=np.float64)
+        return np.where(pushed > 0, pushed, margins)
@@ -8,13 +8,28 @@ import numpy as np
 import pandas as pd
 from contextlib import closing
 from typing import Union
+import math
+import time
+from catalog import get_catalog
+from chain import OptionChain
+from margin import MarginEngine
+from recorder import ColumnRecorder
+from record import ParityRecord, RESIDUAL_FIELDS
+from exposure import ExposureLedger
+from scoreboard import Scoreboard, LONG_CALL, LONG_PUT
+from rolling import RollingStats
+from latency import LatencyStats, PARITY_COMPUTE, TICK_TO_SIGNAL, SIGNAL_TO_ORDER, tick_time_ns
+from parity import parity_residuals, implied_risk_free, ImpliedRateCurve
+from greeks import GreeksEngine
+from snapshot import ContractSnapshot, snapshot_path
+from tradingday import trading_day
 
 class TqOption:
     """
         天勤的期权工具类
     """
 
-    def __init__(self, api: TqApi, future_product_id:str = None, option_product_id:str = None, underlying_future_id:str = None):
+    def __init__(self, api: TqApi, future_product_id:str = None, option_product_id:str = None, underlying_future_id:str = None, latency: LatencyStats = None, snapshot_dir: str = None):
         """
 
             Args:
@@ -27,14 +42,27 @@ class TqOption:
 
                 underlying_future_id (str): 期货代码查期权
 
+                latency (LatencyStats): 不为None时记录折溢价计算耗时
+
+                snapshot_dir (str): 合约快照目录，不为None时同一交易日内重启直接读快照，不扫描全部合约
+
         """
         self._api = api
-        self._now = time_to_datetime(api._backtest._current_dt) if api._backtest is not None else datetime.now()
+        self.latency = latency
+        self._catalog_obj = None  # 合约目录，用到时才创建
+        self._expire_dts = dict()  # {合约代码: 到期datetime}，读快照时填入
+        # 与合约到期日一样用本地时间的naive datetime（新版tqsdk的time_to_datetime带时区，不能与之比较）
+        self._now = datetime.fromtimestamp(api._backtest._current_dt / 1e9) if api._backtest is not None else datetime.now()
         self._future_prod_id = future_product_id
         self._option_prod_id = option_product_id
-        self._future_infoes = self._init_future_infoes() if underlying_future_id is None else [self._api.get_quote(underlying_future_id)]
+        infoes = self._load_snapshot(snapshot_dir, underlying_future_id)
+        if infoes is None:
+            self._future_infoes = self._init_future_infoes() if underlying_future_id is None else [self._api.get_quote(underlying_future_id)]
+            self._opt_infoes = self._init_opt_infoes() if underlying_future_id is None else self._get_opt_infoes_by_underlying(underlying_future_id)
+            self._save_snapshot(snapshot_dir, underlying_future_id)
+        else:
+            self._future_infoes, self._opt_infoes = infoes
         self.future_delivery_dates = self._fetch_delivery_dates()
-        self._opt_infoes =  self._init_opt_infoes() if underlying_future_id is None else self._get_opt_infoes_by_underlying(underlying_future_id)
         self.strike_dates = self._fetch_strike_dates()
 
         self.future_opt_matched_dates = list(
@@ -42,7 +70,50 @@ class TqOption:
         self.future_opt_matched_dates.sort()
         self.strike_dates = list(self.strike_dates)
         self.strike_dates.sort()
-        self.margin_rates = dict()  # 期权保证金率dict
+        self._margin_engine = MarginEngine(api)
+        self.margin_rates = self._margin_engine.margin_rates  # 期权保证金率dict
+        self._chains = dict()  # {到期日或(年, 月): OptionChain}
+        self._ttm_cache = dict()  # {期货合约代码: (行情时间, ttm)}
+        self._rate_curve = None  # (行情时间key, ImpliedRateCurve)
+        self._greeks = dict()  # {OptionChain.key: GreeksEngine}
+        self._chain_ttm = dict()  # {OptionChain.key: (期货行情时间, 期权剩余期限)}
+
+    @property
+    def _catalog(self):
+        if self._catalog_obj is None:
+            self._catalog_obj = get_catalog(self._api)
+        return self._catalog_obj
+
+    def _expire_dt(self, quote: Quote) -> datetime:
+        expire_dt = self._expire_dts.get(quote.instrument_id, None)
+        return expire_dt if expire_dt is not None else self._catalog.expire_dt(quote)
+
+    def _snapshot_path(self, snapshot_dir: str, underlying_future_id: str) -> str:
+        key = "{}_{}_{}".format(self._future_prod_id, self._option_prod_id, underlying_future_id)
+        return snapshot_path(snapshot_dir, key, trading_day(self._now))
+
+    def _load_snapshot(self, snapshot_dir: str, underlying_future_id: str) -> (list, list):
+        """
+            读取本交易日的合约快照，并与api的合约核对
+
+            Return:
+
+                (期货合约列表, 期权合约列表)，没有快照或api有新上市合约时返回None
+
+        """
+        if snapshot_dir is None:
+            return None
+        snapshot = ContractSnapshot.load(self._snapshot_path(snapshot_dir, underlying_future_id))
+        infoes = snapshot.resolve(self._api) if snapshot is not None else None
+        if infoes is not None:
+            self._expire_dts = snapshot.expire_dts
+        return infoes
+
+    def _save_snapshot(self, snapshot_dir: str, underlying_future_id: str):
+        if snapshot_dir is None:
+            return
+        snapshot = ContractSnapshot.from_quotes(self._future_infoes, self._opt_infoes, self._catalog.expire_dt, len(self._api._data.get("quotes", {})))
+        snapshot.save(self._snapshot_path(snapshot_dir, underlying_future_id))
 
     def _get_product_infoes(self, product_id: Union[str,list] = None, instrument_id:str = None) -> list:
         """
@@ -50,13 +121,13 @@ class TqOption:
         """
         if isinstance(product_id, str):
             product_id = [product_id]
-        return [quote[1] for quote in self._api._data.get("quotes", {}).items() if not(quote[1].expired) and quote[1].product_id in product_id and datetime.fromtimestamp(quote[1].expire_datetime) > self._now]
+        return self._catalog.get_by_product(product_id, self._now)
 
     def _get_opt_infoes_by_underlying(self, underlying_future_id:str) -> list:
         """
             根据product_id获取标的信息
         """
-        return [quote[1] for quote in self._api._data.get("quotes", {}).items() if quote[1].underlying_symbol == underlying_future_id and quote[1]["ins_class"] == "FUTURE_OPTION"]
+        return self._catalog.get_by_underlying(underlying_future_id)
 
 
     def _init_future_infoes(self) -> list:
@@ -74,7 +145,7 @@ class TqOption:
         """
         筛选出期货交割日set
         """
-        return set([datetime.fromtimestamp(quote.expire_datetime) for quote in self._future_infoes])
+        return set([self._expire_dt(quote) for quote in self._future_infoes])
 
     def _init_opt_infoes(self) -> list:
         """
@@ -96,7 +167,44 @@ class TqOption:
         """
         筛选出未到期期权的行权日
         """
-        return set([datetime.fromtimestamp(quote.expire_datetime) for quote in self._opt_infoes])
+        return set([self._expire_dt(quote) for quote in self._opt_infoes])
+
+    def get_option_chain(self, strike_day: datetime = None, strike_year: int = None, strike_month: int = None, max_strike: float = None, min_strike: float = None) -> OptionChain:
+        """
+        根据到期日取期权链，同一到期日的期权链只构造一次
+
+        Args:
+
+            strike_day (datetime): 到期日
+
+            strike_year (int): 到期年份（如果无法明确到期日）
+
+            strike_month (int): 到期月份（如果无法明确到期日）
+
+            max_strike (float): 最大行权价
+
+            min_strike (float): 最小行权价
+
+        Return:
+
+            OptionChain: 行权价在[min_strike, max_strike]内的期权链
+
+        """
+        key = strike_day if strike_day is not None else (strike_year, strike_month)
+        chain = self._chains.get(key, None)
+        if chain is None:
+            if strike_day is None:  # 用strike_year, strike_month查期权列表
+                temp_opt_infoes = [quote for quote in self._opt_infoes if quote.delivery_year == strike_year and quote.delivery_month == strike_month]
+            else:
+                temp_opt_infoes = [quote for quote in self._opt_infoes if self._expire_dt(quote) == strike_day]
+            first_opt = temp_opt_infoes[0]
+            if first_opt.underlying_symbol == "":
+                temp_future_id = [quote for quote in self._future_infoes if self._expire_dt(quote) == strike_day][0].instrument_id
+            else:
+                temp_future_id = first_opt.underlying_symbol
+            chain = OptionChain.from_quotes(temp_future_id, temp_opt_infoes)
+            self._chains[key] = chain
+        return chain.slice(min_strike, max_strike)
 
     def get_future_opt_symbols(self, strike_day: datetime = None, strike_year: int = None, strike_month: int = None, max_strike: float = None, min_strike: float = None) -> (str, dict):
         """
@@ -119,36 +227,8 @@ class TqOption:
             (期货合约代码, {行权价:{K:行权价,c:认购合约代码,p:认沽合约代码}})
 
         """
-        if strike_day is None:
-            temp_opt_infoes = pd.DataFrame(
-                [quote for quote in self._opt_infoes if quote.delivery_year == strike_year and quote.delivery_month == strike_month])
-        else:  # 用strike_year, strike_month查期权列表
-            temp_opt_infoes = pd.DataFrame([quote for quote in self._opt_infoes if datetime.fromtimestamp(
-                quote.expire_datetime) == strike_day])
-        strike_prices = list(
-            set([quote for quote in temp_opt_infoes['strike_price']]))
-        if min_strike is not None:
-            strike_prices = [p for p in strike_prices if p>= min_strike]
-        if max_strike is not None:
-            strike_prices = [p for p in strike_prices if p<= max_strike]
-        strike_prices.sort()
-        temp_future_id = ""
-        first_opt = temp_opt_infoes.iloc[0]
-        if first_opt["underlying_symbol"] == "":
-            temp_future_id = [quote for quote in self._future_infoes if datetime.fromtimestamp(
-                quote.expire_datetime) == strike_day][0].instrument_id
-        else:
-            temp_future_id = first_opt.underlying_symbol
-        return (temp_future_id,
-                {
-                    strike_price:
-                    {
-                        'K': strike_price,
-                        'c': temp_opt_infoes.loc[(temp_opt_infoes["strike_price"] == strike_price) & (temp_opt_infoes["option_class"] == "CALL")]["instrument_id"].iloc[0],
-                        'p': temp_opt_infoes.loc[(temp_opt_infoes["strike_price"] == strike_price) & (temp_opt_infoes["option_class"] == "PUT")]["instrument_id"].iloc[0]
-                    } for strike_price in strike_prices
-                }
-                )
+        chain = self.get_option_chain(strike_day, strike_year, strike_month, max_strike, min_strike)
+        return (chain.future_id, chain.to_dict())
 
     def get_opt_symbols(self, expire_date: datetime) -> list:
         """
@@ -164,29 +244,7 @@ class TqOption:
                 (float) 保证金率
 
         """
-        instrument_id = quote.instrument_id
-        margin_rate = self.margin_rates.get(instrument_id, None)
-        margin_from_dict = self._api._data["quotes"][instrument_id].get("margin", None)
-        if margin_rate is not None and margin_rate > 0:
-            return margin_rate
-        elif margin_from_dict is not None and margin_from_dict > 0:
-            self.margin_rates[instrument_id] = margin_rate
-            return margin_from_dict
-        elif quote.product_id == "IO_o":
-            margin_rate = self._cal_io_margin_rate(
-                quote.option_class, quote.strike_price, quote.pre_settlement, quote.pre_close, quote.volume_multiple)
-            self.margin_rates[instrument_id] = margin_rate
-            return margin_rate
-        elif quote.ins_class == "FUTURE_OPTION":
-            #future_quote = self._api.get_quote(quote.underlying_symbol)
-            #future_margin = future_quote["margin"]
-            future_margin = self._api._data["quotes"][quote.underlying_symbol].get("margin")
-            margin_rate = self._cal_future_opt_margin_rate(
-                quote.option_class, quote.strike_price, quote.pre_settlement, quote.volume_multiple, future_margin)
-            self.margin_rates[instrument_id] = margin_rate
-            return margin_rate
-        else:
-            return None
+        return self._margin_engine.get(quote)
 
     def _cal_io_margin_rate(self, call_or_put: str, strike_price: float, pre_settle: float, pre_close: float, multiplier: float, margin_adj_factor: float = 0.1, min_risk_factor: float = 0.5) -> float:
         """
@@ -282,6 +340,47 @@ class TqOption:
             future_quote.ask_price1 - strike_price)) / (-ttm) * 365
         return {'last': risk_free_last, 'mid': risk_free_mid, 'long_call': risk_free_long_call, 'short_call': risk_free_short_call}
 
+    def get_implied_risk_free_curve(self, field: str = "mid") -> ImpliedRateCurve:
+        """
+            对future_opt_matched_dates的全部到期日、全部行权价批量计算隐含无风险收益率，并拟合期限结构
+
+            各到期日拼接成一组数组一次求解，ttm按秒计算；期货、期权行情时间都未变化时直接返回上次的结果。
+
+            Args:
+
+                field (str): 拟合所用的价格口径：last/mid/long_call/short_call
+
+            Return:
+
+                ImpliedRateCurve: 隐含利率曲线，points中保留各行权价的四种隐含利率
+
+        """
+        chains = []
+        for strike_day in self.future_opt_matched_dates:
+            future_quote = [quote for quote in self._future_infoes if self._expire_dt(quote) == strike_day][0]
+            chains.append((strike_day, future_quote, self.get_option_chain(strike_day=strike_day)))
+        key = (field,) + tuple(quote.datetime for _, future_quote, chain in chains
+                               for quote in [future_quote] + chain.call_quotes() + chain.put_quotes())
+        if self._rate_curve is not None and self._rate_curve[0] == key:
+            return self._rate_curve[1]
+        sizes = [len(chain) for _, _, chain in chains]
+        ttms = np.array([(time_to_datetime(chain.quotes[0].expire_datetime) - time_to_datetime(future_quote.datetime)).total_seconds() / (365 * 86400)
+                         if future_quote.datetime else np.nan for _, future_quote, chain in chains], dtype=np.float64)
+        prices = [chain.price_arrays() for _, _, chain in chains]
+        rates = implied_risk_free(
+            np.concatenate([np.empty(0)] + [chain.strikes for _, _, chain in chains]),
+            future_bid=np.repeat([future_quote.bid_price1 for _, future_quote, _ in chains], sizes),
+            future_ask=np.repeat([future_quote.ask_price1 for _, future_quote, _ in chains], sizes),
+            future_last=np.repeat([future_quote.last_price for _, future_quote, _ in chains], sizes),
+            ttm=np.repeat(ttms, sizes),
+            **{name: np.concatenate([np.empty(0)] + [p[name] for p in prices]) for name in ['call_bid', 'call_ask', 'call_last', 'put_bid', 'put_ask', 'put_last']})
+        bounds = np.cumsum([0] + sizes)
+        points = [dict({k: v[lo:hi] for k, v in rates.items()}, strike=chain.strikes)
+                  for (_, _, chain), lo, hi in zip(chains, bounds[:-1], bounds[1:])]
+        curve = ImpliedRateCurve([strike_day for strike_day, _, _ in chains], ttms, points, field)
+        self._rate_curve = (key, curve)
+        return curve
+
     def get_parity_residual(self, future_quote:Quote, strike_price: float, call_quote:Quote, put_quote:Quote, risk_free: float = 0.0208) -> dict:
         """
             TODO: 计算折溢价
@@ -294,52 +393,201 @@ class TqOption:
                 premium_put < 0: 买put、卖call、多期货策略：-(call_bid - put_ask - (future_ask - strike) * exp(-ttm * risk_free))
 
         """
+        return self.parity_residual_into(ParityRecord(), future_quote, strike_price, call_quote, put_quote, risk_free).to_dict(RESIDUAL_FIELDS)
+
+    def parity_residual_into(self, record: ParityRecord, future_quote: Quote, strike_price: float, call_quote: Quote, put_quote: Quote,
+                             risk_free: float = 0.0208, save_quotes: bool = False) -> ParityRecord:
+        """
+            同get_parity_residual，结果写入record而不新建dict，供on_quote每个tick复用
+
+            行情字段各读一次；交易日、期货保证金每个期货tick只算一次，期权保证金按版本缓存。
+            剩余期限ttm<=0（到期日当天）时年化收益率为nan。
+
+            Args:
+
+                record (ParityRecord): 写入的记录
+
+                save_quotes (bool): 是否同时写入三条腿的行情字段（save_data时记录）
+
+        """
+        start_ns = time.perf_counter_ns() if self.latency is not None else 0
+        ttm = self._get_ttm(future_quote)
+        future_margin, epoch = self._margin_engine.tick(future_quote)
+        discount = math.exp(-ttm * risk_free)
+        future_dt, future_last, future_bid, future_ask = future_quote.datetime, future_quote.last_price, future_quote.bid_price1, future_quote.ask_price1
+        call_last, call_bid, call_ask = call_quote.last_price, call_quote.bid_price1, call_quote.ask_price1
+        put_last, put_bid, put_ask = put_quote.last_price, put_quote.bid_price1, put_quote.ask_price1
+        record.tq_time = future_dt
+        record.premium_last = call_last - put_last - (future_last - strike_price) * discount
+        record.premium_mid = (call_ask + call_bid) / 2 - (put_ask + put_bid) / 2 - ((future_ask + future_bid) / 2 - strike_price) * discount
+        call_premium = call_ask - put_bid - (future_bid - strike_price) * discount
+        #long call 策略的理论到行权日的年化收益率
+        call_multiple, put_multiple = call_quote.volume_multiple, put_quote.volume_multiple
+        long_call_cost = call_bid * call_multiple + self._margin_engine.option_rate(put_quote, epoch) + future_margin
+        put_premium = -(call_bid - put_ask - (future_ask - strike_price) * discount)
+        long_put_cost = put_bid * put_multiple + self._margin_engine.option_rate(call_quote, epoch) + future_margin
+        record.premium_call = call_premium
+        record.premium_put = put_premium
+        record.long_call_cost = long_call_cost
+        record.long_put_cost = long_put_cost
+        if ttm > 0:
+            record.long_call_return = max(0, -call_premium * call_multiple / long_call_cost) / ttm
+            record.long_put_return = max(0, -put_premium * put_multiple / long_put_cost) / ttm
+        else:
+            record.long_call_return = record.long_put_return = math.nan
+        record.ttm = ttm
+        record.rf = risk_free
+        record.strike = strike_price
+        if save_quotes:
+            record.future_dt, record.future_last, record.future_bid, record.future_ask = future_dt, future_last, future_bid, future_ask
+            record.call_dt, record.call_last, record.call_bid, record.call_ask = call_quote.datetime, call_last, call_bid, call_ask
+            record.put_dt, record.put_last, record.put_bid, record.put_ask = put_quote.datetime, put_last, put_bid, put_ask
+        if self.latency is not None:
+            self.latency.record(PARITY_COMPUTE, future_quote.instrument_id, strike_price, time.perf_counter_ns() - start_ns)
+        return record
+
+    def _get_ttm(self, future_quote: Quote) -> float:
+        """
+            期货剩余期限（年），同一行情时间只计算一次
+        """
+        cached = self._ttm_cache.get(future_quote.instrument_id, None)
+        if cached is not None and cached[0] == future_quote.datetime:
+            return cached[1]
         ttm = (time_to_datetime(future_quote.expire_datetime) -
                time_to_datetime(future_quote.datetime)).days / 365  # 到期日
-        call_quote_mid = (call_quote.ask_price1 + call_quote.bid_price1) / 2
-        put_quote_mid = (put_quote.ask_price1 + put_quote.bid_price1) / 2
-        future_mid = (future_quote.ask_price1 + future_quote.bid_price1) / 2
-        residual_last = call_quote.last_price - put_quote.last_price - \
-            (future_quote.last_price - strike_price) * np.exp(-ttm*risk_free)
-        residual_mid = call_quote_mid - put_quote_mid - \
-            (future_mid - strike_price) * np.exp(-ttm*risk_free)
-        call_premium = call_quote.ask_price1 - put_quote.bid_price1 - \
-            (future_quote.bid_price1 - strike_price) * np.exp(-ttm*risk_free)
-        #long call 策略的理论到行权日的年化收益率
-        long_call_cost =  call_quote.bid_price1 * call_quote.volume_multiple + self.get_margin_rate(put_quote) + self.get_margin_rate(future_quote)
-        long_call_return = max(0, -call_premium*call_quote.volume_multiple / long_call_cost) / ttm
-        put_premium = -(call_quote.bid_price1 - put_quote.ask_price1 - (future_quote.ask_price1 - strike_price) * np.exp(-ttm*risk_free))
-        long_put_cost = put_quote.bid_price1 * put_quote.volume_multiple + self.get_margin_rate(call_quote) + self.get_margin_rate(future_quote)
-        long_put_return = max(0, -put_premium*put_quote.volume_multiple / long_put_cost) / ttm
-        return {
-            'tq_time': future_quote.datetime,
-            'premium_last': residual_last,
-            'premium_mid': residual_mid,
-            'premium_call': call_premium,
-            'premium_put': put_premium,
-            'long_call_cost': long_call_cost,
-            'long_call_return': long_call_return,
-            'long_put_cost': long_put_cost,
-            'long_put_return':long_put_return,
-            'ttm': ttm,
-            'rf': risk_free,
-            'strike': strike_price
-        }
+        self._ttm_cache[future_quote.instrument_id] = (future_quote.datetime, ttm)
+        return ttm
+
+    def _get_chain_ttm(self, future_quote: Quote, chain: OptionChain) -> float:
+        """
+            期权链剩余期限（年），按期权到期时间计算，同一期权链、同一期货行情时间只计算一次
+        """
+        cached = self._chain_ttm.get(chain.key, None)
+        if cached is not None and cached[0] == future_quote.datetime:
+            return cached[1]
+        ttm = (time_to_datetime(chain.quotes[0].expire_datetime) -
+               time_to_datetime(future_quote.datetime)).total_seconds() / (365 * 86400)
+        self._chain_ttm[chain.key] = (future_quote.datetime, ttm)
+        return ttm
+
+    def get_chain_margins(self, chain: OptionChain, future_quote: Quote) -> (np.ndarray, np.ndarray):
+        """
+            期权链上认购、认沽的每手保证金，同一交易日、标的保证金和各期权前结算价都不变时直接返回缓存的数组
+
+            Return:
+
+                (认购保证金数组, 认沽保证金数组)
+
+        """
+        return self._margin_engine.chain_margins(chain, future_quote)
+
+    def get_parity_residuals(self, future_quote: Quote, strike_prices: np.ndarray, call_bid: np.ndarray, call_ask: np.ndarray, call_last: np.ndarray, put_bid: np.ndarray, put_ask: np.ndarray, put_last: np.ndarray, call_margin: np.ndarray, put_margin: np.ndarray, volume_multiple, risk_free: float = 0.0208) -> dict:
+        """
+            批量计算折溢价：一次期货tick对整条期权链做向量运算，各项含义同get_parity_residual
+
+            Args:
+
+                future_quote (Quote): 期货行情
+
+                strike_prices (np.ndarray): 行权价
+
+                call_bid/call_ask/call_last (np.ndarray): 认购买一价/卖一价/最新价
+
+                put_bid/put_ask/put_last (np.ndarray): 认沽买一价/卖一价/最新价
+
+                call_margin/put_margin (np.ndarray): 认购/认沽每手保证金
+
+                volume_multiple (float|np.ndarray): 期权合约乘数
+
+                risk_free (float): 无风险利率
+
+            Return:
+
+                get_parity_residual的各项，premium_*、long_*为np.ndarray
+
+        """
+        start_ns = time.perf_counter_ns() if self.latency is not None else 0
+        ttm = self._get_ttm(future_quote)
+        res = parity_residuals(strike_prices, call_bid, call_ask, call_last, put_bid, put_ask, put_last,
+                               future_quote.bid_price1, future_quote.ask_price1, future_quote.last_price, self.get_margin_rate(future_quote),
+                               call_margin, put_margin, volume_multiple, ttm, risk_free)
+        res.update({'tq_time': future_quote.datetime, 'ttm': ttm, 'rf': risk_free, 'strike': strike_prices})
+        if self.latency is not None:
+            self.latency.record(PARITY_COMPUTE, future_quote.instrument_id, None, time.perf_counter_ns() - start_ns)
+        return res
+
+    def get_chain_parity_residuals(self, future_quote: Quote, chain: OptionChain, risk_free: float = 0.0208) -> dict:
+        """
+            读取期权链最新行情并批量计算折溢价
+        """
+        call_margin, put_margin = self.get_chain_margins(chain, future_quote)
+        volume_multiple = np.array([q.volume_multiple for q in chain.call_quotes()], dtype=np.float64)
+        return self.get_parity_residuals(future_quote, chain.strikes, call_margin=call_margin, put_margin=put_margin,
+                                         volume_multiple=volume_multiple, risk_free=risk_free, **chain.price_arrays())
+
+    def get_chain_greeks(self, future_quote: Quote, chain: OptionChain, risk_free: float = 0.0208) -> dict:
+        """
+            期权链的隐含波动率和希腊字母（Black-76），期权价格取买卖中间价，没有买卖价时取最新价
+
+            剩余期限按期权自己的到期时间计算（期权可能早于标的期货到期），同一期权链、同一期货行情时间只计算一次
+
+            合约相同的期权链（如每次get_option_chain取到的同一到期日、同一行权价范围）共用一个GreeksEngine，
+            期货价格、剩余期限不变时只重算价格变化了的期权
+
+            Return:
+
+                dict: call_iv, put_iv, call_delta, put_delta, call_gamma, put_gamma, call_vega, put_vega, call_theta, put_theta（均与chain.strikes对齐），
+                      以及tq_time, future_price, ttm, rf
+
+        """
+        engine = self._greeks.get(chain.key, None)
+        if engine is None:
+            engine = self._greeks[chain.key] = GreeksEngine(chain.strikes)
+        prices = chain.price_arrays()
+        call_mid = (prices['call_bid'] + prices['call_ask']) / 2
+        put_mid = (prices['put_bid'] + prices['put_ask']) / 2
+        call_mid = np.where(np.isnan(call_mid), prices['call_last'], call_mid)
+        put_mid = np.where(np.isnan(put_mid), prices['put_last'], put_mid)
+        future_price = (future_quote.bid_price1 + future_quote.ask_price1) / 2
+        if future_price != future_price:
+            future_price = future_quote.last_price
+        ttm = self._get_chain_ttm(future_quote, chain)
+        res = dict(engine.update(future_price, ttm, risk_free, call_mid, put_mid))
+        res.update({'tq_time': future_quote.datetime, 'future_price': future_price, 'ttm': ttm, 'rf': risk_free})
+        return res
 
 
 class OptionTrade:
-    def __init__(self, api: TqApi, opt_api: TqOption, future_id: str, opts: dict, option_multiplier:int = 1, save_data: bool = False, can_trade: bool = False, long_call_threshold: float = 0, long_put_threshold: float = 0, return_threshold:float = 0.03, max_margin:float = None):
+    def __init__(self, api: TqApi, opt_api: TqOption, future_id: str, opts: dict, option_multiplier:int = 1, save_data: bool = False, can_trade: bool = False, long_call_threshold: float = 0, long_put_threshold: float = 0, return_threshold:float = 0.03, max_margin:float = None, dispatcher: "ParityDispatcher" = None, scheduler: "EvalScheduler" = None, latency: LatencyStats = None, on_signal=None, ledger: ExposureLedger = None, scoreboard: Scoreboard = None, window: int = None, z_threshold: float = None, max_rows: int = 100000):
         """
             Args:
 
                 option_multiplier: 期权/期货套利乘数，如IO和IF组=3
 
+                dispatcher: 不为None时各行权价不再各起一个quote_watcher，由dispatcher统一分发行情、批量计算
+
+                scheduler: 不为None时quote_watcher只登记脏的行权价组，由主线程在wait_update之后调用scheduler.flush()统一计算
+
+                latency: 不为None时记录行情到信号、信号到下单的延迟
+
+                on_signal: 不为None时每次trade_group下单后回调on_signal(trade, 行权价, 开仓方向, 期货目标持仓)；下过单的行权价组信号消失时再回调一次，开仓方向为0
+
+                ledger: 敞口账本，可多个OptionTrade共用，None则单独建一个；有scheduler或dispatcher时同一更新周期的期货对冲合并为一次下单
+
+                scoreboard: 套利机会排行榜，可多个OptionTrade共用，不为None时每次计算后更新各行权价组的理论收益率
+
+                window: 不为None时对各行权价组最近window次计算的premium_call/premium_put/premium_mid做滚动统计（self.rolling）
+
+                z_threshold: 不为None时（需设置window）折溢价开仓临界值改为滚动均值 - z_threshold * 滚动标准差，样本不足window时仍用long_call_threshold/long_put_threshold
+
+                max_rows: save_data时recorder最多保留约max_rows行（约700字节/行），超出后丢弃最早的整块，None为不限；需定期take()落盘
+
         """
         
         self.api = api
         self.opt_api = opt_api
         self.future_id = future_id
-        self.quote_df = pd.DataFrame()
+        self.recorder = ColumnRecorder(max_rows=max_rows)  # save_data时逐tick记录的折溢价数据
         self.can_trade = can_trade
         self._option_multiplier = option_multiplier
         self.save_data = save_data
@@ -347,42 +595,189 @@ class OptionTrade:
         self.long_put_threshold = long_put_threshold
         self.return_threshold = return_threshold
         self.max_margin = max_margin
-        #self._window = window
-        self._put_vols = dict()    #{认沽行权价:头寸}
+        self.dispatcher = dispatcher
+        self.scheduler = scheduler
+        self._groups = dict()  # {行权价: quote_watcher的行情和TargetPosTask}
+        self._records = dict()  # {行权价: ParityRecord}，on_quote复用
+        self.latency = latency
+        self.on_signal = on_signal
+        self._signal_ns = dict()  # {行权价: 给出开仓信号的时刻}
+        self._signaled = set()  # 已回调on_signal、信号尚未消失的行权价
+        # 滚动统计的组下标按行权价升序
+        self._rolling_strikes = np.array(sorted(opt['K'] for opt in opts.values()), dtype=np.float64)
+        self._rolling_index = {k: i for i, k in enumerate(self._rolling_strikes.tolist())}
+        self.rolling = RollingStats(len(self._rolling_strikes), window) if window is not None else None
+        self.z_threshold = z_threshold
+        self.ledger = ledger if ledger is not None else ExposureLedger()
+        self.scoreboard = scoreboard
+        hedge_scheduler = scheduler if scheduler is not None else dispatcher.scheduler if dispatcher is not None else None
+        # 有scheduler时期货对冲在每次flush之后统一下单，否则trade_group里立即下单
+        self._batch_hedge = hedge_scheduler is not None
+        if self._batch_hedge and self.ledger.flush not in hedge_scheduler.hooks:
+            hedge_scheduler.hooks.append(self.ledger.flush)
+
+    @property
+    def quote_df(self) -> pd.DataFrame:
+        """已记录的折溢价数据"""
+        return self.recorder.to_dataframe()
 
     def on_quote(self, future_quote: Quote, strike_price: float, call_quote: Quote, put_quote: Quote):
         """策略部分：该方法处理截面推过来的期权、期货报价数据"""
-        res = self.opt_api.get_parity_residual(
-            future_quote, strike_price, call_quote, put_quote)
-        res.update({'future_id':future_quote.instrument_id})
+        # 每个行权价组复用一个记录，热路径上不新建dict
+        res = self._records.get(strike_price, None)
+        if res is None:
+            res = self._records[strike_price] = ParityRecord()
+        self.opt_api.parity_residual_into(res, future_quote, strike_price, call_quote, put_quote, save_quotes=self.save_data)
+        res.future_id = future_quote.instrument_id
+        # 如果理论收益率 > 临界值，则打印
+        if self.return_threshold is not None and (res.long_call_return > self.return_threshold or res.long_put_return > self.return_threshold):
+            print(res)
+        if self.scoreboard is not None:
+            self.scoreboard.update(res.future_id, strike_price, LONG_CALL, res.long_call_return, (res.tq_time, res.premium_call, res.long_call_cost))
+            self.scoreboard.update(res.future_id, strike_price, LONG_PUT, res.long_put_return, (res.tq_time, res.premium_put, res.long_put_cost))
+        if self.save_data:
+            self.recorder.append(res)
+        group = self._rolling_index.get(strike_price, None) if self.rolling is not None else None
+        call_threshold = self._premium_threshold("premium_call", self.long_call_threshold, group)
+        put_threshold = self._premium_threshold("premium_put", self.long_put_threshold, group)
+        if self._signal(res.premium_call, call_threshold, res.long_call_return, res.long_call_cost):
+            direction = 1
+        elif self._signal(res.premium_put, put_threshold, res.long_put_return, res.long_put_cost):
+            direction = -1
+        else:
+            direction = 0
+        if group is not None:
+            # 先用之前的统计判断信号，再计入本次的值
+            self.rolling.push(group, (res.premium_call, res.premium_put, res.premium_mid))
+        if self.latency is not None:
+            self._record_signal(res.future_id, strike_price, direction, max(future_quote.datetime, call_quote.datetime, put_quote.datetime))
+        if direction == 0 and strike_price in self._signaled:
+            self._clear_signal(strike_price)
+        return direction
+
+    def on_quotes(self, future_quote: Quote, chain: OptionChain, index: np.ndarray = None) -> np.ndarray:
+        """
+            批量版的on_quote：对期权链上的行权价一次计算折溢价，返回各行权价的开仓方向
+
+            Args:
+
+                future_quote (Quote): 期货行情
+
+                chain (OptionChain): 期权链
+
+                index (np.ndarray): 只计算这些位置的行权价，None为全部
+
+            Return:
+
+                (np.ndarray) 开仓方向：1 long call组合，-1 long put组合，0 不开仓
+
+        """
+        call_margin, put_margin = self.opt_api.get_chain_margins(chain, future_quote)
+        if index is not None:
+            chain = chain.take(index)
+            call_margin = call_margin[index]
+            put_margin = put_margin[index]
+        calls = chain.call_quotes()
+        prices = chain.price_arrays()
+        res = self.opt_api.get_parity_residuals(
+            future_quote, chain.strikes, call_margin=call_margin, put_margin=put_margin,
+            volume_multiple=np.array([q.volume_multiple for q in calls], dtype=np.float64), **prices)
+        res.update({'future_id': future_quote.instrument_id})
         # 如果理论收益率 > 临界值，则打印
-        if res['long_call_return'] > self.return_threshold or res['long_put_return'] > self.return_threshold:
-            print (str(res))        
+        if self.return_threshold is not None:
+            for i in np.flatnonzero((res['long_call_return'] > self.return_threshold) | (res['long_put_return'] > self.return_threshold)):
+                print(str({k: v[i] if np.ndim(v) else v for k, v in res.items()}))
+        if self.scoreboard is not None:
+            future_id, tq_time = future_quote.instrument_id, res['tq_time']
+            for strike_price, call_return, call_premium, call_cost, put_return, put_premium, put_cost in zip(
+                    chain.strikes.tolist(), res['long_call_return'].tolist(), res['premium_call'].tolist(), res['long_call_cost'].tolist(),
+                    res['long_put_return'].tolist(), res['premium_put'].tolist(), res['long_put_cost'].tolist()):
+                self.scoreboard.update(future_id, strike_price, LONG_CALL, call_return, (tq_time, call_premium, call_cost))
+                self.scoreboard.update(future_id, strike_price, LONG_PUT, put_return, (tq_time, put_premium, put_cost))
         if self.save_data:
+            res.update(prices)
             res.update({
                 'future_dt': future_quote.datetime,
                 'future_last': future_quote.last_price,
                 'future_bid': future_quote.bid_price1,
                 'future_ask': future_quote.ask_price1,
-                #'future_margin': future_quote["margin"],
-                'call_dt': call_quote.datetime,
-                'call_last': call_quote.last_price,
-                'call_bid': call_quote.bid_price1,
-                'call_ask': call_quote.ask_price1,
-                #'call_margin': call_quote["margin"],
-                'put_dt': put_quote.datetime,
-                'put_last': put_quote.last_price,
-                'put_bid': put_quote.bid_price1,
-                'put_ask': put_quote.ask_price1,
-                #'put_margin': put_quote["margin"],
+                'call_dt': np.array([q.datetime for q in calls]),
+                'put_dt': np.array([q.datetime for q in chain.put_quotes()]),
             })
-            self.quote_df = self.quote_df.append(res, ignore_index=True)
-        if res['premium_call'] < self.long_call_threshold or res['long_call_return'] > self.return_threshold and (res['long_call_cost'] < self.max_margin or self.max_margin is None):
-            return 1
-        elif res['premium_put'] < self.long_put_threshold or res['long_put_return'] > self.return_threshold and (res['long_put_cost'] < self.max_margin or self.max_margin is None):
-            return -1
-        else:
-            return 0
+            self.recorder.extend(res, len(chain))
+        groups = None
+        if self.rolling is not None:
+            groups = np.searchsorted(self._rolling_strikes, chain.strikes).clip(0, max(len(self._rolling_strikes) - 1, 0))
+            found = self._rolling_strikes[groups] == chain.strikes if len(self._rolling_strikes) else np.zeros(len(chain), dtype=bool)
+            groups = np.where(found, groups, -1)
+        call_threshold = self._premium_threshold("premium_call", self.long_call_threshold, groups)
+        put_threshold = self._premium_threshold("premium_put", self.long_put_threshold, groups)
+        long_call = self._signal(res['premium_call'], call_threshold, res['long_call_return'], res['long_call_cost'])
+        long_put = self._signal(res['premium_put'], put_threshold, res['long_put_return'], res['long_put_cost'])
+        if groups is not None:
+            found = groups >= 0
+            self.rolling.push_many(groups[found], np.stack([res['premium_call'], res['premium_put'], res['premium_mid']])[:, found])
+        directions = np.where(long_call, 1, np.where(long_put, -1, 0))
+        if self.latency is not None:
+            # 取一次当前时刻，各行权价的行情时间按字符串缓存解析，循环内只做查表和整数运算
+            now_ns = time.time_ns()
+            future_id, future_dt = future_quote.instrument_id, future_quote.datetime
+            for strike_price, direction, call_quote, put_quote in zip(chain.strikes.tolist(), directions.tolist(), calls, chain.put_quotes()):
+                self._record_signal(future_id, strike_price, direction, max(future_dt, call_quote.datetime, put_quote.datetime), now_ns)
+        if self._signaled:
+            for strike_price in chain.strikes[directions == 0].tolist():
+                if strike_price in self._signaled:
+                    self._clear_signal(strike_price)
+        return directions
+
+    def _record_signal(self, underlying: str, strike_price: float, direction: int, tick_dt: str, now_ns: int = None):
+        """
+            记录行情时间到给出信号的延迟，有开仓信号时记下时刻，供trade_group计算信号到下单的延迟
+
+            Args:
+
+                now_ns (int): 给出信号的时刻（time.time_ns()），批量计算时由调用方取一次，None为现在
+
+        """
+        if tick_dt:
+            self.latency.record(TICK_TO_SIGNAL, underlying, strike_price, (time.time_ns() if now_ns is None else now_ns) - tick_time_ns(tick_dt))
+        if direction != 0:
+            self._signal_ns[strike_price] = time.perf_counter_ns()
+
+    def _clear_signal(self, strike_price: float):
+        """
+            下过单的行权价组信号消失：回调on_signal，开仓方向为0
+        """
+        self._signaled.discard(strike_price)
+        self.on_signal(self, strike_price, 0, self.ledger.future_target(self.future_id))
+
+    def _premium_threshold(self, name: str, fixed: float, groups):
+        """
+            折溢价开仓临界值：有z_threshold且该组样本足够时为滚动均值 - z_threshold * 滚动标准差，否则为固定临界值fixed
+
+            Args:
+
+                groups: 组下标，int对应on_quote，np.ndarray对应on_quotes（-1为不在统计中的行权价）；None为不使用滚动统计
+
+        """
+        if groups is None or self.z_threshold is None:
+            return fixed
+        if isinstance(groups, int):
+            adaptive = self.rolling.threshold(name, self.z_threshold, groups)
+            return adaptive if adaptive == adaptive else fixed
+        adaptive = self.rolling.threshold(name, self.z_threshold, groups.clip(0)) if len(self._rolling_strikes) else np.full(len(groups), np.nan)
+        adaptive = np.where(groups >= 0, adaptive, np.nan)
+        return np.where(np.isnan(adaptive), np.nan if fixed is None else fixed, adaptive)
+
+    def _signal(self, premium, threshold, ret, cost):
+        """
+            单边开仓条件：折溢价低于临界值，或理论收益率超过临界值且保证金不超限；临界值为None时不使用该条件。
+            标量、数组均可。
+        """
+        by_premium = premium < threshold if threshold is not None else False
+        by_return = ret > self.return_threshold if self.return_threshold is not None else False
+        within_margin = cost < self.max_margin if self.max_margin is not None else True
+        return by_premium | (by_return & within_margin)
 
     def trade_group(self, strike_price: float, future_vol: int, future: TargetPosTask, call: TargetPosTask, put: TargetPosTask):
         """
@@ -395,23 +790,43 @@ class OptionTrade:
         """
         call.set_target_volume(future_vol * self._option_multiplier)
         put.set_target_volume(-future_vol * self._option_multiplier)
-        self._put_vols[strike_price] = -future_vol * self._option_multiplier
-        future_target_vol = int(sum(self._put_vols.values()) / self._option_multiplier)
-        future.set_target_volume(future_target_vol)
+        self.ledger.bind(self.future_id, future, self._option_multiplier)
+        self.ledger.set_position(self.future_id, strike_price, future_vol * self._option_multiplier, -future_vol * self._option_multiplier)
+        if not self._batch_hedge:
+            self.ledger.flush(self.future_id)
+        if self.latency is not None and strike_price in self._signal_ns:
+            self.latency.record(SIGNAL_TO_ORDER, self.future_id, strike_price, time.perf_counter_ns() - self._signal_ns.pop(strike_price))
+        if self.on_signal is not None:
+            self._signaled.add(strike_price)
+            self.on_signal(self, strike_price, future_vol, self.ledger.future_target(self.future_id))
         
 
+    def strikes(self) -> list:
+        """quote_watcher登记的行权价"""
+        return list(self._groups.keys())
+
+    def evaluate(self, strikes: set):
+        """计算scheduler合并后的脏行权价组"""
+        for strike_price in strikes:
+            future_quote, call_quote, put_quote, future_target_pos, call_target_pos, put_target_pos = self._groups[strike_price]
+            trade_direction = self.on_quote(
+                future_quote, strike_price, call_quote, put_quote)
+            if self.can_trade and trade_direction != 0:
+                self.trade_group(strike_price,
+                    trade_direction, future_target_pos, call_target_pos, put_target_pos)
+
     async def quote_watcher(self, future_quote: Quote, strike_price: int, call_quote: Quote, put_quote: Quote, future_target_pos: TargetPosTask, call_target_pos: TargetPosTask, put_target_pos: TargetPosTask):
         """该task异步处理各个行权价格的推送"""
+        self._groups[strike_price] = (future_quote, call_quote, put_quote, future_target_pos, call_target_pos, put_target_pos)
         # 当 quote 有更新时会发送通知到 update_chan 上
         async with self.api.register_update_notify([call_quote, put_quote, future_quote]) as update_chan:
             while True:
                 async for _ in update_chan:  # 当从 update_chan 上收到行情更新通知时，运行...
                     if any([self.api.is_changing(quote, 'datetime') for quote in [future_quote, call_quote, put_quote]]):
-                        trade_direction = self.on_quote(
-                            future_quote, strike_price, call_quote, put_quote) 
-                        if self.can_trade and trade_direction != 0:
-                            self.trade_group(strike_price,
-                                trade_direction, future_target_pos, call_target_pos, put_target_pos)
+                        if self.scheduler is not None:
+                            self.scheduler.mark(self, strike_price)
+                        else:
+                            self.evaluate([strike_price])
 
     def parity_quote_task(self, opt: dict, future_id: str, future_target_pos):
         call_quote = self.api.get_quote(opt['c'])
@@ -421,6 +836,10 @@ class OptionTrade:
         call_target_pos = TargetPosTask(self.api, opt['c'])
         put_target_pos = TargetPosTask(self.api, opt['p'])
         put_position = self.api.get_position(opt['p'])
-        self._put_vols[opt['K']] = put_position.pos
-        self.api.create_task(self.quote_watcher(future_quote, opt['K'], call_quote, put_quote, future_target_pos, call_target_pos, put_target_pos))
+        self.ledger.bind(future_id, future_target_pos, self._option_multiplier)
+        self.ledger.set_position(future_id, opt['K'], put_vol=put_position.pos, hedge=False)
+        if self.dispatcher is not None:
+            self.dispatcher.add(self, opt['K'], future_quote, call_quote, put_quote, future_target_pos, call_target_pos, put_target_pos)
+        else:
+            self.api.create_task(self.quote_watcher(future_quote, opt['K'], call_quote, put_quote, future_target_pos, call_target_pos, put_target_pos))
         print('Quote subscribed ' + str(opt))
\ No newline at end of file
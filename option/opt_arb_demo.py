@@ -8,7 +8,11 @@ from tqsdk.exceptions import BacktestFinished
 from datetime import datetime, date
 from contextlib import closing
 from opt import TqOption, OptionTrade
-import os
+from store import ParityStore
+from dispatcher import ParityDispatcher
+from latency import LatencyStats
+from scoreboard import Scoreboard
+import time
 
 #套利组task
 trade_dict = dict()
@@ -25,6 +29,11 @@ def subscribe_main_parity(
     max_strike,
     return_threshold=0.1,
     max_margin=4000,
+    dispatcher=None,
+    latency=None,
+    on_signal=None,
+    snapshot_dir=None,
+    scoreboard=None,
 ):
     """
         对某个基础资产进行put-call parity异步套利。
@@ -39,6 +48,8 @@ def subscribe_main_parity(
         api,
         underlying_future_id=kq_m.underlying_symbol,
         option_product_id=option_product_id,
+        latency=latency,
+        snapshot_dir=snapshot_dir,              #合约快照目录，同一交易日重启时不再扫描全部合约
     )
     # 按照行权价范围，选择需要的期权合约组合
     _, opts = opt_api.get_future_opt_symbols(
@@ -59,6 +70,10 @@ def subscribe_main_parity(
         long_put_threshold=short_call,          #开仓方案一：买put、卖call、多期货的开仓临界值，可None
         return_threshold=return_threshold,      #开仓方案二：按照理论收益率（=残差/保证金占用）来开仓，可None
         max_margin=max_margin,                  #最大保证金占用，可None
+        dispatcher=dispatcher,                  #统一分发行情的dispatcher，None则每个行权价一个task
+        latency=latency,                        #延迟统计，None则不统计
+        on_signal=on_signal,                    #下单时、下过单的信号消失时的回调，None则不回调
+        scoreboard=scoreboard,                  #全部标的共用的套利机会排行榜，None则不排行
     )
     global trade_dict
     # 使用future_symbol可以查询这组put-call parity arbitrage对象
@@ -70,37 +85,59 @@ def subscribe_main_parity(
         trade.parity_quote_task(opt, kq_m.underlying_symbol, future_target_pos)
 
 
-api = TqApi(TqSim(), web_gui=True)
-# api = TqApi(TqAccount("G光大期货", "[账号]", "[密码]"), web_gui=True)
-# api = TqApi(backtest=TqBacktest(start_dt=datetime(2020, 2, 3, 9), end_dt=datetime(2020, 2, 14, 16)))
-
-subscribe_main_parity(api, "CZCE.SR", "SR", "SR", -100, -100, None, None)
-subscribe_main_parity(api, "CZCE.CF", "CF", "CF", -100, -100, 12400, 13800)
-subscribe_main_parity(api, "CZCE.MA", "MA", "MA", -100, -100, 1950, 2175)
-subscribe_main_parity(api, "CZCE.TA", "TA", "TA", -100, -100, 4300, 4650)
-subscribe_main_parity(api, "DCE.c", "c", "c_o", -100, -100, 1820, 2000)
-subscribe_main_parity(api, "DCE.i", "i", "i_o", -100, -100, None, None)
-subscribe_main_parity(api, "DCE.m", "m", "m_o", -100, -100, 2500, 2850)
-# subscribe_main_parity(api, "CFFEX.IF", "i", "m_o", -100, -100, 2500, 2850)
-
-
-def save_all(trade_dict):
+def save_all(trade_dict, store):
     """
         保存put-call-parity的tick数据，此时OptionTrade的save_data=True
+
+        取出各OptionTrade已记录的数据，交给store的后台线程按行情所属交易日追加写入data/交易日/品种/，不阻塞主线程
     """
     for k, trade in trade_dict.items():
         if trade.save_data:
             print("ts:{}".format(datetime.now()))
-            date_str = datetime.now().strftime("%Y%m%d")
-            time_str = datetime.now().strftime("%Y%m%d%H")
-            if not os.path.exists("data/{}/{}/".format(date_str, k)):
-                os.mkdir("data/{}/{}/".format(date_str, k))
-            trade.quote_df.to_excel("data/{}/{}/{}.xlsx".format(date_str, k, time_str))
+            store.write_records(k, trade.recorder.take())
+
+
+#(主力合约前缀, 期货product_id, 期权product_id, long call临界值, long put临界值, 最小行权价, 最大行权价)
+PRODUCTS = [
+    ("CZCE.SR", "SR", "SR", -100, -100, None, None),
+    ("CZCE.CF", "CF", "CF", -100, -100, 12400, 13800),
+    ("CZCE.MA", "MA", "MA", -100, -100, 1950, 2175),
+    ("CZCE.TA", "TA", "TA", -100, -100, 4300, 4650),
+    ("DCE.c", "c", "c_o", -100, -100, 1820, 2000),
+    ("DCE.i", "i", "i_o", -100, -100, None, None),
+    ("DCE.m", "m", "m_o", -100, -100, 2500, 2850),
+    # ("CFFEX.IF", "i", "m_o", -100, -100, 2500, 2850),
+]
+
+
+def main():
+    api = TqApi(TqSim(), web_gui=True)
+    # api = TqApi(TqAccount("G光大期货", "[账号]", "[密码]"), web_gui=True)
+    # api = TqApi(backtest=TqBacktest(start_dt=datetime(2020, 2, 3, 9), end_dt=datetime(2020, 2, 14, 16)))
+
+    # 整个进程共用一个行情分发task
+    dispatcher = ParityDispatcher(api)
+    # 延迟统计，每10分钟打印一次汇总
+    latency = LatencyStats(dump_interval=600)
+    # 全部标的的套利机会排行，每分钟打印前10名
+    scoreboard = Scoreboard()
+    last_print = time.time()
+    for product in PRODUCTS:
+        subscribe_main_parity(api, *product, dispatcher=dispatcher, latency=latency, snapshot_dir="snapshot", scoreboard=scoreboard)
+
+    store = ParityStore("data")
+    # 主线程
+    while True:
+        api.wait_update()
+        latency.maybe_dump()
+        if time.time() - last_print >= 60:
+            last_print = time.time()
+            for score, future_id, strike_price, direction, info in scoreboard.top(10):
+                print("{} {} {} return:{:.4f} {}".format(future_id, strike_price, "long_call" if direction > 0 else "long_put", score, info))
+        # 每分钟调用保存数据方法
+        # if datetime.now().second == 0:
+        #    save_all(trade_dict, store)
 
 
-# 主线程
-while True:
-    api.wait_update()
-    # 每分钟调用保存数据方法
-    # if datetime.now().second == 0:
-    #    save_all(trade_dict)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+按标的分片到多个进程的put-call parity套利监测
+
+每个worker进程各自一个TqApi，只订阅分到的标的，一个标的行情突发不会拖慢其他进程里的标的；
+worker通过一个multiprocessing.Queue向主进程批量汇报开仓信号、持仓和心跳，主进程重启退出或失去心跳的worker。
+
+python opt_arb_shard.py --shards 4
+"""
+import argparse
+import multiprocessing
+import queue
+import time
+import traceback
+
+from tqsdk import TqApi, TqSim
+
+from dispatcher import ParityDispatcher
+from latency import LatencyStats, TICK_TO_SIGNAL
+from opt_arb_demo import PRODUCTS, subscribe_main_parity
+
+#worker汇报的消息类型，消息为(类型, 分片号, 时间戳, 内容)
+SIGNAL = "signal"          # {future_id, strike, direction, future_target}
+POSITION = "position"      # {合约代码: 净持仓}，有变化时才发送
+HEARTBEAT = "heartbeat"    # {updates: 期间wait_update次数, products: 标的数, tick_to_signal_p99_us}
+ERROR = "error"            # 异常堆栈
+
+
+def default_api() -> TqApi:
+    return TqApi(TqSim())
+
+
+class _Reporter:
+    """
+        worker内的汇报：消息先缓存，每次wait_update之后合成一批put到队列
+    """
+
+    def __init__(self, shard_id: int, out_queue: multiprocessing.Queue):
+        self.shard_id = shard_id
+        self._queue = out_queue
+        self._pending = []
+        self._last_signal = dict()  # {(期货代码, 行权价): 开仓方向}，同一信号持续时只报一次，信号消失后再出现时重新汇报
+        self._last_positions = None
+
+    def on_signal(self, trade, strike_price: float, direction: int, future_target: int):
+        key = (trade.future_id, strike_price)
+        if direction == 0:
+            # 信号消失：不汇报，只清除记录
+            self._last_signal.pop(key, None)
+            return
+        if self._last_signal.get(key, None) == direction:
+            return
+        self._last_signal[key] = direction
+        self.send(SIGNAL, {'future_id': trade.future_id, 'strike': strike_price, 'direction': direction, 'future_target': future_target})
+
+    def on_positions(self, positions: dict):
+        if positions != self._last_positions:
+            self._last_positions = positions
+            self.send(POSITION, positions)
+
+    def send(self, kind: str, payload):
+        self._pending.append((kind, self.shard_id, time.time(), payload))
+
+    def flush(self):
+        if self._pending:
+            self._queue.put(self._pending)
+            self._pending = []
+
+
+def run_worker(shard_id: int, products: list, out_queue: multiprocessing.Queue, api_factory=default_api, subscribe=subscribe_main_parity, heartbeat_interval: float = 5.0):
+    """
+        worker进程入口：订阅分到的标的并一直运行
+
+        Args:
+
+            shard_id (int): 分片号
+
+            products (list): subscribe的位置参数列表，如opt_arb_demo.PRODUCTS的一部分
+
+            out_queue (multiprocessing.Queue): 汇报队列
+
+            api_factory: 无参函数，返回该进程使用的api
+
+            subscribe: 订阅一个标的的函数，同subscribe_main_parity
+
+            heartbeat_interval (float): 心跳间隔（秒）
+
+    """
+    reporter = _Reporter(shard_id, out_queue)
+    try:
+        api = api_factory()
+        dispatcher = ParityDispatcher(api)
+        latency = LatencyStats()
+        for product in products:
+            subscribe(api, *product, dispatcher=dispatcher, latency=latency, on_signal=reporter.on_signal)
+        updates = 0
+        last_heartbeat = 0
+        while True:
+            api.wait_update(deadline=time.time() + heartbeat_interval)
+            updates += 1
+            now = time.time()
+            if now - last_heartbeat >= heartbeat_interval:
+                reporter.on_positions({symbol: position.pos for symbol, position in api.get_position().items() if position.pos != 0})
+                reporter.send(HEARTBEAT, {'updates': updates, 'products': len(products),
+                                          'tick_to_signal_p99_us': latency.histogram(TICK_TO_SIGNAL).percentile(99) / 1e3})
+                latency.reset()
+                updates = 0
+                last_heartbeat = now
+            reporter.flush()
+    except Exception:
+        reporter.send(ERROR, traceback.format_exc())
+        reporter.flush()
+        raise
+
+
+class ShardSupervisor:
+    """
+        分片管理：把标的按顺序轮流分到n_shards个worker进程，汇总worker的汇报
+
+        worker进程退出，或超过timeout秒没有心跳时，终止并重启该worker。
+        poll()需在主进程循环调用。
+    """
+
+    def __init__(self, products: list = PRODUCTS, n_shards: int = None, api_factory=default_api, subscribe=subscribe_main_parity, heartbeat_interval: float = 5.0, timeout: float = 60.0, restart_delay: float = 5.0, on_message=None):
+        """
+
+            Args:
+
+                products (list): subscribe的位置参数列表
+
+                n_shards (int): worker进程数，None为min(cpu核数, 标的数)
+
+                api_factory: worker中创建api的无参函数，须可pickle（模块级函数或functools.partial）
+
+                subscribe: 订阅一个标的的函数，须可pickle
+
+                heartbeat_interval (float): worker心跳间隔（秒）
+
+                timeout (float): 超过该时间没有心跳则重启worker（秒），首次心跳前含订阅耗时
+
+                restart_delay (float): worker启动后至少过这么久才会被重启（秒），避免启动即失败时反复重连
+
+                on_message: 每条消息的回调on_message(类型, 分片号, 时间戳, 内容)
+
+        """
+        n_shards = n_shards or min(multiprocessing.cpu_count(), len(products))
+        self.shards = [products[i::n_shards] for i in range(n_shards)]
+        self.api_factory = api_factory
+        self.subscribe = subscribe
+        self.heartbeat_interval = heartbeat_interval
+        self.timeout = timeout
+        self.restart_delay = restart_delay
+        self.on_message = on_message
+        # spawn：worker不继承主进程的状态，各平台行为一致
+        self._ctx = multiprocessing.get_context("spawn")
+        self._queue = self._ctx.Queue()
+        self._processes = [None] * n_shards
+        self._started = [0.0] * n_shards
+        self.last_heartbeat = [0.0] * n_shards  # 心跳时间，未收到心跳时为启动时间
+        self.heartbeats = [None] * n_shards  # 最近一次心跳的内容
+        self.positions = [dict() for _ in range(n_shards)]
+        self.signals = []  # 全部开仓信号
+        self.restarts = [0] * n_shards
+
+    def start(self):
+        for shard_id in range(len(self.shards)):
+            self._start(shard_id)
+
+    def _start(self, shard_id: int):
+        process = self._ctx.Process(target=run_worker, name="opt_arb_shard-{}".format(shard_id), daemon=True,
+                                    args=(shard_id, self.shards[shard_id], self._queue, self.api_factory, self.subscribe, self.heartbeat_interval))
+        process.start()
+        self._processes[shard_id] = process
+        self._started[shard_id] = time.time()
+        self.last_heartbeat[shard_id] = time.time()
+
+    def poll(self, timeout: float = 1.0) -> int:
+        """
+            处理worker的汇报，最多等待timeout秒，之后检查worker状态
+
+            Return:
+
+                int: 本次处理的消息数
+
+        """
+        count = 0
+        deadline = time.time() + timeout
+        while True:
+            try:
+                batch = self._queue.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                break
+            for message in batch:
+                self._handle(*message)
+            count += len(batch)
+            if time.time() >= deadline:
+                break
+        self.check()
+        return count
+
+    def _handle(self, kind: str, shard_id: int, ts: float, payload):
+        if kind == HEARTBEAT:
+            self.last_heartbeat[shard_id] = ts
+            self.heartbeats[shard_id] = payload
+        elif kind == POSITION:
+            self.positions[shard_id] = payload
+        elif kind == SIGNAL:
+            self.signals.append((shard_id, ts, payload))
+        if self.on_message is not None:
+            self.on_message(kind, shard_id, ts, payload)
+
+    def check(self):
+        """
+            重启已退出或失去心跳的worker
+        """
+        now = time.time()
+        for shard_id, process in enumerate(self._processes):
+            if process is None or now - self._started[shard_id] < self.restart_delay:
+                continue
+            if not process.is_alive() or now - self.last_heartbeat[shard_id] > self.timeout:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+                self.restarts[shard_id] += 1
+                self._start(shard_id)
+
+    def all_positions(self) -> dict:
+        """
+            全部worker的持仓：{合约代码: 净持仓}
+        """
+        return {symbol: pos for positions in self.positions for symbol, pos in positions.items()}
+
+    def stop(self):
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is not None:
+                process.join()
+        self._processes = [None] * len(self._processes)
+
+
+def _print_message(kind: str, shard_id: int, ts: float, payload):
+    if kind != HEARTBEAT:
+        print("shard:{} {} {}".format(shard_id, kind, payload))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按标的分片的put-call parity套利监测")
+    parser.add_argument("--shards", type=int, default=None, help="worker进程数，默认min(cpu核数, 标的数)")
+    parser.add_argument("--heartbeat", type=float, default=5.0, help="心跳间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="失去心跳多久重启worker（秒）")
+    args = parser.parse_args()
+    supervisor = ShardSupervisor(PRODUCTS, args.shards, heartbeat_interval=args.heartbeat, timeout=args.timeout, on_message=_print_message)
+    supervisor.start()
+    try:
+        while True:
+            supervisor.poll()
+    finally:
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
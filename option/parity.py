@@ -0,0 +1,157 @@
+"""
+    put-call parity的向量化计算：一次计算同一到期日全部行权价
+"""
+import numpy as np
+
+
+def parity_residuals(strike_prices: np.ndarray, call_bid: np.ndarray, call_ask: np.ndarray, call_last: np.ndarray,
+                     put_bid: np.ndarray, put_ask: np.ndarray, put_last: np.ndarray,
+                     future_bid: float, future_ask: float, future_last: float, future_margin: float,
+                     call_margin: np.ndarray, put_margin: np.ndarray, volume_multiple, ttm: float, risk_free: float = 0.0208) -> dict:
+    """
+        计算整条期权链的折溢价，与TqOption.get_parity_residual逐项一致
+
+        Args:
+
+            strike_prices (np.ndarray): 行权价
+
+            call_bid/call_ask/call_last (np.ndarray): 认购买一价/卖一价/最新价
+
+            put_bid/put_ask/put_last (np.ndarray): 认沽买一价/卖一价/最新价
+
+            future_bid/future_ask/future_last (float): 期货买一价/卖一价/最新价
+
+            future_margin (float): 期货每手保证金
+
+            call_margin/put_margin (np.ndarray): 认购/认沽每手保证金
+
+            volume_multiple (float|np.ndarray): 期权合约乘数
+
+            ttm (float): 剩余期限（年），不大于0时年化收益率为nan
+
+            risk_free (float): 无风险利率
+
+        Return:
+
+            {premium_last, premium_mid, premium_call, premium_put, long_call_cost, long_call_return, long_put_cost, long_put_return}，均为np.ndarray
+
+    """
+    discount = np.exp(-ttm * risk_free)
+    call_mid = (call_ask + call_bid) / 2
+    put_mid = (put_ask + put_bid) / 2
+    future_mid = (future_ask + future_bid) / 2
+    residual_last = call_last - put_last - (future_last - strike_prices) * discount
+    residual_mid = call_mid - put_mid - (future_mid - strike_prices) * discount
+    call_premium = call_ask - put_bid - (future_bid - strike_prices) * discount
+    put_premium = -(call_bid - put_ask - (future_ask - strike_prices) * discount)
+    # long call 策略的理论到行权日的年化收益率，fmax与内置max一样在nan时取0
+    long_call_cost = call_bid * volume_multiple + put_margin + future_margin
+    long_put_cost = put_bid * volume_multiple + call_margin + future_margin
+    with np.errstate(divide="ignore", invalid="ignore"):
+        long_call_return = np.fmax(0, -call_premium * volume_multiple / long_call_cost) / ttm
+        long_put_return = np.fmax(0, -put_premium * volume_multiple / long_put_cost) / ttm
+    if ttm <= 0:
+        # 到期日当天不计算年化收益率，同get_parity_residual
+        long_call_return = np.full(np.shape(long_call_return), np.nan)
+        long_put_return = np.full(np.shape(long_put_return), np.nan)
+    return {
+        'premium_last': residual_last,
+        'premium_mid': residual_mid,
+        'premium_call': call_premium,
+        'premium_put': put_premium,
+        'long_call_cost': long_call_cost,
+        'long_call_return': long_call_return,
+        'long_put_cost': long_put_cost,
+        'long_put_return': long_put_return,
+    }
+
+
+def implied_risk_free(strike_prices: np.ndarray, call_bid: np.ndarray, call_ask: np.ndarray, call_last: np.ndarray,
+                      put_bid: np.ndarray, put_ask: np.ndarray, put_last: np.ndarray,
+                      future_bid, future_ask, future_last, ttm) -> dict:
+    """
+        批量解put-call parity的“隐含无风险收益率”，与TqOption.get_implied_risk_free的四个方程一致
+
+        分母为0、比值非正、价格缺失或ttm<=0的位置返回nan，不产生numpy警告。
+        future_*与ttm可以是标量，也可以是与行权价对齐的数组（多个到期日拼接在一起计算）。
+
+        Args:
+
+            strike_prices (np.ndarray): 行权价
+
+            call_bid/call_ask/call_last (np.ndarray): 认购买一价/卖一价/最新价
+
+            put_bid/put_ask/put_last (np.ndarray): 认沽买一价/卖一价/最新价
+
+            future_bid/future_ask/future_last (float|np.ndarray): 期货买一价/卖一价/最新价
+
+            ttm (float|np.ndarray): 期权剩余期限（年）
+
+        Return:
+
+            {last, mid, long_call, short_call}，均为np.ndarray
+
+    """
+    call_mid = (call_ask + call_bid) / 2
+    put_mid = (put_ask + put_bid) / 2
+    future_mid = (future_ask + future_bid) / 2
+    return {
+        'last': _solve_rate(call_last - put_last, future_last - strike_prices, ttm),
+        'mid': _solve_rate(call_mid - put_mid, future_mid - strike_prices, ttm),
+        'long_call': _solve_rate(call_ask - put_bid, future_bid - strike_prices, ttm),
+        'short_call': _solve_rate(call_bid - put_ask, future_ask - strike_prices, ttm),
+    }
+
+
+def _solve_rate(option_diff: np.ndarray, future_diff: np.ndarray, ttm) -> np.ndarray:
+    """
+        解 option_diff = future_diff * exp(-ttm * r)，无效位置为nan
+    """
+    ratio = np.full(np.broadcast(option_diff, future_diff).shape, np.nan)
+    np.divide(option_diff, future_diff, out=ratio, where=future_diff != 0)
+    valid = (ratio > 0) & (ttm > 0)
+    rate = np.full(ratio.shape, np.nan)
+    np.log(ratio, out=rate, where=valid)
+    return np.divide(-rate, ttm, out=rate, where=valid)
+
+
+class ImpliedRateCurve:
+    """
+        隐含无风险收益率期限结构：每个到期日取各行权价隐含利率的中位数，期限之间线性插值
+    """
+
+    def __init__(self, expiries: list, ttms: np.ndarray, points: list, field: str = "mid"):
+        """
+
+            Args:
+
+                expiries (list): 到期日，升序
+
+                ttms (np.ndarray): 各到期日的剩余期限（年）
+
+                points (list): 各到期日implied_risk_free的结果，另含strike行权价数组
+
+                field (str): 拟合所用的价格口径：last/mid/long_call/short_call
+
+        """
+        self.expiries = expiries
+        self.ttms = ttms
+        self.points = points
+        self.field = field
+        self.counts = np.array([np.count_nonzero(~np.isnan(p[field])) for p in points], dtype=np.int64)
+        self.rates = np.array([np.nanmedian(p[field]) if n > 0 else np.nan for p, n in zip(points, self.counts)], dtype=np.float64)
+
+    def rate(self, ttm):
+        """
+            插值取剩余期限ttm（年）对应的隐含利率，期限两端之外取端点值；没有有效点时返回nan
+        """
+        valid = ~np.isnan(self.rates)
+        if not valid.any():
+            return np.full(np.shape(ttm), np.nan) if np.ndim(ttm) else np.nan
+        return np.interp(ttm, self.ttms[valid], self.rates[valid])
+
+    def to_dict(self) -> dict:
+        """
+            {到期日: 隐含利率}
+        """
+        return dict(zip(self.expiries, self.rates.tolist()))
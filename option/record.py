@@ -0,0 +1,35 @@
+"""
+折溢价热路径用的定长记录：可复用的折溢价结果，每个tick不再新建dict
+"""
+from recorder import PARITY_SCHEMA
+
+#get_parity_residual返回的字段
+RESIDUAL_FIELDS = ['tq_time', 'premium_last', 'premium_mid', 'premium_call', 'premium_put', 'long_call_cost',
+                   'long_call_return', 'long_put_cost', 'long_put_return', 'ttm', 'rf', 'strike']
+
+
+class ParityRecord:
+    """
+        一个行权价组的折溢价记录，字段同recorder.PARITY_SCHEMA
+
+        OptionTrade每个行权价组预分配一个，每个tick原地改写；支持record["字段"]和record.get()，
+        可以直接交给ColumnRecorder.append。
+    """
+
+    __slots__ = tuple(name for name, _ in PARITY_SCHEMA)
+
+    def __init__(self):
+        for name, dtype in PARITY_SCHEMA:
+            setattr(self, name, "" if dtype.startswith("U") else float("nan"))
+
+    def __getitem__(self, name: str):
+        return getattr(self, name)
+
+    def get(self, name: str, default=None):
+        return getattr(self, name, default)
+
+    def to_dict(self, fields: list = None) -> dict:
+        return {name: getattr(self, name) for name in (fields or self.__slots__)}
+
+    def __repr__(self):
+        return str(self.to_dict(RESIDUAL_FIELDS + ['future_id']))
@@ -0,0 +1,137 @@
+"""
+    列式tick记录器：预分配、定类型的numpy列缓冲，按块增长
+"""
+import numpy as np
+import pandas as pd
+
+#OptionTrade.on_quote每行记录的字段
+PARITY_SCHEMA = [
+    ('tq_time', 'U26'),
+    ('future_id', 'U32'),
+    ('strike', 'f8'),
+    ('premium_last', 'f8'),
+    ('premium_mid', 'f8'),
+    ('premium_call', 'f8'),
+    ('premium_put', 'f8'),
+    ('long_call_cost', 'f8'),
+    ('long_call_return', 'f8'),
+    ('long_put_cost', 'f8'),
+    ('long_put_return', 'f8'),
+    ('ttm', 'f8'),
+    ('rf', 'f8'),
+    ('future_dt', 'U26'),
+    ('future_last', 'f8'),
+    ('future_bid', 'f8'),
+    ('future_ask', 'f8'),
+    ('call_dt', 'U26'),
+    ('call_last', 'f8'),
+    ('call_bid', 'f8'),
+    ('call_ask', 'f8'),
+    ('put_dt', 'U26'),
+    ('put_last', 'f8'),
+    ('put_bid', 'f8'),
+    ('put_ask', 'f8'),
+]
+
+
+class ColumnRecorder:
+    """
+        列式记录器
+
+        每列按chunk_size行预分配一块numpy数组，写满后再分配下一块，已写入的数据从不复制，
+        追加为O(1)；只有调用to_dataframe()时才拼接成DataFrame。
+        max_rows不为None时只保留最近的max_rows行左右（按整块丢弃），内存有上界。
+    """
+
+    def __init__(self, schema: list = PARITY_SCHEMA, chunk_size: int = 4096, max_rows: int = None):
+        """
+
+            Args:
+
+                schema (list): [(列名, numpy dtype)]
+
+                chunk_size (int): 每块行数
+
+                max_rows (int): 最多保留的行数，None为不限
+
+        """
+        self.schema = [(name, np.dtype(dtype)) for name, dtype in schema]
+        self.chunk_size = chunk_size
+        self.max_rows = max_rows
+        self._chunks = []  # 已写满的块：[{列名: np.ndarray}]
+        self._current = self._new_chunk()
+        self._pos = 0  # 当前块已写入行数
+
+    def _new_chunk(self) -> dict:
+        return {name: np.empty(self.chunk_size, dtype=dtype) for name, dtype in self.schema}
+
+    def __len__(self):
+        return len(self._chunks) * self.chunk_size + self._pos
+
+    def append(self, row: dict):
+        """
+            追加一行，schema中row缺少的字段：数值列记nan，字符串列记空串
+        """
+        pos = self._pos
+        for name, dtype in self.schema:
+            value = row.get(name, None)
+            if value is None:
+                value = "" if dtype.kind == "U" else np.nan
+            self._current[name][pos] = value
+        self._advance(1)
+
+    def _advance(self, count: int):
+        self._pos += count
+        if self._pos == self.chunk_size:
+            self._chunks.append(self._current)
+            self._current = self._new_chunk()
+            self._pos = 0
+            if self.max_rows is not None:
+                while len(self._chunks) * self.chunk_size > self.max_rows:
+                    self._chunks.pop(0)
+
+    def extend(self, columns: dict, n: int):
+        """
+            按列批量追加n行，columns中的值可以是长度为n的数组或标量，缺少的列同append
+        """
+        done = 0
+        while done < n:
+            pos = self._pos
+            count = min(n - done, self.chunk_size - pos)
+            for name, dtype in self.schema:
+                value = columns.get(name, None)
+                if value is None:
+                    value = "" if dtype.kind == "U" else np.nan
+                elif np.ndim(value):
+                    value = value[done:done + count]
+                self._current[name][pos:pos + count] = value
+            done += count
+            self._advance(count)
+
+    def columns(self) -> dict:
+        """
+            {列名: np.ndarray}，拼接后的全部数据
+        """
+        return {name: np.concatenate([chunk[name] for chunk in self._chunks] + [self._current[name][:self._pos]])
+                for name, _ in self.schema}
+
+    def take(self) -> dict:
+        """
+            取出全部数据并清空记录器，用于分块落盘
+        """
+        columns = self.columns()
+        self.clear()
+        return columns
+
+    def clear(self):
+        """
+            清空记录
+        """
+        self._chunks = []
+        self._pos = 0
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+            以DataFrame形式查看已记录的数据
+        """
+        return pd.DataFrame(self.columns())
@@ -0,0 +1,355 @@
+"""
+离线回放：把录制的行情（期货+认购、认沽）按时间顺序喂给OptionTrade，模拟TargetPosTask按对手价成交
+
+不连网、不依赖TqSim/TqBacktest，同样的数据和参数每次回放结果相同，可以在几分钟内回放几周的数据来回归测试、调整开仓临界值。
+"""
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from tqsdk.exceptions import BacktestFinished
+from tqsdk.objs import Quote, Account, Position
+
+#合约信息字段：TqOption、MarginEngine、OptionChain用到的静态字段
+CONTRACT_FIELDS = ['instrument_id', 'ins_class', 'product_id', 'underlying_symbol', 'option_class', 'strike_price',
+                   'expire_datetime', 'delivery_year', 'delivery_month', 'volume_multiple', 'price_tick',
+                   'margin', 'pre_settlement', 'pre_close']
+#回放的行情字段
+QUOTE_FIELDS = ['last_price', 'bid_price1', 'ask_price1', 'volume']
+
+
+def dump_contracts(api, symbols: list, path: str = None) -> dict:
+    """
+        从api（实盘或TqSim）导出合约信息，供ReplayApi构造合约
+
+        Return:
+
+            dict: {合约代码: {字段: 值}}，path不为None时同时写入json文件
+
+    """
+    contracts = dict()
+    for symbol in symbols:
+        quote = api.get_quote(symbol)
+        contracts[symbol] = {k: quote.get(k, None) for k in CONTRACT_FIELDS}
+    if path is not None:
+        with open(path, "w") as f:
+            json.dump(contracts, f, ensure_ascii=False, indent=1, default=float)
+    return contracts
+
+
+def load_contracts(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def updates_from_records(records: pd.DataFrame, opts: dict) -> pd.DataFrame:
+    """
+        把OptionTrade记录的折溢价数据（recorder/ParityStore的PARITY_SCHEMA，需save_data=True）还原为逐合约的行情更新
+
+        每行记录含期货、认购、认沽三条腿的行情，同一合约同一行情时间只保留一条。
+
+        Args:
+
+            records (pd.DataFrame): 记录的数据，如read_day()的返回值
+
+            opts (dict): {行权价:{K:行权价,c:认购合约代码,p:认沽合约代码}}，即get_future_opt_symbols的返回值
+
+        Return:
+
+            pd.DataFrame: datetime, symbol, last_price, bid_price1, ask_price1，按datetime排序
+
+    """
+    symbols = {opt['K']: (opt['c'], opt['p']) for opt in opts.values()}
+    known = records['strike'].isin(list(symbols.keys()))
+    records = records[known]
+    legs = []
+    for leg in ("future", "call", "put"):
+        if leg == "future":
+            symbol = records['future_id'].to_numpy()
+        else:
+            symbol = np.array([symbols[k][0 if leg == "call" else 1] for k in records['strike'].tolist()], dtype=object)
+        legs.append(pd.DataFrame({
+            'datetime': records[leg + '_dt'].to_numpy(),
+            'symbol': symbol,
+            'last_price': records[leg + '_last'].to_numpy(),
+            'bid_price1': records[leg + '_bid'].to_numpy(),
+            'ask_price1': records[leg + '_ask'].to_numpy(),
+        }))
+    updates = pd.concat(legs, ignore_index=True)
+    updates = updates[updates['datetime'] != ""].drop_duplicates(['symbol', 'datetime'])
+    return updates.sort_values('datetime', kind='stable', ignore_index=True)
+
+
+class SimTargetPos:
+    """
+        模拟TargetPosTask：set_target_volume时按当前对手价（买用卖一价、卖用买一价）立即全部成交
+    """
+
+    def __init__(self, api: "ReplayApi", symbol: str):
+        self._api = api
+        self._symbol = symbol
+
+    def set_target_volume(self, volume: int):
+        position = self._api.get_position(self._symbol)
+        diff = int(volume) - position.pos
+        if diff != 0:
+            self._api._fill(self._symbol, diff)
+
+
+class _ReplayClock:
+    """
+        只提供TqBacktest的_current_dt（纳秒）：当前回放到的行情时间，还没有wait_update时为第一条行情的时间
+
+        TqOption以此作为当前时间筛选未到期合约，与合约到期时间一样按本地时间解释行情时间字符串
+    """
+
+    def __init__(self, api: "ReplayApi"):
+        self._api = api
+
+    @property
+    def _current_dt(self) -> int:
+        times = self._api._times
+        if not times:
+            return int(time.time() * 1e9)
+        dt = times[max(self._api._step - 1, 0)]
+        return int(datetime.strptime(dt, "%Y-%m-%d %H:%M:%S.%f").timestamp() * 1e9)
+
+
+class _UpdateChan:
+    def __init__(self):
+        self._queue = asyncio.Queue()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._queue.get()
+
+
+class ReplayApi:
+    """
+        回放用的Api：实现OptionTrade、TqOption、ParityDispatcher用到的TqApi接口
+
+        每次wait_update()推进到下一个行情时间，更新该时间的全部合约行情，再运行create_task创建的task直到它们都处理完通知；
+        数据回放完后wait_update()抛出BacktestFinished，同TqBacktest。
+        speed为None时尽可能快地回放，否则按行情时间的speed倍速回放。
+    """
+
+    def __init__(self, contracts: dict, updates: pd.DataFrame, speed: float = None, commission: float = 0):
+        """
+
+            Args:
+
+                contracts (dict): {合约代码: 合约信息}，见dump_contracts
+
+                updates (pd.DataFrame): 行情更新：datetime（字符串，如"2020-02-03 09:00:00.500000"）、symbol及QUOTE_FIELDS中的字段
+
+                speed (float): 回放倍速，None为不等待
+
+                commission (float): 每手手续费
+
+        """
+        self._backtest = _ReplayClock(self)
+        self._data = {"quotes": dict()}
+        self.speed = speed
+        self.commission = commission
+        self._account = Account(self)
+        self._positions = dict()
+        for symbol, info in contracts.items():
+            quote = Quote(self)
+            for k, v in info.items():
+                if v is not None:
+                    setattr(quote, k, v)
+            quote.instrument_id = symbol
+            quote.expired = False
+            self._data["quotes"][symbol] = quote
+        updates = updates[updates['symbol'].isin(list(contracts.keys()))].sort_values('datetime', kind='stable')
+        # 第一步同TqApi的初始截面：各合约的第一条行情一起更新，之后按行情时间逐步推进
+        first = ~updates['symbol'].duplicated()
+        updates = pd.concat([updates[first], updates[~first]], ignore_index=True)
+        self._fields = [f for f in QUOTE_FIELDS if f in updates.columns]
+        datetimes = updates['datetime'].to_numpy()
+        n_first = int(first.sum())
+        rest = datetimes[n_first:]
+        starts = [0] if n_first else []
+        if len(rest):
+            starts += (n_first + np.flatnonzero(np.r_[True, rest[1:] != rest[:-1]])).tolist()
+        self._starts = starts + [len(datetimes)]  # 每一步在updates中的起始位置
+        self._times = [datetimes[i] for i in self._starts[:-1]]
+        self._datetimes = datetimes.tolist()
+        self._symbols = updates['symbol'].tolist()
+        self._values = [updates[f].tolist() for f in self._fields]
+        self._step = 0
+        self._changed = set()
+        self._loop = asyncio.new_event_loop()
+        self._tasks = []
+        self._chans = []  # [(合约代码set, _UpdateChan)]
+        self._wall_start = None
+        self.trades = []  # 成交记录
+
+    def get_quote(self, symbol: str) -> Quote:
+        return self._data["quotes"][symbol]
+
+    def get_account(self) -> Account:
+        return self._account
+
+    def get_position(self, symbol: str) -> Position:
+        position = self._positions.get(symbol, None)
+        if position is None:
+            position = Position(self)
+            position.instrument_id = symbol
+            self._positions[symbol] = position
+        return position
+
+    def create_task(self, coro):
+        task = self._loop.create_task(coro)
+        self._tasks.append(task)
+        return task
+
+    @asynccontextmanager
+    async def register_update_notify(self, objs):
+        chan = _UpdateChan()
+        entry = ({obj.instrument_id for obj in objs}, chan)
+        self._chans.append(entry)
+        try:
+            yield chan
+        finally:
+            self._chans.remove(entry)
+
+    def is_changing(self, obj, key=None) -> bool:
+        return getattr(obj, "instrument_id", None) in self._changed
+
+    def wait_update(self, deadline: float = None) -> bool:
+        """
+            推进到下一个行情时间，行情回放完时抛出BacktestFinished
+        """
+        self._run_tasks()  # 先让新创建的task注册行情通知
+        if self._step >= len(self._times):
+            raise BacktestFinished(self)
+        dt = self._times[self._step]
+        if self.speed is not None:
+            self._sleep_until(dt)
+        self._changed = set()
+        quotes = self._data["quotes"]
+        for i in range(self._starts[self._step], self._starts[self._step + 1]):
+            quote = quotes[self._symbols[i]]
+            for field, values in zip(self._fields, self._values):
+                setattr(quote, field, values[i])
+            quote.datetime = self._datetimes[i]
+            self._changed.add(self._symbols[i])
+        self._step += 1
+        for symbols, chan in self._chans:
+            if not symbols.isdisjoint(self._changed):
+                chan._queue.put_nowait(True)
+        self._run_tasks()
+        return True
+
+    def _sleep_until(self, dt: str):
+        tick_ts = pd.Timestamp(dt).value / 1e9
+        if self._wall_start is None:
+            self._wall_start = (time.monotonic(), tick_ts)
+        wait = self._wall_start[0] + (tick_ts - self._wall_start[1]) / self.speed - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def _run_tasks(self):
+        """
+            运行task直到全部行情通知都处理完
+        """
+        async def drain():
+            await asyncio.sleep(0)
+            while any(chan._queue.qsize() for _, chan in self._chans):
+                await asyncio.sleep(0)
+        self._loop.run_until_complete(drain())
+        for task in [t for t in self._tasks if t.done()]:
+            self._tasks.remove(task)
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    def _fill(self, symbol: str, volume: int):
+        quote = self.get_quote(symbol)
+        price = quote.ask_price1 if volume > 0 else quote.bid_price1
+        if price != price:
+            price = quote.last_price
+        position = self.get_position(symbol)
+        position.pos += volume
+        position.pos_long = max(position.pos, 0)
+        position.pos_short = max(-position.pos, 0)
+        self.trades.append({'datetime': quote.datetime, 'symbol': symbol, 'volume': volume, 'price': price,
+                            'commission': abs(volume) * self.commission})
+
+    def trade_df(self) -> pd.DataFrame:
+        """
+            成交记录
+        """
+        return pd.DataFrame(self.trades, columns=['datetime', 'symbol', 'volume', 'price', 'commission'])
+
+    def pnl(self) -> pd.DataFrame:
+        """
+            按最新价盯市的各合约盈亏
+
+            Return:
+
+                pd.DataFrame: symbol, pos, last_price, pnl（已扣手续费）
+
+        """
+        rows = []
+        trades = self.trade_df()
+        for symbol, group in trades.groupby('symbol', sort=True):
+            quote = self.get_quote(symbol)
+            pos = int(group['volume'].sum())
+            cash = -(group['volume'] * group['price']).sum() * quote.volume_multiple
+            rows.append({'symbol': symbol, 'pos': pos, 'last_price': quote.last_price,
+                         'pnl': cash + pos * quote.last_price * quote.volume_multiple - group['commission'].sum()})
+        return pd.DataFrame(rows, columns=['symbol', 'pos', 'last_price', 'pnl'])
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.sleep(0))
+        self._loop.close()
+
+
+def subscribe(api: ReplayApi, trade, opts: dict, future_id: str):
+    """
+        同OptionTrade.parity_quote_task，但TargetPosTask换成SimTargetPos：有dispatcher时登记到dispatcher，否则每个行权价一个quote_watcher
+    """
+    future_quote = api.get_quote(future_id)
+    future_target_pos = SimTargetPos(api, future_id)
+    for opt in opts.values():
+        call_quote = api.get_quote(opt['c'])
+        put_quote = api.get_quote(opt['p'])
+        trade.ledger.bind(future_id, future_target_pos, trade._option_multiplier)
+        trade.ledger.set_position(future_id, opt['K'], put_vol=api.get_position(opt['p']).pos, hedge=False)
+        call_target_pos = SimTargetPos(api, opt['c'])
+        put_target_pos = SimTargetPos(api, opt['p'])
+        if trade.dispatcher is not None:
+            trade.dispatcher.add(trade, opt['K'], future_quote, call_quote, put_quote, future_target_pos, call_target_pos, put_target_pos)
+        else:
+            api.create_task(trade.quote_watcher(future_quote, opt['K'], call_quote, put_quote, future_target_pos, call_target_pos, put_target_pos))
+
+
+def run(api: ReplayApi, scheduler=None, on_update=None):
+    """
+        回放全部行情
+
+        Args:
+
+            scheduler (EvalScheduler): OptionTrade使用scheduler时，每次wait_update之后flush
+
+            on_update: 每次wait_update之后的回调
+
+    """
+    try:
+        while True:
+            api.wait_update()
+            if scheduler is not None:
+                scheduler.flush()
+            if on_update is not None:
+                on_update()
+    except BacktestFinished:
+        pass
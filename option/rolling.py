@@ -0,0 +1,226 @@
+"""
+折溢价的滚动统计：每个行权价组最近window个tick的均值、方差、EWMA、最小/最大值，全部行权价存放在连续的数组里，每个tick增量更新
+"""
+import numpy as np
+
+#默认统计的折溢价字段
+ROLLING_FIELDS = ['premium_call', 'premium_put', 'premium_mid']
+#RollingStats._state最后一维的下标
+_MEAN, _M2, _MIN, _MAX, _EWMA, _EWM_VAR = range(6)
+
+
+class RollingStats:
+    """
+        多个行权价组、多个字段的滚动统计
+
+        mean/min/max/ewma/ewm_var/var的形状为(字段数, 组数)，底层按组连续存放。每次push：
+        均值、方差按滚动Welford公式O(1)更新，每滚动一圈由缓冲区重新计算一次，消除浮点累加误差；
+        最小/最大值只在移出的值恰好是当前最值时才扫描该组的缓冲区（均摊O(1)）；
+        EWMA和EW方差O(1)更新。某组的任一字段为nan时该tick不计入该组。
+    """
+
+    def __init__(self, n_groups: int, window: int, fields: list = ROLLING_FIELDS, alpha: float = None, min_periods: int = None):
+        """
+
+            Args:
+
+                n_groups (int): 行权价组数
+
+                window (int): 窗口长度（tick数）
+
+                fields (list): 统计的字段
+
+                alpha (float): EWMA的平滑系数，None为2 / (window + 1)
+
+                min_periods (int): 样本数不少于该值时threshold()才有值，None为window
+
+        """
+        self.fields = list(fields)
+        self.window = window
+        self.alpha = alpha if alpha is not None else 2 / (window + 1)
+        self.min_periods = min_periods if min_periods is not None else window
+        n_fields = len(self.fields)
+        # 按组连续存放：push一个组只需整行读写一次
+        self._buf = np.full((n_groups, n_fields, window), np.nan)  # 环形缓冲区
+        self._state = np.zeros((n_groups, n_fields, 6))  # 最后一维：_MEAN, _M2, _MIN, _MAX, _EWMA, _EWM_VAR
+        self._state[:, :, [_MEAN, _MIN, _MAX, _EWMA]] = np.nan
+        self._pos = np.zeros(n_groups, dtype=np.int64)  # 下一个写入位置
+        self.count = np.zeros(n_groups, dtype=np.int64)  # 窗口内样本数
+        self._since = np.zeros(n_groups, dtype=np.int64)  # 上次重新计算之后push的次数
+
+    def field(self, name: str) -> int:
+        return self.fields.index(name)
+
+    def _column(self, k: int) -> np.ndarray:
+        return self._state[:, :, k].T
+
+    @property
+    def mean(self) -> np.ndarray:
+        """
+            以下各统计量的形状均为(字段数, 组数)
+        """
+        return self._column(_MEAN)
+
+    @property
+    def min(self) -> np.ndarray:
+        return self._column(_MIN)
+
+    @property
+    def max(self) -> np.ndarray:
+        return self._column(_MAX)
+
+    @property
+    def ewma(self) -> np.ndarray:
+        return self._column(_EWMA)
+
+    @property
+    def ewm_var(self) -> np.ndarray:
+        return self._column(_EWM_VAR)
+
+    @property
+    def var(self) -> np.ndarray:
+        """
+            样本方差（ddof=1），样本数少于2时为nan
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count >= 2, np.maximum(self._column(_M2), 0) / (self.count - 1), np.nan)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.var)
+
+    def push(self, group: int, values):
+        """
+            追加一个组的一个tick，values与fields逐位对应
+        """
+        values = [float(v) for v in values]
+        if any(v != v for v in values):
+            return
+        pos = int(self._pos[group])
+        n_old = int(self.count[group])
+        full = n_old == self.window
+        n = n_old if full else n_old + 1
+        alpha = self.alpha
+        olds = self._buf[group, :, pos].tolist()
+        self._buf[group, :, pos] = values
+        state = self._state[group].tolist()
+        for f, x in enumerate(values):
+            old = olds[f]
+            mean_old, m2, lo, hi, e, ev = state[f]
+            if not n_old:
+                state[f] = [x, 0.0, x, x, x, 0.0]
+                continue
+            if full:
+                mean_new = mean_old + (x - old) / n
+                m2 += (x - old) * (x - mean_new + old - mean_old)
+            else:
+                mean_new = mean_old + (x - mean_old) / n
+                m2 += (x - mean_old) * (x - mean_new)
+            if full and ((old == lo and x > old) or (old == hi and x < old)):
+                row = self._buf[group, f]
+                lo, hi = float(row.min()), float(row.max())
+            else:
+                lo = x if x < lo else lo
+                hi = x if x > hi else hi
+            d = x - e
+            state[f] = [mean_new, m2, lo, hi, e + alpha * d, (1 - alpha) * (ev + alpha * d * d)]
+        self._state[group] = state
+        self._pos[group] = (pos + 1) % self.window
+        self.count[group] = n
+        self._since[group] += 1
+        if full and self._since[group] >= self.window:
+            self._resum(np.array([group]))
+
+    def push_many(self, groups: np.ndarray, values: np.ndarray):
+        """
+            一次追加多个组的一个tick，同push的批量版本
+
+            Args:
+
+                groups (np.ndarray): 组下标，不能重复
+
+                values (np.ndarray): 形状为(字段数, len(groups))
+
+        """
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values).any(axis=0)
+        g = np.asarray(groups)[valid]
+        x = values[:, valid].T  # (组数, 字段数)
+        if not len(g):
+            return
+        pos = self._pos[g]
+        n_old = self.count[g]
+        full = (n_old == self.window)[:, None]
+        first = (n_old == 0)[:, None]
+        n = np.where(n_old == self.window, n_old, n_old + 1)[:, None]
+        old = self._buf[g, :, pos]
+        self._buf[g, :, pos] = x
+        state = self._state[g]
+        mean_old = np.where(first, 0.0, state[:, :, _MEAN])
+        removed = np.where(full, old, mean_old)  # 窗口未满时没有移出的值，公式退化为普通Welford
+        mean_new = mean_old + (x - removed) / n
+        state[:, :, _M2] += (x - removed) * (x - mean_new + np.where(full, old - mean_old, 0.0))
+        state[:, :, _MEAN] = mean_new
+        lo, hi = state[:, :, _MIN], state[:, :, _MAX]
+        rescan = full & (((old == lo) & (x > old)) | ((old == hi) & (x < old)))
+        state[:, :, _MIN] = np.where(first, x, np.fmin(lo, x))
+        state[:, :, _MAX] = np.where(first, x, np.fmax(hi, x))
+        if rescan.any():
+            k_idx, f_idx = np.nonzero(rescan)
+            rows = self._buf[g[k_idx], f_idx]
+            state[k_idx, f_idx, _MIN] = rows.min(axis=1)
+            state[k_idx, f_idx, _MAX] = rows.max(axis=1)
+        e = state[:, :, _EWMA]
+        d = x - e
+        state[:, :, _EWM_VAR] = np.where(first, 0.0, (1 - self.alpha) * (state[:, :, _EWM_VAR] + self.alpha * d * d))
+        state[:, :, _EWMA] = np.where(first, x, e + self.alpha * d)
+        self._state[g] = state
+        self._pos[g] = (pos + 1) % self.window
+        self.count[g] = n[:, 0]
+        self._since[g] += 1
+        resum = g[full[:, 0] & (self._since[g] >= self.window)]
+        if len(resum):
+            self._resum(resum)
+
+    def _resum(self, groups: np.ndarray):
+        """
+            由缓冲区重新计算已满的组的均值和离差平方和
+        """
+        rows = self._buf[groups]
+        mean = rows.mean(axis=2)
+        self._state[groups, :, _MEAN] = mean
+        self._state[groups, :, _M2] = ((rows - mean[:, :, None]) ** 2).sum(axis=2)
+        self._since[groups] = 0
+
+    def threshold(self, name: str, z: float, groups=None):
+        """
+            自适应开仓临界值：均值 - z * 标准差，样本数不足min_periods时为nan
+
+            Args:
+
+                name (str): 字段
+
+                z (float): 标准差倍数
+
+                groups: 组下标（int或数组），None为全部组
+
+            Return:
+
+                int时为float，否则为np.ndarray
+
+        """
+        f = self.field(name)
+        if isinstance(groups, int):
+            # 单个组：on_quote每个tick调用，用标量运算
+            count = int(self.count[groups])
+            if count < max(self.min_periods, 2):
+                return np.nan
+            mean, m2 = self._state[groups, f, :2].tolist()
+            return mean - z * (max(m2, 0) / (count - 1)) ** 0.5
+        if groups is None:
+            groups = slice(None)
+        count = self.count[groups]
+        state = self._state[groups, f]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(np.maximum(state[..., _M2], 0) / (count - 1))
+            return np.where(count >= max(self.min_periods, 2), state[..., _MEAN] - z * std, np.nan)
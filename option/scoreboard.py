@@ -0,0 +1,149 @@
+"""
+套利机会排行：全部OptionTrade、全部行权价组的理论收益率放在一个带索引的最大堆里，每次计算后O(log n)更新，随时取前N名
+"""
+import heapq
+import math
+
+LONG_CALL = 1    # 买call、卖put、空期货
+LONG_PUT = -1    # 买put、卖call、多期货
+
+
+class Scoreboard:
+    """
+        套利机会排行榜
+
+        条目的键为(期货代码, 行权价, 方向)，分数为理论年化收益率。堆用数组存放，另有{键: 堆中位置}的索引，
+        同一条目的分数变化时原地上浮或下沉，为O(log n)；分数不大于min_score（含nan）时移出排行。
+        多个OptionTrade可以共用一个排行榜。
+    """
+
+    def __init__(self, min_score: float = 0.0):
+        """
+
+            Args:
+
+                min_score (float): 分数大于该值才进入排行
+
+        """
+        self.min_score = min_score
+        self._heap = []  # [[分数, 键, 附加信息]]，最大堆
+        self._index = dict()  # {键: 在_heap中的位置}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def update(self, future_id: str, strike_price: float, direction: int, score: float, info=None):
+        """
+            更新一个行权价组某方向的分数
+
+            Args:
+
+                future_id (str): 期货合约代码
+
+                strike_price (float): 行权价
+
+                direction (int): LONG_CALL或LONG_PUT
+
+                score (float): 理论年化收益率
+
+                info: 随条目保存的附加信息，如(行情时间, 折溢价, 保证金占用)
+
+        """
+        key = (future_id, strike_price, direction)
+        pos = self._index.get(key, None)
+        if not score > self.min_score or math.isinf(score):
+            if pos is not None:
+                self._remove_at(pos)
+            return
+        if pos is None:
+            self._heap.append([score, key, info])
+            self._index[key] = len(self._heap) - 1
+            self._sift_up(len(self._heap) - 1)
+            return
+        entry = self._heap[pos]
+        old = entry[0]
+        entry[0] = score
+        entry[2] = info
+        if score > old:
+            self._sift_up(pos)
+        elif score < old:
+            self._sift_down(pos)
+
+    def remove(self, future_id: str, strike_price: float = None):
+        """
+            移除某期货的条目，strike_price不为None时只移除该行权价
+        """
+        keys = [k for k in self._index if k[0] == future_id and (strike_price is None or k[1] == strike_price)]
+        for key in keys:
+            self._remove_at(self._index[key])
+
+    def get(self, future_id: str, strike_price: float, direction: int) -> float:
+        """
+            条目的当前分数，不在排行中返回None
+        """
+        pos = self._index.get((future_id, strike_price, direction), None)
+        return None if pos is None else self._heap[pos][0]
+
+    def top(self, n: int = 10) -> list:
+        """
+            分数最高的n个条目，不改变堆：从堆顶按分数展开子节点，O(n log n)
+
+            Return:
+
+                list: [(分数, 期货代码, 行权价, 方向, 附加信息)]，按分数降序
+
+        """
+        res = []
+        if not self._heap:
+            return res
+        heap = self._heap
+        candidates = [(-heap[0][0], 0)]
+        while candidates and len(res) < n:
+            _, pos = heapq.heappop(candidates)
+            score, key, info = heap[pos]
+            res.append((score, key[0], key[1], key[2], info))
+            for child in (2 * pos + 1, 2 * pos + 2):
+                if child < len(heap):
+                    heapq.heappush(candidates, (-heap[child][0], child))
+        return res
+
+    def _remove_at(self, pos: int):
+        heap = self._heap
+        del self._index[heap[pos][1]]
+        last = heap.pop()
+        if pos < len(heap):
+            heap[pos] = last
+            self._index[last[1]] = pos
+            self._sift_up(pos)
+            self._sift_down(self._index[last[1]])
+
+    def _swap(self, i: int, j: int):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._index[heap[i][1]] = i
+        self._index[heap[j][1]] = j
+
+    def _sift_up(self, pos: int):
+        heap = self._heap
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            if heap[pos][0] <= heap[parent][0]:
+                break
+            self._swap(pos, parent)
+            pos = parent
+
+    def _sift_down(self, pos: int):
+        heap = self._heap
+        n = len(heap)
+        while True:
+            largest = pos
+            for child in (2 * pos + 1, 2 * pos + 2):
+                if child < n and heap[child][0] > heap[largest][0]:
+                    largest = child
+            if largest == pos:
+                break
+            self._swap(pos, largest)
+            pos = largest
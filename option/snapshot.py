@@ -0,0 +1,109 @@
+"""
+合约信息快照：每个交易日把TqOption筛选出的期货、期权合约和到期日存为一个.npz文件，重启时直接读取，不再扫描全部合约
+"""
+import os
+import re
+import zipfile
+from datetime import date, datetime
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_path(directory: str, key: str, day: date) -> str:
+    """
+        快照文件路径：directory/交易日/key.npz
+    """
+    return os.path.join(directory, day.strftime("%Y%m%d"), re.sub(r"[^\w.\-]", "_", key) + ".npz")
+
+
+class ContractSnapshot:
+    """
+        一个TqOption的合约快照
+
+        只保存合约代码和到期日（到期日去重后存一次），合约的其余字段在加载时从api._data["quotes"]按代码取，
+        所以加载是O(快照合约数)而不是O(全部合约数)。
+    """
+
+    def __init__(self, future_symbols: list, option_symbols: list, expire_dts: dict, quote_count: int):
+        """
+
+            Args:
+
+                future_symbols (list): 期货合约代码
+
+                option_symbols (list): 期权合约代码
+
+                expire_dts (dict): {合约代码: 到期datetime}
+
+                quote_count (int): 生成快照时api._data["quotes"]的合约数，用于判断是否有新上市合约
+
+        """
+        self.future_symbols = list(future_symbols)
+        self.option_symbols = list(option_symbols)
+        self.expire_dts = expire_dts
+        self.quote_count = quote_count
+
+    @classmethod
+    def from_quotes(cls, futures: list, options: list, expire_dt, quote_count: int) -> "ContractSnapshot":
+        """
+            由筛选出的合约生成快照，expire_dt(quote)返回合约的到期datetime
+        """
+        expire_dts = {quote.instrument_id: expire_dt(quote) for quote in futures + options}
+        return cls([q.instrument_id for q in futures], [q.instrument_id for q in options], expire_dts, quote_count)
+
+    def save(self, path: str):
+        """
+            写入.npz文件，先写临时文件再改名，其他进程不会读到写了一半的文件
+        """
+        symbols = self.future_symbols + self.option_symbols
+        values = [self.expire_dts[s].timestamp() if self.expire_dts.get(s, None) is not None else np.nan for s in symbols]
+        expires, index = np.unique(np.array(values, dtype=np.float64), return_inverse=True)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, version=SNAPSHOT_VERSION, quote_count=self.quote_count, n_futures=len(self.future_symbols),
+                     symbols=np.array(symbols, dtype=str), expires=expires, expire_index=index.astype(np.int32))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ContractSnapshot":
+        """
+            读取.npz文件，文件不存在、版本不符或文件损坏时返回None（调用方重新扫描合约目录）
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != SNAPSHOT_VERSION:
+                    return None
+                symbols = data['symbols'].tolist()
+                n_futures = int(data['n_futures'])
+                expires = [None if v != v else datetime.fromtimestamp(v) for v in data['expires'].tolist()]
+                expire_dts = {s: expires[i] for s, i in zip(symbols, data['expire_index'].tolist())}
+                return cls(symbols[:n_futures], symbols[n_futures:], expire_dts, int(data['quote_count']))
+        except (OSError, ValueError, KeyError, IndexError, zipfile.BadZipFile):
+            return None
+
+    def resolve(self, api) -> (list, list):
+        """
+            按合约代码取api中的合约，去掉已不存在或已到期的合约
+
+            Return:
+
+                (期货Quote列表, 期权Quote列表)；api的合约数与快照时不同（可能有新上市合约）时返回None，需重新扫描合约目录
+
+        """
+        quotes = api._data.get("quotes", {})
+        if len(quotes) != self.quote_count:
+            return None
+
+        def live(symbols):
+            res = []
+            for symbol in symbols:
+                quote = quotes.get(symbol, None)
+                if quote is not None and quote.get("ins_class", "") and not quote.expired:
+                    res.append(quote)
+            return res
+        return live(self.future_symbols), live(self.option_symbols)
@@ -0,0 +1,167 @@
+"""
+    折溢价数据的落盘存储：按交易日、品种分区，追加写入内存映射的列式文件，后台线程写盘
+
+    目录结构：root/YYYYMMDD/品种/part-00000/列名.npy，columns.txt记录列顺序。YYYYMMDD为行情所属交易日（夜盘归下一交易日）。
+    每次写入追加一个part目录，先写到临时目录再改名，读取时不会读到写了一半的数据。
+"""
+import os
+import queue
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+from tradingday import tick_trading_day
+
+
+class ParityStore:
+    """
+        追加写入的列式存储
+
+        write()只把数据放入队列后立即返回，由后台线程写盘，主线程的wait_update不会被磁盘IO阻塞。
+    """
+
+    def __init__(self, root: str = "data", max_pending: int = 0):
+        """
+
+            Args:
+
+                root (str): 存储根目录
+
+                max_pending (int): 待写队列长度上限，0为不限
+
+        """
+        self.root = root
+        self._queue = queue.Queue(max_pending)
+        self._parts = dict()  # {分区目录: 下一个part序号}
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="ParityStore", daemon=True)
+        self._thread.start()
+
+    def write(self, date: str, product: str, columns: dict):
+        """
+            追加一块数据
+
+            Args:
+
+                date (str): 交易日，如20200214
+
+                product (str): 品种，如SR
+
+                columns (dict): {列名: np.ndarray}，各列等长，如ColumnRecorder.take()的返回值
+
+        """
+        if self._error is not None:
+            raise self._error
+        if columns and len(next(iter(columns.values()))) > 0:
+            self._queue.put((date, product, columns))
+
+    def write_records(self, product: str, columns: dict, time_column: str = "tq_time"):
+        """
+            追加一块数据，按time_column的行情时间所属交易日分区；跨交易日（如日盘到夜盘）的一块拆成多块写入
+
+            Args:
+
+                product (str): 品种，如SR
+
+                columns (dict): {列名: np.ndarray}，如ColumnRecorder.take()的返回值
+
+                time_column (str): 行情时间列，字符串如"2020-02-14 21:00:00.500000"；为空的行归入相邻行的交易日
+
+        """
+        if not columns or len(columns[time_column]) == 0:
+            return
+        hours, inverse = np.unique(np.asarray(columns[time_column]).astype("U13"), return_inverse=True)
+        days = np.array([tick_trading_day(hour) for hour in hours.tolist()], dtype=object)[inverse]
+        if (days == "").any():
+            # 行情时间为空的行（行情尚未到达）跟随前一行，开头的跟随第一个有时间的行
+            filled = pd.Series(days).replace("", np.nan).ffill().bfill()
+            if filled.isna().all():
+                raise ValueError("{}列全部为空，无法确定交易日".format(time_column))
+            days = filled.to_numpy(dtype=object)
+        unique_days = pd.unique(days)
+        if len(unique_days) == 1:
+            self.write(unique_days[0], product, columns)
+            return
+        for day in unique_days:
+            mask = days == day
+            self.write(day, product, {name: values[mask] for name, values in columns.items()})
+
+    def flush(self):
+        """
+            等待队列中的数据全部写完
+        """
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """
+            写完剩余数据并停止后台线程
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write_part(*item)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write_part(self, date: str, product: str, columns: dict):
+        partition = os.path.join(self.root, date, product)
+        if partition not in self._parts:
+            os.makedirs(partition, exist_ok=True)
+            self._parts[partition] = len([d for d in os.listdir(partition) if d.startswith("part-")])
+        part = os.path.join(partition, "part-{:05d}".format(self._parts[partition]))
+        tmp = os.path.join(partition, ".tmp-" + os.path.basename(part))
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        for name, values in columns.items():
+            np.save(os.path.join(tmp, name + ".npy"), np.asarray(values))
+        with open(os.path.join(tmp, "columns.txt"), "w") as f:
+            f.write("\n".join(columns.keys()))
+        os.rename(tmp, part)
+        self._parts[partition] += 1
+
+
+def read_day(root: str, date: str, product: str, columns: list = None) -> pd.DataFrame:
+    """
+        读取某日某品种的全部数据，只打开该分区下的文件
+
+        Args:
+
+            root (str): 存储根目录
+
+            date (str): 日期，如20200214
+
+            product (str): 品种，如SR
+
+            columns (list): 只读取这些列，None为全部
+
+    """
+    partition = os.path.join(root, date, product)
+    if not os.path.isdir(partition):
+        return pd.DataFrame()
+    parts = sorted(d for d in os.listdir(partition) if d.startswith("part-"))
+    data = dict()
+    for part in parts:
+        path = os.path.join(partition, part)
+        if columns is not None:
+            names = columns
+        else:
+            with open(os.path.join(path, "columns.txt")) as f:
+                names = f.read().split("\n")
+        for name in names:
+            data.setdefault(name, []).append(np.load(os.path.join(path, name + ".npy"), mmap_mode="r"))
+    return pd.DataFrame({name: np.concatenate(arrays) for name, arrays in data.items()})
@@ -0,0 +1,32 @@
+"""
+    交易日：夜盘（18点之后）归下一个工作日，周末顺延到周一，不考虑节假日
+"""
+from datetime import date, datetime, timedelta
+
+_tick_days = dict()  # {行情时间的小时前缀: 交易日字符串}
+_TICK_DAYS_CACHE_SIZE = 4096
+
+
+def trading_day(now: datetime) -> date:
+    """
+        datetime所属交易日：18点之后算下一交易日，周末顺延到周一
+    """
+    day = now.date() + timedelta(days=1) if now.hour >= 18 else now.date()
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def tick_trading_day(dt: str) -> str:
+    """
+        行情时间字符串（如"2017-07-26 23:04:21.000001"）所属交易日，如"20170727"；按小时前缀缓存，空字符串返回""
+    """
+    hour = dt[:13]
+    day = _tick_days.get(hour, None)
+    if day is None:
+        if not dt:
+            return ""
+        if len(_tick_days) >= _TICK_DAYS_CACHE_SIZE:
+            _tick_days.clear()
+        day = _tick_days[hour] = trading_day(datetime.strptime(hour, "%Y-%m-%d %H")).strftime("%Y%m%d")
+    return day
@@ -1,6 +1,11 @@
+import os
+import sys
+
 from tqsdk import TqApi, TqAccount, TqBacktest, BacktestFinished
 from tqsdk.lib import TargetPosTask
-from tqsdk.tafunc import ma, crossup, crossdown
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ta"))
+from tafunc_incremental import IncrementalMA, CrossDetector, KlineCursor
 
 __author__ = "Y.M.Wong"
 
@@ -29,18 +34,23 @@ api = TqApi(backtest=TqBacktest(date(2019, 7, 1), date(2019, 12, 1)), web_gui=Tr
 symbol = "CFFEX.IF1912"
 klines = api.get_kline_serial(symbol, 60 * 15)  # 订阅15分钟K线序列
 target_pos = TargetPosTask(api, symbol)
+# 增量计算的均线和穿越，每次更新只处理变化的K线
+ma10, ma20, ma120 = IncrementalMA(10), IncrementalMA(20), IncrementalMA(120)
+cross = CrossDetector()
+cursor = KlineCursor()
 try:
     while True:
         api.wait_update()
         if api.is_changing(klines):
+            for close, new_bar in cursor.updates(klines, "close"):
+                ma120.update(close, new_bar)
+                cross.update(ma10.update(close, new_bar), ma20.update(close, new_bar), new_bar)
             # MA120的最新值
-            ma120 = ma(klines.close, 120).iloc[-1]
-            # MA10上穿MA20的bool序列的最新值
-            up_cross = crossup(ma(klines.close, 10), ma(klines.close, 20)).iloc[-1]
-            # MA10下穿MA20的bool序列的最新值
-            down_cross = crossdown(ma(klines.close, 10), ma(klines.close, 20)).iloc[-1]
+            ma120_value = ma120.value
+            # MA10上穿、下穿MA20的最新值
+            up_cross, down_cross = cross.up, cross.down
             # 如果最新K线收盘价在MA120上方
-            if klines.close.iloc[-1] > ma120:
+            if klines.close.iloc[-1] > ma120_value:
                 # 如果MA10上穿MA20，开一手
                 if up_cross:
                     target_pos.set_target_volume(1)
@@ -0,0 +1,206 @@
+"""
+三均线策略的离线参数扫描：读本地K线文件，向量化回测(快线, 慢线, 趋势线, K线周期, 合约)的全部组合，多进程并行
+
+规则同triple_ma.py：收盘价在趋势线之上时快线上穿慢线做多、下穿平多；之下时快线下穿慢线做空、上穿平空。
+信号在K线收盘时计算，下一根K线开盘价成交。
+
+K线文件为csv，文件名（去掉扩展名）为合约代码，字段为datetime、open、close（或DataDownloader导出的"合约代码.open"等），
+所有文件须为同一基础周期（如1分钟），更大的周期由基础K线合成。
+合成后的K线存为.npy，各进程以mmap方式只读打开，同一份数据在进程间共享而不复制。
+
+python triple_ma_sweep.py kline_dir --bars 300 900 1800 --fast 5 10 15 --slow 20 30 60 --trend 60 120 240 --output sweep.csv
+"""
+import argparse
+import glob
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+#交易所时间为北京时间，按北京时间切分K线
+_CST_OFFSET_NS = 8 * 3600 * 1_000_000_000
+
+
+def read_klines(path: str) -> dict:
+    """
+        读取一个K线csv文件
+
+        Return:
+
+            dict: {'datetime': 纳秒时间戳, 'open': np.ndarray, 'close': np.ndarray}
+
+    """
+    df = pd.read_csv(path)
+    symbol = os.path.splitext(os.path.basename(path))[0]
+    res = dict()
+    for name in ("open", "close"):
+        column = name if name in df.columns else "{}.{}".format(symbol, name)
+        res[name] = df[column].to_numpy(dtype=np.float64)
+    dt = df["datetime"]
+    res["datetime"] = dt.to_numpy(dtype=np.int64) if np.issubdtype(dt.dtype, np.integer) else pd.to_datetime(dt).to_numpy().astype(np.int64)
+    valid = ~(np.isnan(res["open"]) | np.isnan(res["close"]))
+    return {k: v[valid] for k, v in res.items()}
+
+
+def resample(klines: dict, duration: int) -> dict:
+    """
+        由基础K线合成duration秒的K线，开盘价取第一根、收盘价取最后一根
+    """
+    bucket = (klines["datetime"] + _CST_OFFSET_NS) // (duration * 1_000_000_000)
+    starts = np.flatnonzero(np.diff(bucket, prepend=bucket[:1] - 1))
+    ends = np.append(starts[1:], len(bucket)) - 1
+    return {'datetime': klines["datetime"][starts], 'open': klines["open"][starts], 'close': klines["close"][ends]}
+
+
+def moving_average(close: np.ndarray, n: int) -> np.ndarray:
+    """
+        同tafunc.ma，前n-1个为nan
+    """
+    res = np.full(len(close), np.nan)
+    if 0 < n <= len(close):
+        cumsum = np.concatenate([[0.0], np.cumsum(close)])
+        res[n - 1:] = (cumsum[n:] - cumsum[:-n]) / n
+    return res
+
+
+def backtest(open_: np.ndarray, close: np.ndarray, ma_fast: np.ndarray, ma_slow: np.ndarray, ma_trend: np.ndarray, volume_multiple: float = 1, cost: float = 0) -> dict:
+    """
+        向量化回测一组参数
+
+        Args:
+
+            open_, close (np.ndarray): K线开盘价、收盘价
+
+            ma_fast, ma_slow, ma_trend (np.ndarray): 快线、慢线、趋势线
+
+            volume_multiple (float): 合约乘数
+
+            cost (float): 每手每次成交的费用（手续费+滑点），单位为价格
+
+        Return:
+
+            dict: pnl, max_drawdown, trades(成交次数), lots(成交手数), long_bars, short_bars
+
+    """
+    with np.errstate(invalid="ignore"):
+        up = (ma_fast[1:] > ma_slow[1:]) & (ma_fast[:-1] <= ma_slow[:-1])
+        down = (ma_fast[1:] < ma_slow[1:]) & (ma_fast[:-1] >= ma_slow[:-1])
+        above = close[1:] > ma_trend[1:]
+    up = np.concatenate([[False], up])
+    down = np.concatenate([[False], down])
+    above = np.concatenate([[False], above])
+    # 有信号的K线给出目标持仓，其余K线沿用之前的目标持仓
+    target = np.select([above & up, above & down, ~above & down, ~above & up], [1.0, 0.0, -1.0, 0.0], np.nan)
+    target = pd.Series(target).ffill().fillna(0).to_numpy()
+    # 第i根K线收盘的目标持仓在第i+1根K线开盘成交
+    held = np.concatenate([[0.0], target[:-1]])
+    prev_held = np.concatenate([[0.0], held[:-1]])
+    prev_close = np.concatenate([[close[0]], close[:-1]])
+    change = np.abs(held - prev_held)
+    pnl = (prev_held * (open_ - prev_close) + held * (close - open_)) * volume_multiple - change * cost
+    equity = np.cumsum(pnl)
+    drawdown = np.maximum.accumulate(np.maximum(equity, 0)) - equity
+    return {
+        'pnl': float(equity[-1]) if len(equity) else 0.0,
+        'max_drawdown': float(drawdown.max()) if len(drawdown) else 0.0,
+        'trades': int(np.count_nonzero(change)),
+        'lots': float(change.sum()),
+        'long_bars': int(np.count_nonzero(held > 0)),
+        'short_bars': int(np.count_nonzero(held < 0)),
+    }
+
+
+def _run_task(path: str, symbol: str, bar: int, params: list, volume_multiple: float, cost: float) -> list:
+    """
+        进程池任务：同一合约、同一周期的一批参数，各周期的均线只算一次
+    """
+    klines = np.load(path, mmap_mode="r")  # [open, close]，进程间共享
+    open_, close = klines[0], klines[1]
+    mas = dict()
+    for n in {n for param in params for n in param}:
+        mas[n] = moving_average(close, n)
+    rows = []
+    for fast, slow, trend in params:
+        res = backtest(open_, close, mas[fast], mas[slow], mas[trend], volume_multiple, cost)
+        rows.append(dict(symbol=symbol, bar=bar, fast=fast, slow=slow, trend=trend, bars=len(close), **res))
+    return rows
+
+
+def sweep(files: list, bars: list, fast: list, slow: list, trend: list, volume_multiple: float = 1, cost: float = 0, workers: int = None, batch: int = 64) -> pd.DataFrame:
+    """
+        参数扫描
+
+        Args:
+
+            files (list): K线csv文件
+
+            bars (list): K线周期（秒），须为基础K线周期的整数倍
+
+            fast, slow, trend (list): 快线、慢线、趋势线周期，只保留fast < slow的组合
+
+            volume_multiple (float): 合约乘数
+
+            cost (float): 每手每次成交的费用，单位为价格
+
+            workers (int): 进程数，None为cpu核数
+
+            batch (int): 每个任务的参数组合数
+
+        Return:
+
+            pd.DataFrame: 每个组合一行，按pnl降序
+
+    """
+    params = [p for p in itertools.product(fast, slow, trend) if p[0] < p[1]]
+    tmp_dir = tempfile.mkdtemp(prefix="triple_ma_sweep_")
+    try:
+        tasks = []
+        for file in files:
+            symbol = os.path.splitext(os.path.basename(file))[0]
+            klines = read_klines(file)
+            for bar in bars:
+                resampled = resample(klines, bar)
+                path = os.path.join(tmp_dir, "{}_{}.npy".format(symbol, bar))
+                np.save(path, np.stack([resampled["open"], resampled["close"]]))
+                for i in range(0, len(params), batch):
+                    tasks.append((path, symbol, bar, params[i:i + batch], volume_multiple, cost))
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for res in executor.map(_run_task, *zip(*tasks)):
+                rows += res
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    columns = ['symbol', 'bar', 'fast', 'slow', 'trend', 'bars', 'pnl', 'max_drawdown', 'trades', 'lots', 'long_bars', 'short_bars']
+    return pd.DataFrame(rows, columns=columns).sort_values("pnl", ascending=False, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="三均线策略离线参数扫描")
+    parser.add_argument("kline_dir", help="K线csv目录，文件名为合约代码")
+    parser.add_argument("--symbols", nargs="*", help="只扫描这些合约，默认目录下全部")
+    parser.add_argument("--bars", nargs="+", type=int, default=[900], help="K线周期（秒）")
+    parser.add_argument("--fast", nargs="+", type=int, default=[10], help="快线周期")
+    parser.add_argument("--slow", nargs="+", type=int, default=[20], help="慢线周期")
+    parser.add_argument("--trend", nargs="+", type=int, default=[120], help="趋势线周期")
+    parser.add_argument("--volume-multiple", type=float, default=1, help="合约乘数")
+    parser.add_argument("--cost", type=float, default=0, help="每手每次成交的费用，单位为价格")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认cpu核数")
+    parser.add_argument("--output", default="triple_ma_sweep.csv", help="结果csv文件")
+    args = parser.parse_args()
+    files = sorted(glob.glob(os.path.join(args.kline_dir, "*.csv")))
+    if args.symbols:
+        files = [f for f in files if os.path.splitext(os.path.basename(f))[0] in args.symbols]
+    start = time.time()
+    results = sweep(files, args.bars, args.fast, args.slow, args.trend, args.volume_multiple, args.cost, args.workers)
+    results.to_csv(args.output, index=False)
+    print("combinations:{} seconds:{:.1f}".format(len(results), time.time() - start))
+    print(results.head(20).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+增量指标：每次K线更新或新增一根K线时O(1)更新，开销与K线序列长度无关
+
+结果与tqsdk.tafunc对整个序列计算后取最后一个值相同：
+IncrementalMA对应ma(series, n).iloc[-1]，CrossDetector对应crossup/crossdown(a, b).iloc[-1]。
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+
+class IncrementalMA:
+    """
+        n周期简单移动平均，同tafunc.ma：窗口内不足n个有效值时为nan
+    """
+
+    def __init__(self, n: int):
+        """
+
+            Args:
+
+                n (int): 周期
+
+        """
+        self.n = n
+        self._window = [math.nan] * n  # 环形缓冲区，保存最近n根K线的值
+        self._pos = -1  # 最新一根K线在_window中的位置
+        self._sum = 0.0  # 窗口内有效值之和
+        self._nan = n  # 窗口内nan的个数
+        self._pushes = 0
+        self.value = math.nan
+
+    def update(self, value: float, new_bar: bool = True) -> float:
+        """
+            new_bar为True时追加一根K线，否则更新最新一根K线的值
+
+            Return:
+
+                float: 最新的移动平均值
+
+        """
+        if self.n <= 0:
+            return self.value
+        if new_bar:
+            self._pos = (self._pos + 1) % self.n
+            self._pushes += 1
+        self._remove(self._window[self._pos])
+        self._window[self._pos] = value
+        self._add(value)
+        if new_bar and self._pushes % self.n == 0:
+            # 每滚动一圈重新求和，消除浮点累加误差
+            valid = [v for v in self._window if not math.isnan(v)]
+            self._sum = math.fsum(valid)
+        self.value = self._sum / self.n if self._nan == 0 else math.nan
+        return self.value
+
+    def _add(self, value: float):
+        if math.isnan(value):
+            self._nan += 1
+        else:
+            self._sum += value
+
+    def _remove(self, value: float):
+        if math.isnan(value):
+            self._nan -= 1
+        else:
+            self._sum -= value
+
+
+class CrossDetector:
+    """
+        a、b两个序列的穿越：up同crossup(a, b).iloc[-1]，down同crossdown(a, b).iloc[-1]
+    """
+
+    def __init__(self):
+        self._prev = (math.nan, math.nan)  # 上一根K线的(a, b)
+        self._last = (math.nan, math.nan)  # 最新一根K线的(a, b)
+        self.up = False
+        self.down = False
+
+    def update(self, a: float, b: float, new_bar: bool = True) -> tuple:
+        """
+            new_bar为True时追加一根K线，否则更新最新一根K线的值
+
+            Return:
+
+                (bool, bool): (上穿, 下穿)
+
+        """
+        if new_bar:
+            self._prev = self._last
+        self._last = (a, b)
+        prev_a, prev_b = self._prev
+        self.up = a > b and prev_a <= prev_b
+        self.down = a < b and prev_a >= prev_b
+        return self.up, self.down
+
+
+class KlineCursor:
+    """
+        记录已处理到的K线id，每次只取出变化的最后一根K线和新增的K线
+    """
+
+    def __init__(self):
+        self.last_id = None
+
+    def updates(self, klines: pd.DataFrame, column: str = "close") -> list:
+        """
+            自上次调用以来的更新，在wait_update之后调用
+
+            Return:
+
+                list: [(值, 是否新K线)]，先是上次最后一根K线的最终值，再是依次新增的K线
+
+        """
+        ids = klines["id"].values
+        if len(ids) == 0 or not ids[-1] >= 0:
+            return []
+        last_id = int(ids[-1])
+        if self.last_id is None:
+            start = int(np.argmax(ids >= 0))  # 序列开头尚无数据的位置id为nan或负数
+        else:
+            start = len(ids) - 1 - (last_id - self.last_id)
+        values = klines[column].values
+        res = []
+        if start >= 0 and self.last_id is not None:
+            res.append((float(values[start]), False))
+            start += 1
+        start = max(start, 0)
+        res += [(v, True) for v in values[start:].tolist()]
+        self.last_id = last_id
+        return res
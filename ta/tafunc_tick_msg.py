@@ -1,4 +1,5 @@
 __author__ = 'y.m.wong'
+import numpy as np
 import pandas as pd
 """
 由https://github.com/shinnytech/shinny-futures-web/blob/master/src/components/TicksList.vue改写而来
@@ -43,9 +44,35 @@ def cal_msg(tick:dict) -> str:
             msg = ('多' if tick['pc'] > 0 else '空') + ('开' if tick['oi_diff'] > 0 else '平' if tick['oi_diff'] < 0 else '换')
     return msg
 
-def cal_ticks_msg(ticks: pd.Series) -> pd.DataFrame:
+#成交性质，下标即msg的整数编码
+MSG_CATEGORIES = ['双开', '双平', '换手', '多开', '多平', '多换', '空开', '空平', '空换']
+
+
+def cal_pc_codes(trade_ask_spread: np.ndarray, trade_bid_spread: np.ndarray, price_diff: np.ndarray) -> np.ndarray:
+    """
+    cal_pc的向量版本
+    :return: pc值数组
+    """
+    return np.select([trade_ask_spread >= 0, trade_bid_spread >= 0, price_diff > 0, price_diff < 0], [1, -1, 1, -1], 0)
+
+
+def cal_msg_codes(oi_diff: np.ndarray, vol_diff: np.ndarray, pc: np.ndarray) -> np.ndarray:
+    """
+    cal_msg的向量版本
+    :return: 成交性质在MSG_CATEGORIES中的下标数组
+    """
+    # 多/空 * 3 + 开/平/换
+    directional = np.where(pc > 0, 3, 6) + np.select([oi_diff > 0, oi_diff < 0], [0, 1], 2)
+    return np.select([(oi_diff > 0) & (oi_diff == vol_diff), (oi_diff < 0) & (oi_diff + vol_diff == 0), pc == 0],
+                     [0, 1, 2], directional).astype(np.int8)
+
+
+def cal_ticks_msg(ticks: pd.Series, categorical: bool = True) -> pd.DataFrame:
     """
         主函数：计算仓单“开平”字段
+
+        逐项等价于对每行调用cal_pc、cal_msg，但全部用numpy向量运算
+        :param categorical: msg列为分类类型（取值同cal_msg），False则为字符串
     """
     ticks_ex = pd.DataFrame()
     ticks_ex['datetime'] = ticks["datetime"]
@@ -54,10 +81,115 @@ def cal_ticks_msg(ticks: pd.Series) -> pd.DataFrame:
     ticks_ex['price_diff'] = ticks["last_price"].diff()
     ticks_ex['trade_ask_spread'] = ticks["last_price"] - ticks["ask_price1"].shift(1)
     ticks_ex['trade_bid_spread'] = ticks["last_price"] - ticks["bid_price1"].shift(1)
-    ticks_ex['pc'] = ticks_ex.apply(lambda tick: cal_pc(dict(tick)), axis=1)
-    ticks_ex['msg'] = ticks_ex.apply(lambda tick: cal_msg(dict(tick)), axis=1)
+    pc = cal_pc_codes(ticks_ex['trade_ask_spread'].to_numpy(), ticks_ex['trade_bid_spread'].to_numpy(), ticks_ex['price_diff'].to_numpy())
+    codes = cal_msg_codes(ticks_ex['oi_diff'].to_numpy(), ticks_ex['vol_diff'].to_numpy(), pc)
+    ticks_ex['pc'] = pc
+    msg = pd.Categorical.from_codes(codes, categories=MSG_CATEGORIES)
+    ticks_ex['msg'] = msg if categorical else np.asarray(msg, dtype=object)
     return ticks_ex
 
+def cal_msg_codes_after(prev, volume: np.ndarray, open_interest: np.ndarray, last_price: np.ndarray, bid_price1: np.ndarray, ask_price1: np.ndarray) -> tuple:
+    """
+    计算紧接在prev之后的一段tick的成交性质，用于分段计算长序列
+    :param prev: 上一段最后一笔tick的(volume, open_interest, last_price, bid_price1, ask_price1)，None表示序列开头
+    :return: (pc数组, msg编码数组, 本段最后一笔tick的prev)
+    """
+    columns = [np.asarray(c, dtype=np.float64) for c in (volume, open_interest, last_price, bid_price1, ask_price1)]
+    prev = prev if prev is not None else [np.nan] * 5
+    volume, open_interest, last_price, bid_price1, ask_price1 = [np.concatenate([[p], c]) for p, c in zip(prev, columns)]
+    pc = cal_pc_codes(last_price[1:] - ask_price1[:-1], last_price[1:] - bid_price1[:-1], np.diff(last_price))
+    codes = cal_msg_codes(np.diff(open_interest), np.diff(volume), pc)
+    return pc, codes, [c[-1] for c in columns]
+
+
+class TickMsgClassifier:
+    """
+        增量计算tick成交性质：保存上一笔tick的成交量、持仓量、最新价和买一卖一价，
+        每次只计算tick序列中新追加的tick，单次开销与序列长度无关。
+
+        结果写入环形缓冲区（最近capacity笔），并可回调callback(dict)，dict为{id, datetime, pc, msg}的数组。
+        两次update之间新tick数超过序列长度（漏了tick）或id不连续时，丢弃上一笔tick的状态，从当前整段序列重新计算，gaps计数加一。
+    """
+
+    def __init__(self, capacity: int = 10000, callback=None):
+        """
+        :param capacity: 环形缓冲区保留的tick数
+        :param callback: 每次有新tick时回调，参数为{id, datetime, pc, msg(MSG_CATEGORIES下标)}
+        """
+        self.capacity = capacity
+        self.callback = callback
+        self.last_id = None
+        self._prev = None  # 上一笔tick的(volume, open_interest, last_price, bid_price1, ask_price1)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._datetimes = np.zeros(capacity, dtype=np.int64)
+        self._pcs = np.zeros(capacity, dtype=np.int8)
+        self._codes = np.zeros(capacity, dtype=np.int8)
+        self._count = 0  # 累计写入的tick数
+        self.gaps = 0  # 检测到漏tick、重新计算的次数
+
+    def update(self, ticks: pd.DataFrame) -> int:
+        """
+        计算get_tick_serial中新追加的tick，在wait_update之后调用
+        :param ticks: tick序列，需含id、datetime、volume、open_interest、last_price、bid_price1、ask_price1
+        :return: 本次计算的tick数
+        """
+        ids = ticks["id"].values
+        if len(ids) == 0 or not ids[-1] >= 0:
+            return 0
+        new = len(ids) if self.last_id is None else int(ids[-1] - self.last_id)
+        if new == 0:
+            return 0
+        if new < 0 or new > len(ids):
+            # 新tick超过序列长度（两次update之间漏了tick）或序列重建：整段重新计算，update_arrays按id不连续重置状态
+            new = len(ids)
+        start = len(ids) - new
+        valid = ids[start:] >= 0  # 序列开头尚无数据的位置id为nan或负数
+        columns = [ticks[name].values[start:][valid] for name in ("volume", "open_interest", "last_price", "bid_price1", "ask_price1")]
+        return self.update_arrays(ids[start:][valid], ticks["datetime"].values[start:][valid], *columns)
+
+    def update_arrays(self, ids: np.ndarray, datetimes: np.ndarray, volume: np.ndarray, open_interest: np.ndarray, last_price: np.ndarray, bid_price1: np.ndarray, ask_price1: np.ndarray) -> int:
+        """
+        按列计算一批按时间顺序紧接上一批的tick；第一笔的id与上一批最后一笔不连续时视为漏了tick，这一批从头计算
+        :return: 本次计算的tick数
+        """
+        n = len(ids)
+        if n == 0:
+            return 0
+        if self.last_id is not None and int(ids[0]) != self.last_id + 1:
+            self._prev = None
+            self.gaps += 1
+        pc, codes, self._prev = cal_msg_codes_after(self._prev, volume, open_interest, last_price, bid_price1, ask_price1)
+        self.last_id = int(ids[-1])
+        self._write(np.asarray(ids, dtype=np.int64), np.asarray(datetimes).astype(np.int64), pc.astype(np.int8), codes)
+        if self.callback is not None:
+            self.callback({'id': ids, 'datetime': datetimes, 'pc': pc, 'msg': codes})
+        return n
+
+    def _write(self, ids: np.ndarray, datetimes: np.ndarray, pcs: np.ndarray, codes: np.ndarray):
+        if len(ids) > self.capacity:
+            ids, datetimes, pcs, codes = ids[-self.capacity:], datetimes[-self.capacity:], pcs[-self.capacity:], codes[-self.capacity:]
+        positions = (self._count + np.arange(len(ids))) % self.capacity
+        self._ids[positions] = ids
+        self._datetimes[positions] = datetimes
+        self._pcs[positions] = pcs
+        self._codes[positions] = codes
+        self._count += len(ids)
+
+    def recent(self, n: int = None) -> pd.DataFrame:
+        """
+        最近n笔（默认缓冲区内全部）tick的成交性质，按时间顺序
+        """
+        size = min(self._count, self.capacity)
+        n = size if n is None else min(n, size)
+        positions = (self._count - n + np.arange(n)) % self.capacity
+        return pd.DataFrame({
+            'id': self._ids[positions],
+            'datetime': self._datetimes[positions],
+            'pc': self._pcs[positions].astype(np.int64),
+            'msg': pd.Categorical.from_codes(self._codes[positions], categories=MSG_CATEGORIES),
+        })
+
+
 """
 demo:
 from tqsdk import TqApi, TqBacktest, BacktestFinished
@@ -66,9 +198,9 @@ from tqsdk.tafunc import time_to_datetime
 
 api = TqApi(backtest=TqBacktest(datetime(2020,2,11,14,59,55),datetime(2020,2,11,15,00)))
 ticks = api.get_tick_serial('DCE.j2005')
-test = pd.DataFrame()
+classifier = TickMsgClassifier()
 while True:
     api.wait_update()
-    test = cal_ticks_ex(ticks)
-    print(test)
+    if classifier.update(ticks):     # 只计算新追加的tick
+        print(classifier.recent(10))
 """
\ No newline at end of file
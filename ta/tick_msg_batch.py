@@ -0,0 +1,174 @@
+"""
+批量计算历史tick文件的成交性质（开平）
+
+每个文件（一个合约的tick序列）按块流式读取，块与块之间衔接上一块最后一笔tick，结果与整个序列一次调用cal_ticks_msg相同；
+每个进程同时只持有一块数据，内存有上界；文件之间互不依赖，用进程池并行，速度随核数线性增长。
+
+python tick_msg_batch.py ticks_dir output_dir --workers 8
+"""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from tafunc_tick_msg import MSG_CATEGORIES, cal_msg_codes_after
+
+#计算所需的字段
+TICK_COLUMNS = ['volume', 'open_interest', 'last_price', 'bid_price1', 'ask_price1']
+_MSG_NAMES = np.array(MSG_CATEGORIES, dtype=object)
+
+
+def _read_csv(path: str, chunksize: int):
+    yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def _read_parquet(path: str, chunksize: int):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("读取parquet文件需要安装pyarrow")
+    # memory_map避免把整个文件读入内存，按row group分批解码
+    for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunksize):
+        yield batch.to_pandas()
+
+
+class _CsvWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._header = True
+
+    def write(self, df: pd.DataFrame):
+        df.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        pass
+
+
+class _ParquetWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = None
+
+    def write(self, df: pd.DataFrame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+_READERS = {'.csv': _read_csv, '.parquet': _read_parquet}
+_WRITERS = {'.csv': _CsvWriter, '.parquet': _ParquetWriter}
+
+
+def classify_file(src: str, dst: str, chunksize: int = 500000) -> int:
+    """
+        流式计算一个tick文件的成交性质，在原字段后追加pc、msg两列写入dst
+
+        Args:
+
+            src (str): tick文件（.csv或.parquet），字段同get_tick_serial，按时间排序
+
+            dst (str): 输出文件（.csv或.parquet），先写入临时文件，完成后再改名
+
+            chunksize (int): 每块行数
+
+        Return:
+
+            int: tick数
+
+    """
+    read = _READERS[os.path.splitext(src)[1].lower()]
+    tmp = dst + ".tmp"
+    writer = _WRITERS[os.path.splitext(dst)[1].lower()](tmp)
+    prev = None
+    count = 0
+    try:
+        for chunk in read(src, chunksize):
+            if len(chunk) == 0:
+                continue
+            pc, codes, prev = cal_msg_codes_after(prev, *[chunk[name].to_numpy() for name in TICK_COLUMNS])
+            chunk['pc'] = pc
+            chunk['msg'] = _MSG_NAMES[codes]
+            writer.write(chunk)
+            count += len(chunk)
+    finally:
+        writer.close()
+    os.replace(tmp, dst)
+    return count
+
+
+def _output_path(src: str, src_dir: str, dst_dir: str, fmt: str) -> str:
+    name = os.path.splitext(os.path.relpath(src, src_dir))[0] + "." + (fmt or os.path.splitext(src)[1].lstrip("."))
+    return os.path.join(dst_dir, name)
+
+
+def classify_dir(src_dir: str, dst_dir: str, workers: int = None, chunksize: int = 500000, fmt: str = None, skip_existing: bool = True) -> dict:
+    """
+        用进程池批量计算目录下全部tick文件（递归），输出到dst_dir下的相同相对路径
+
+        Args:
+
+            src_dir (str): tick文件目录
+
+            dst_dir (str): 输出目录
+
+            workers (int): 进程数，None为cpu核数
+
+            chunksize (int): 每块行数，每个进程的内存占用约与之成正比
+
+            fmt (str): 输出格式csv/parquet，None为同输入
+
+            skip_existing (bool): 跳过已有输出的文件，便于中断后续跑
+
+        Return:
+
+            dict: {文件: tick数}
+
+    """
+    files = sorted(f for ext in _READERS for f in glob.glob(os.path.join(src_dir, "**", "*" + ext), recursive=True))
+    # 大文件先算，减少最后只剩一个进程在跑的时间
+    files.sort(key=os.path.getsize, reverse=True)
+    jobs = dict()
+    for src in files:
+        dst = _output_path(src, src_dir, dst_dir, fmt)
+        if skip_existing and os.path.exists(dst):
+            continue
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        jobs[src] = dst
+    results = dict()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(classify_file, src, dst, chunksize): src for src, dst in jobs.items()}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量计算历史tick文件的成交性质")
+    parser.add_argument("src_dir", help="tick文件目录（.csv/.parquet）")
+    parser.add_argument("dst_dir", help="输出目录")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认cpu核数")
+    parser.add_argument("--chunksize", type=int, default=500000, help="每块行数")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None, help="输出格式，默认同输入")
+    parser.add_argument("--overwrite", action="store_true", help="覆盖已有输出")
+    args = parser.parse_args()
+    start = time.time()
+    results = classify_dir(args.src_dir, args.dst_dir, args.workers, args.chunksize, args.format, not args.overwrite)
+    total = sum(results.values())
+    elapsed = time.time() - start
+    print("files:{} ticks:{} seconds:{:.1f} ticks/s:{:.0f}".format(len(results), total, elapsed, total / elapsed if elapsed > 0 else 0))
+
+
+if __name__ == "__main__":
+    main()
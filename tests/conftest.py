@@ -0,0 +1,9 @@
+import os
+import sys
+
+#各目录的模块按目录平铺导入，如from opt import TqOption
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("option", "ta", "tqexcel", "benchmark"):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
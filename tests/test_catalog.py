@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from tqsdk.objs import Quote
+
+from catalog import ContractCatalog
+from fake_api import FakeApi
+
+
+def test_refresh_adds_only_new_contracts():
+    api = FakeApi(n_products=1, n_months=1, n_strikes=2)
+    catalog = ContractCatalog(api)
+    future_id = api.futures[0]
+    assert catalog.refresh() == 0
+    api._add(future_id + "-C-99999", last_price=1.0, price_tick=0.5, ins_class="FUTURE_OPTION", product_id="P00_o",
+             option_class="CALL", strike_price=99999.0, underlying_symbol=future_id, expire_datetime=datetime(2020, 2, 14, 15).timestamp())
+    assert catalog.refresh() == 1
+    assert future_id + "-C-99999" in [q.instrument_id for q in catalog.get_by_underlying(future_id)]
+    assert catalog.get_option(future_id, datetime(2020, 2, 14, 15), 99999.0, "CALL").instrument_id == future_id + "-C-99999"
+
+
+def test_expire_dt_without_expiry():
+    api = FakeApi(n_products=1, n_months=1, n_strikes=2)
+    catalog = ContractCatalog(api)
+    # 已收录但没有到期日的合约
+    api._add("SSE.000300", last_price=4000.0, price_tick=0.2, ins_class="INDEX", product_id="000300")
+    catalog.refresh()
+    assert catalog.expire_dt(api.get_quote("SSE.000300")) is None
+    # 未收录、合约信息未到达的合约
+    quote = Quote(api)
+    quote.instrument_id = "SHFE.unknown"
+    assert catalog.expire_dt(quote) is None
+    future = api.get_quote(api.futures[0])
+    assert catalog.expire_dt(future) == datetime.fromtimestamp(future.expire_datetime)
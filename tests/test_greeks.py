@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from tqsdk.tafunc import time_to_datetime
+
+from fake_api import FakeApi
+from greeks import black76_greeks, black76_price
+from opt import TqOption
+
+
+def _option_api():
+    api = FakeApi(n_products=1, n_months=2, n_strikes=10)
+    future_id = api.futures[0]
+    return api, TqOption(api, underlying_future_id=future_id), api.get_quote(future_id)
+
+
+def test_chain_greeks_reuses_engine():
+    api, opt_api, future_quote = _option_api()
+    year, month = future_quote.delivery_year, future_quote.delivery_month
+    first = opt_api.get_chain_greeks(future_quote, opt_api.get_option_chain(strike_year=year, strike_month=month))
+    engine = next(iter(opt_api._greeks.values()))
+    assert engine.recomputed == 20
+    # 每次get_option_chain返回新的OptionChain对象，仍然命中同一个GreeksEngine，行情不变时不重算
+    second = opt_api.get_chain_greeks(future_quote, opt_api.get_option_chain(strike_year=year, strike_month=month))
+    assert len(opt_api._greeks) == 1
+    assert next(iter(opt_api._greeks.values())) is engine
+    assert engine.recomputed == 0
+    assert (second['call_iv'] == first['call_iv']).all()
+
+
+def test_chain_greeks_separate_engine_per_strike_range():
+    api, opt_api, future_quote = _option_api()
+    year, month = future_quote.delivery_year, future_quote.delivery_month
+    chain = opt_api.get_option_chain(strike_year=year, strike_month=month)
+    narrow = opt_api.get_option_chain(strike_year=year, strike_month=month, min_strike=chain.strikes[2], max_strike=chain.strikes[5])
+    opt_api.get_chain_greeks(future_quote, chain)
+    res = opt_api.get_chain_greeks(future_quote, narrow)
+    assert len(opt_api._greeks) == 2
+    assert len(res['call_iv']) == 4
+
+
+def test_chain_greeks_use_option_expiry():
+    api = FakeApi(n_products=1, n_months=2, n_strikes=10)
+    future_id = api.futures[1]  # 奇数月：期权比期货早25天到期
+    opt_api = TqOption(api, underlying_future_id=future_id)
+    future_quote = api.get_quote(future_id)
+    chain = opt_api.get_option_chain(strike_year=future_quote.delivery_year, strike_month=future_quote.delivery_month)
+    res = opt_api.get_chain_greeks(future_quote, chain, risk_free=0.02)
+    ttm = (time_to_datetime(chain.quotes[0].expire_datetime) - time_to_datetime(future_quote.datetime)).total_seconds() / (365 * 86400)
+    future_ttm = (time_to_datetime(future_quote.expire_datetime) - time_to_datetime(future_quote.datetime)).total_seconds() / (365 * 86400)
+    assert res['ttm'] == pytest.approx(ttm)
+    assert future_ttm - ttm == pytest.approx(25 / 365)
+    F = res['future_price']
+    for name, is_call in (("call", True), ("put", False)):
+        expected = black76_greeks(F, chain.strikes, ttm, 0.02, res[name + '_iv'], is_call)
+        for field in ('delta', 'gamma', 'vega', 'theta'):
+            np.testing.assert_allclose(res[name + '_' + field], expected[field], rtol=1e-9)
+        prices = black76_price(F, chain.strikes, ttm, 0.02, res[name + '_iv'], is_call)
+        mid = chain.price_arrays()
+        mid = (mid[name + '_bid'] + mid[name + '_ask']) / 2
+        ok = ~np.isnan(res[name + '_iv'])
+        assert ok.any()
+        np.testing.assert_allclose(prices[ok], mid[ok], rtol=1e-6)
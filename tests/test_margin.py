@@ -0,0 +1,35 @@
+import numpy as np
+
+from fake_api import FakeApi
+from opt import TqOption
+
+
+def _chain():
+    api = FakeApi(n_products=1, n_months=1, n_strikes=10)
+    future_quote = api.get_quote(api.futures[0])
+    opt_api = TqOption(api, underlying_future_id=future_quote.instrument_id)
+    chain = opt_api.get_option_chain(strike_year=future_quote.delivery_year, strike_month=future_quote.delivery_month)
+    return opt_api, future_quote, chain
+
+
+def test_chain_margins_follow_pre_settlement():
+    opt_api, future_quote, chain = _chain()
+    call_margin, _ = opt_api.get_chain_margins(chain, future_quote)
+    # 同一交易日内期权前结算价更新（如换日后晚到），缓存失效
+    quote = chain.call_quotes()[3]
+    quote.pre_settlement += 100
+    updated, _ = opt_api.get_chain_margins(chain, future_quote)
+    assert updated[3] == call_margin[3] + 100 * quote.volume_multiple
+    assert (np.delete(updated, 3) == np.delete(call_margin, 3)).all()
+
+
+def test_chain_margins_keyed_by_all_symbols():
+    opt_api, future_quote, chain = _chain()
+    # 第一个合约和长度都相同、中间合约不同的两条期权链不能共用缓存
+    a = chain.take(np.array([0, 1, 2]))
+    b = chain.take(np.array([0, 4, 8]))
+    margin_a, _ = opt_api.get_chain_margins(a, future_quote)
+    margin_b, _ = opt_api.get_chain_margins(b, future_quote)
+    full, _ = opt_api.get_chain_margins(chain, future_quote)
+    assert (margin_a == full[[0, 1, 2]]).all()
+    assert (margin_b == full[[0, 4, 8]]).all()
@@ -0,0 +1,55 @@
+import math
+from datetime import datetime
+
+import numpy as np
+
+from fake_api import FakeApi
+from opt import TqOption, OptionTrade
+
+
+def _trade(save_data=False):
+    api = FakeApi(n_products=1, n_months=1, n_strikes=10, change_ratio=0.3)
+    future_quote = api.get_quote(api.futures[0])
+    opt_api = TqOption(api, underlying_future_id=future_quote.instrument_id)
+    chain = opt_api.get_option_chain(strike_year=future_quote.delivery_year, strike_month=future_quote.delivery_month)
+    trade = OptionTrade(api, opt_api, future_quote.instrument_id, chain.to_dict(), return_threshold=None, save_data=save_data)
+    return api, future_quote, chain, trade
+
+
+def test_on_quote_matches_chain_residuals():
+    api, future_quote, chain, trade = _trade(save_data=True)
+    for _ in range(5):
+        api.wait_update()
+        expected = trade.opt_api.get_chain_parity_residuals(future_quote, chain)
+        for i, (strike_price, call_quote, put_quote) in enumerate(zip(chain.strikes.tolist(), chain.call_quotes(), chain.put_quotes())):
+            trade.on_quote(future_quote, strike_price, call_quote, put_quote)
+            record = trade._records[strike_price]
+            for name in ('premium_mid', 'premium_call', 'premium_put', 'long_call_cost', 'long_put_cost', 'long_call_return', 'long_put_return'):
+                assert record[name] == expected[name][i]
+            assert record.call_bid == call_quote.bid_price1 and record.put_dt == put_quote.datetime
+    assert len(trade.recorder) == 5 * len(chain)
+
+
+def test_on_quote_on_expiry_day():
+    api, future_quote, chain, trade = _trade()
+    # 到期日当天ttm为0，年化收益率为nan，不抛ZeroDivisionError
+    future_quote.expire_datetime = datetime.strptime(future_quote.datetime[:10] + " 15", "%Y-%m-%d %H").timestamp()
+    strike_price = float(chain.strikes[0])
+    assert trade.on_quote(future_quote, strike_price, chain.call_quotes()[0], chain.put_quotes()[0]) == 0
+    record = trade._records[strike_price]
+    assert record.ttm == 0
+    assert math.isnan(record.long_call_return) and math.isnan(record.long_put_return)
+    assert not np.isnan(record.premium_call)
+    res = trade.opt_api.get_chain_parity_residuals(future_quote, chain)
+    assert np.isnan(res['long_call_return']).all() and np.isnan(res['long_put_return']).all()
+
+
+def test_save_data_recorder_is_bounded():
+    api, future_quote, chain, trade = _trade(save_data=True)
+    trade.recorder.max_rows = 4096
+    call_quote, put_quote = chain.call_quotes()[0], chain.put_quotes()[0]
+    for _ in range(10000):
+        trade.on_quote(future_quote, float(chain.strikes[0]), call_quote, put_quote)
+    # 按整块丢弃：最多多出一个未写满的块
+    assert 0 < len(trade.recorder) <= 4096 + trade.recorder.chunk_size
+    assert _trade(save_data=True)[3].recorder.max_rows == 100000
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pytest
+
+from dispatcher import ParityDispatcher, EvalScheduler
+from fake_api import FakeApi
+from opt import TqOption, OptionTrade
+from replay import ReplayApi, dump_contracts, load_contracts, updates_from_records, subscribe, run
+
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    """
+        在FakeApi上录制200次行情更新的折溢价数据，导出合约信息
+    """
+    api = FakeApi(n_products=1, n_months=1, n_strikes=10, change_ratio=0.3)
+    future_id = api.futures[0]
+    future_quote = api.get_quote(future_id)
+    opt_api = TqOption(api, underlying_future_id=future_id)
+    _, opts = opt_api.get_future_opt_symbols(strike_year=future_quote.delivery_year, strike_month=future_quote.delivery_month)
+    trade = OptionTrade(api, opt_api, future_id, opts, save_data=True, return_threshold=None)
+    groups = [(opt['K'], api.get_quote(opt['c']), api.get_quote(opt['p'])) for opt in opts.values()]
+    for _ in range(200):
+        api.wait_update()
+        for strike_price, call_quote, put_quote in groups:
+            if api.is_changing(future_quote) or api.is_changing(call_quote) or api.is_changing(put_quote):
+                trade.on_quote(future_quote, strike_price, call_quote, put_quote)
+    path = str(tmp_path_factory.mktemp("replay") / "contracts.json")
+    dump_contracts(api, [future_id] + [s for opt in opts.values() for s in (opt['c'], opt['p'])], path)
+    return future_id, opts, load_contracts(path), updates_from_records(trade.quote_df, opts)
+
+
+def _replay(recording, mode):
+    future_id, opts, contracts, updates = recording
+    api = ReplayApi(contracts, updates)
+    scheduler = EvalScheduler() if mode == "scheduler" else None
+    dispatcher = ParityDispatcher(api) if mode == "dispatcher" else None
+    trade = OptionTrade(api, TqOption(api, underlying_future_id=future_id), future_id, opts, can_trade=True,
+                        long_call_threshold=-3, long_put_threshold=-3, return_threshold=None,
+                        dispatcher=dispatcher, scheduler=scheduler)
+    subscribe(api, trade, opts, future_id)
+    run(api, scheduler=scheduler)
+    trades, pnl = api.trade_df(), api.pnl()
+    api.close()
+    return future_id, trades, pnl
+
+
+def _option_fills(trades, future_id):
+    """
+        期权成交，按成交内容排序：同一次行情更新内各行权价的处理顺序随模式不同
+    """
+    fills = trades[trades['symbol'] != future_id]
+    return fills.sort_values(list(fills.columns), kind="stable").reset_index(drop=True)
+
+
+def test_replay_modes_agree(recording):
+    future_id, trades, pnl = _replay(recording, "watcher")
+    option_fills = _option_fills(trades, future_id)
+    assert len(option_fills) > 0
+    for mode in ("scheduler", "dispatcher"):
+        _, other_trades, other_pnl = _replay(recording, mode)
+        # 期权成交相同；期货对冲单在scheduler/dispatcher中同一时刻合并下单，笔数可以更少，最终持仓和盈亏相同
+        assert _option_fills(other_trades, future_id).equals(option_fills)
+        assert other_pnl.equals(pnl)
+
+
+def test_replay_is_deterministic(recording):
+    _, trades, pnl = _replay(recording, "watcher")
+    _, again_trades, again_pnl = _replay(recording, "watcher")
+    assert again_trades.equals(trades)
+    assert again_pnl.equals(pnl)
+
+
+def test_replay_clock(recording):
+    future_id, opts, contracts, updates = recording
+    api = ReplayApi(contracts, updates)
+    first = datetime.strptime(updates['datetime'].iloc[0], "%Y-%m-%d %H:%M:%S.%f")
+    # 还没有wait_update时为第一条行情的时间，TqOption不用本机当前时间
+    assert TqOption(api, underlying_future_id=future_id)._now == first
+    api.wait_update()
+    api.wait_update()
+    assert api._backtest._current_dt == int(datetime.strptime(api._times[1], "%Y-%m-%d %H:%M:%S.%f").timestamp() * 1e9)
+    run(api)
+    last = datetime.strptime(updates['datetime'].iloc[-1], "%Y-%m-%d %H:%M:%S.%f")
+    assert datetime.fromtimestamp(api._backtest._current_dt / 1e9) == last
+    api.close()
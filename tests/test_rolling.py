@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fake_api import FakeApi
+from opt import TqOption, OptionTrade
+from rolling import RollingStats
+
+FIELDS = ['a', 'b']
+
+
+def _ticks(n_ticks, n_groups, seed=0):
+    """
+        随机的tick：取值按0.5取整（最值常有重复），约10%的tick某个字段为nan
+    """
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.normal(size=(n_ticks, len(FIELDS), n_groups)) * 4) / 2
+    values[rng.random(values.shape) < 0.05] = np.nan
+    pushed = rng.random((n_ticks, n_groups)) < 0.7  # 每个tick只更新部分组
+    return values, pushed
+
+
+def _expected(stats: RollingStats, history: list, f: int) -> dict:
+    """
+        用pandas对一个组一个字段计入的值（nan的tick已跳过）计算参考结果
+    """
+    s = pd.Series([values[f] for values in history], dtype=np.float64)
+    window = s.rolling(stats.window, min_periods=1)
+    ewm = s.ewm(alpha=stats.alpha, adjust=False)
+    return {'mean': window.mean().iloc[-1], 'var': window.var().iloc[-1], 'std': window.std().iloc[-1],
+            'min': window.min().iloc[-1], 'max': window.max().iloc[-1],
+            'ewma': ewm.mean().iloc[-1], 'ewm_var': ewm.var(bias=True).iloc[-1]}
+
+
+def _check(stats: RollingStats, histories: list):
+    for g, history in enumerate(histories):
+        assert stats.count[g] == min(len(history), stats.window)
+        if not history:
+            continue
+        for f in range(len(FIELDS)):
+            for name, value in _expected(stats, history, f).items():
+                actual = getattr(stats, name)[f, g]
+                if value != value:
+                    assert actual != actual, name
+                else:
+                    assert actual == pytest.approx(value, rel=1e-9, abs=1e-9), name
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_rolling_matches_pandas(batch):
+    n_groups, window = 4, 5
+    values, pushed = _ticks(60, n_groups)
+    stats = RollingStats(n_groups, window, fields=FIELDS)
+    histories = [[] for _ in range(n_groups)]
+    for t in range(len(values)):
+        groups = np.flatnonzero(pushed[t])
+        if batch:
+            stats.push_many(groups, values[t][:, groups])
+        else:
+            for g in groups.tolist():
+                stats.push(g, values[t][:, g])
+        for g in groups.tolist():
+            if not np.isnan(values[t][:, g]).any():
+                histories[g].append(values[t][:, g])
+        _check(stats, histories)
+
+
+def test_threshold_warm_up():
+    stats = RollingStats(2, 5, fields=FIELDS)
+    for i in range(4):
+        stats.push(0, [float(i), 0.0])
+        assert np.isnan(stats.threshold('a', 2.0, 0))
+    assert np.isnan(stats.threshold('a', 2.0)).all()
+    stats.push(0, [4.0, 0.0])
+    expected = 2.0 - 2.0 * pd.Series([0.0, 1.0, 2.0, 3.0, 4.0]).std()
+    assert stats.threshold('a', 2.0, 0) == pytest.approx(expected)
+    # 另一组没有样本，仍为nan
+    np.testing.assert_allclose(stats.threshold('a', 2.0), [expected, np.nan])
+
+
+def test_premium_threshold_falls_back_to_fixed():
+    api = FakeApi(n_products=1, n_months=1, n_strikes=10)
+    future_quote = api.get_quote(api.futures[0])
+    opt_api = TqOption(api, underlying_future_id=future_quote.instrument_id)
+    chain = opt_api.get_option_chain(strike_year=future_quote.delivery_year, strike_month=future_quote.delivery_month)
+    trade = OptionTrade(api, opt_api, future_quote.instrument_id, chain.to_dict(), return_threshold=None,
+                        long_call_threshold=-7, window=5, z_threshold=1.0)
+    # 样本不足window时用固定临界值
+    for i in range(4):
+        trade.rolling.push(0, (float(i), 0.0, 0.0))
+        assert trade._premium_threshold("premium_call", -7, 0) == -7
+    np.testing.assert_array_equal(trade._premium_threshold("premium_call", -7, np.array([0, 1, -1])), [-7, -7, -7])
+    trade.rolling.push(0, (4.0, 0.0, 0.0))
+    adaptive = 2.0 - pd.Series([0.0, 1.0, 2.0, 3.0, 4.0]).std()
+    assert trade._premium_threshold("premium_call", -7, 0) == pytest.approx(adaptive)
+    # 数组版：有足够样本的组用滚动临界值，其余组和不在统计中的行权价（-1）用固定临界值
+    np.testing.assert_allclose(trade._premium_threshold("premium_call", -7, np.array([0, 1, -1])), [adaptive, -7, -7])
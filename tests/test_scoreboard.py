@@ -0,0 +1,46 @@
+import math
+import random
+
+from scoreboard import Scoreboard, LONG_CALL, LONG_PUT
+
+
+def _check(board: Scoreboard, reference: dict):
+    assert len(board) == len(reference)
+    for key, (score, _) in reference.items():
+        assert key in board
+        assert board.get(*key) == score
+    for pos, (_, key, _) in enumerate(board._heap):
+        assert board._index[key] == pos
+        if pos:
+            assert board._heap[pos][0] <= board._heap[(pos - 1) >> 1][0]
+    expected = sorted(((score, key[0], key[1], key[2], info) for key, (score, info) in reference.items()), key=lambda e: -e[0])
+    for n in (0, 1, 5, len(reference), len(reference) + 3):
+        assert board.top(n) == expected[:n]
+
+
+def test_scoreboard_matches_sorted_reference():
+    rng = random.Random(0)
+    board = Scoreboard(min_score=0.01)
+    reference = dict()  # {键: (分数, 附加信息)}
+    largest = 0
+    futures = ["FAKE.P{:02d}2003".format(p) for p in range(3)]
+    for step in range(2000):
+        future_id = rng.choice(futures)
+        strike_price = float(rng.randrange(950, 1060, 10))
+        if rng.random() < 0.03:
+            # 移除整个期货或一个行权价
+            strike = strike_price if rng.random() < 0.5 else None
+            board.remove(future_id, strike)
+            reference = {k: v for k, v in reference.items() if not (k[0] == future_id and (strike is None or k[1] == strike))}
+        else:
+            direction = rng.choice((LONG_CALL, LONG_PUT))
+            score = rng.choice((rng.uniform(-0.05, 0.2), rng.uniform(-0.05, 0.2), 0.01, 0.0, math.nan, math.inf))
+            board.update(future_id, strike_price, direction, score, info=step)
+            key = (future_id, strike_price, direction)
+            if score > 0.01 and not math.isinf(score):
+                reference[key] = (score, step)
+            else:
+                reference.pop(key, None)
+        _check(board, reference)
+        largest = max(largest, len(reference))
+    assert largest > 20
@@ -0,0 +1,32 @@
+from datetime import date, datetime
+
+from snapshot import ContractSnapshot
+from tradingday import trading_day, tick_trading_day
+
+
+def test_trading_day_night_session():
+    assert trading_day(datetime(2020, 2, 3, 14, 59)) == date(2020, 2, 3)
+    assert trading_day(datetime(2020, 2, 3, 21, 0)) == date(2020, 2, 4)
+    # 周五夜盘归下周一
+    assert trading_day(datetime(2020, 2, 7, 21, 0)) == date(2020, 2, 10)
+    assert tick_trading_day("2020-02-07 23:04:21.000001") == "20200210"
+    assert tick_trading_day("") == ""
+
+
+def test_load_missing_or_corrupt_snapshot(tmp_path):
+    assert ContractSnapshot.load(str(tmp_path / "missing.npz")) is None
+    corrupt = tmp_path / "corrupt.npz"
+    corrupt.write_bytes(b"PK\x03\x04 not a zip file")
+    assert ContractSnapshot.load(str(corrupt)) is None
+    truncated = tmp_path / "truncated.npz"
+    ContractSnapshot(["F"], ["F-C-1"], {"F": datetime(2020, 3, 14, 15), "F-C-1": None}, 2).save(str(truncated))
+    truncated.write_bytes(truncated.read_bytes()[:40])
+    assert ContractSnapshot.load(str(truncated)) is None
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "s.npz")
+    ContractSnapshot(["F"], ["F-C-1"], {"F": datetime(2020, 3, 14, 15), "F-C-1": None}, 2).save(path)
+    snapshot = ContractSnapshot.load(path)
+    assert snapshot.future_symbols == ["F"] and snapshot.option_symbols == ["F-C-1"]
+    assert snapshot.expire_dts == {"F": datetime(2020, 3, 14, 15), "F-C-1": None}
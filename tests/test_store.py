@@ -0,0 +1,15 @@
+import numpy as np
+
+from store import ParityStore, read_day
+
+
+def test_write_records_partitions_by_trading_day(tmp_path):
+    store = ParityStore(str(tmp_path))
+    # 周五日盘、周五夜盘（归下周一）
+    tq_time = np.array(["2020-02-07 14:59:59.500000", "", "2020-02-07 21:00:00.000000", "2020-02-07 23:00:00.000000"])
+    store.write_records("SR", {'tq_time': tq_time, 'premium_mid': np.arange(4, dtype=np.float64)})
+    store.close()
+    friday = read_day(str(tmp_path), "20200207", "SR")
+    monday = read_day(str(tmp_path), "20200210", "SR")
+    assert friday['premium_mid'].tolist() == [0.0, 1.0]
+    assert monday['premium_mid'].tolist() == [2.0, 3.0]
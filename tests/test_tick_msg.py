@@ -0,0 +1,42 @@
+import numpy as np
+
+from fake_api import make_ticks
+from tafunc_tick_msg import TickMsgClassifier, cal_ticks_msg
+
+
+def _serial(ticks, end, length):
+    """
+        模拟get_tick_serial：截至第end笔的最近length笔
+    """
+    return ticks.iloc[max(end - length, 0):end].reset_index(drop=True)
+
+
+def test_incremental_matches_full():
+    ticks = make_ticks(500)
+    classifier = TickMsgClassifier(capacity=1000)
+    for end in range(50, 501, 30):
+        classifier.update(_serial(ticks, end, 100))
+    classifier.update(_serial(ticks, 500, 100))
+    expected = cal_ticks_msg(ticks)
+    res = classifier.recent()
+    assert res['id'].tolist() == list(range(500))
+    assert (res['msg'].to_numpy()[1:] == expected['msg'].to_numpy()[1:]).all()
+    assert classifier.gaps == 0
+
+
+def test_gap_recomputes_from_window():
+    ticks = make_ticks(500)
+    classifier = TickMsgClassifier(capacity=1000)
+    classifier.update(_serial(ticks, 100, 100))
+    # 两次update之间新增了300笔，序列只保留最近100笔：第200~299笔漏掉
+    window = _serial(ticks, 400, 100)
+    assert classifier.update(window) == 100
+    assert classifier.gaps == 1
+    res = classifier.recent(100)
+    expected = cal_ticks_msg(window)
+    assert res['id'].tolist() == list(range(300, 400))
+    # 窗口第一笔没有前一笔，与整段重新计算的结果一致，而不是与第99笔比较
+    assert (res['pc'].to_numpy() == expected['pc'].to_numpy()).all()
+    assert (res['msg'].to_numpy() == expected['msg'].to_numpy()).all()
+    classifier.update(_serial(ticks, 410, 100))
+    assert classifier.gaps == 1
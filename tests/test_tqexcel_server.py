@@ -0,0 +1,86 @@
+import threading
+
+from fake_api import FakeApi
+from server import MarketDataServer, RangeSync, QUOTE, QUOTE_FIELDS
+
+
+def _server():
+    api = FakeApi(n_products=2, n_months=2, n_strikes=5, change_ratio=0.3)
+    server = MarketDataServer(api_factory=lambda: api)
+    server.open()
+    return api, server
+
+
+def test_quote_table_before_and_after_step():
+    api, server = _server()
+    symbols = api.futures[:3]
+    fields = ['last_price', 'bid_price1', 'datetime']
+    # 第一次调用只登记订阅，返回空表
+    assert server.quote_table(symbols, fields) == [[None] * 3] * 3
+    server.step()
+    table = server.quote_table(symbols, fields)
+    assert table == [[api.get_quote(s).last_price, api.get_quote(s).bid_price1, api.get_quote(s).datetime] for s in symbols]
+    assert len(server.quote_table(symbols)[0]) == len(QUOTE_FIELDS)
+
+
+def test_blank_and_unknown_fields():
+    api, server = _server()
+    symbols = [api.futures[0], "", "FAKE.missing"]
+    server.quote_table(symbols, ['last_price'])
+    server.step()
+    table = server.quote_table(symbols, ['last_price', '', 'no_such_field'])
+    assert table[0] == [api.get_quote(api.futures[0]).last_price, None, None]
+    assert table[1] == [None] * 3 and table[2] == [None] * 3
+    api.wait_update()
+    api._changed.add(api.futures[0])
+    api.get_quote(api.futures[0]).last_price += 1
+    server.step()
+    _, cells = server.changed_cells(QUOTE, symbols, ['', 'last_price', 'no_such_field'], 0)
+    assert (0, 1, api.get_quote(api.futures[0]).last_price) in cells
+    assert all(c == 1 for _, c, _ in cells)
+
+
+def test_changed_cells_since_version():
+    api, server = _server()
+    symbols = list(api.futures)
+    fields = ['last_price', 'volume', 'datetime']
+    server.quote_table(symbols, fields)
+    server.step()
+    since = server.version
+    before = server.quote_table(symbols, fields)
+    server.step()
+    version, cells = server.changed_cells(QUOTE, symbols, fields, since)
+    after = server.quote_table(symbols, fields)
+    assert version == server.version
+    expected = {(r, c, after[r][c]) for r in range(len(symbols)) for c in range(len(fields)) if after[r][c] != before[r][c]}
+    assert set(cells) == expected
+    assert server.changed_cells(QUOTE, symbols, fields, version)[1] == []
+
+
+def test_range_sync_writes_only_changed_cells():
+    api, server = _server()
+    symbols = list(api.futures)
+    fields = ['last_price', 'volume', 'datetime']
+    written = dict()
+    sync = RangeSync(server, QUOTE, symbols, fields, lambda r, c, v: written.__setitem__((r, c), v))
+    # 首次同步写满整个区域（尚无数据的单元格写空）
+    assert sync.sync() == len(symbols) * len(fields)
+    server.step()
+    assert sync.sync() == len(symbols) * len(fields)
+    since = sync.version
+    server.step()
+    _, cells = server.changed_cells(QUOTE, symbols, fields, since)
+    assert sync.sync() == len(cells)
+    assert [[written[(r, c)] for c in range(len(fields))] for r in range(len(symbols))] == server.quote_table(symbols, fields)
+    assert sync.sync() == 0
+
+
+def test_wait_version():
+    api, server = _server()
+    version = server.version
+    assert server.wait_version(version, timeout=0.01) == version
+    server.quote_table(api.futures, ['last_price'])
+    thread = threading.Thread(target=server.step)
+    thread.start()
+    assert server.wait_version(version, timeout=10) > version
+    thread.join()
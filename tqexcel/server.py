@@ -0,0 +1,322 @@
+"""
+Excel插件的数据服务：一个线程持有唯一的TqApi，每次wait_update之后把订阅的行情、账户、持仓发布为带版本号的快照，
+UDF只读快照，不直接调用tqsdk。
+
+- 快照写时复制：每次有变化时整体替换，读者取一次self.snapshot()就得到一致的一份数据，不需要加锁
+- 每个字段记录最后变化时的版本号，changed_cells()只返回某版本之后变化了的单元格
+- quote_table()等按区域一次返回二维数组，一个公式填满整个区域；空白或不认识的字段对应的列为None
+- wait_version()阻塞到有新版本，供刷新线程在有变化时才写单元格、触发重算
+"""
+import threading
+import time
+
+from tqsdk import TqApi, TqSim
+
+#各类数据的字段，表格的列按此顺序
+QUOTE_FIELDS = ['datetime', 'last_price', 'bid_price1', 'bid_volume1', 'ask_price1', 'ask_volume1', 'highest', 'lowest',
+                'open', 'volume', 'open_interest', 'pre_settlement', 'pre_close', 'upper_limit', 'lower_limit']
+ACCOUNT_FIELDS = ['balance', 'available', 'margin', 'float_profit', 'position_profit', 'close_profit', 'commission', 'risk_ratio']
+POSITION_FIELDS = ['pos_long', 'pos_short', 'open_price_long', 'open_price_short', 'float_profit', 'position_profit', 'margin']
+
+QUOTE = "quote"
+ACCOUNT = "account"
+POSITION = "position"
+_FIELDS = {QUOTE: QUOTE_FIELDS, ACCOUNT: ACCOUNT_FIELDS, POSITION: POSITION_FIELDS}
+_FIELD_INDEX = {kind: {f: i for i, f in enumerate(fields)} for kind, fields in _FIELDS.items()}
+
+
+def default_api() -> TqApi:
+    return TqApi(TqSim())
+
+
+def _cell(value):
+    """
+        nan转为None（Excel显示为空）
+    """
+    return None if value is None or value != value else value
+
+
+class Snapshot:
+    """
+        某一版本的全部数据：{(类型, 合约代码): (各字段的值, 各字段最后变化的版本号)}，发布后不再修改
+    """
+
+    __slots__ = ('version', 'rows')
+
+    def __init__(self, version: int, rows: dict):
+        self.version = version
+        self.rows = rows
+
+    def table(self, kind: str, keys: list, fields: list) -> list:
+        """
+            二维数组：每个key一行，每个字段一列，没有数据的单元格、空白或不认识的字段为None
+        """
+        index = [_FIELD_INDEX[kind].get(f, None) for f in fields]
+        res = []
+        for key in keys:
+            row = self.rows.get((kind, key), None)
+            res.append([None] * len(index) if row is None else [None if i is None else row[0][i] for i in index])
+        return res
+
+    def changed_cells(self, kind: str, keys: list, fields: list, since: int) -> list:
+        """
+            版本since之后变化了的单元格
+
+            Return:
+
+                list: [(行, 列, 值)]，行列为keys、fields中的下标；空白或不认识的字段始终为None，不会出现
+
+        """
+        index = [(c, i) for c, i in enumerate(_FIELD_INDEX[kind].get(f, None) for f in fields) if i is not None]
+        res = []
+        for r, key in enumerate(keys):
+            row = self.rows.get((kind, key), None)
+            if row is None:
+                continue
+            values, versions = row
+            for c, i in index:
+                if versions[i] > since:
+                    res.append((r, c, values[i]))
+        return res
+
+
+class MarketDataServer:
+    """
+        行情、账户数据服务
+
+        start()启动后台线程：在线程内创建api，循环wait_update并发布快照。也可以在当前线程调用open()后反复调用step()，
+        如用本地模拟的api测试。quote_table()等可以在任意线程调用：只读快照，新合约登记为待订阅，由api线程订阅。
+    """
+
+    def __init__(self, api_factory=default_api, poll_interval: float = 0.5, account: bool = True):
+        """
+
+            Args:
+
+                api_factory: 无参函数，返回api；在运行api的线程内调用
+
+                poll_interval (float): wait_update的最长等待时间（秒），也是处理新订阅的最大延迟
+
+                account (bool): 是否发布账户和持仓
+
+        """
+        self.api_factory = api_factory
+        self.poll_interval = poll_interval
+        self.account = account
+        self._api = None
+        self._objs = dict()  # {(类型, 合约代码): tqsdk对象}，只在api线程访问
+        self._subscribed = set()  # 已登记的(类型, 合约代码)
+        self._pending = set()  # 待订阅的(类型, 合约代码)
+        self._lock = threading.Lock()  # 保护_subscribed和_pending
+        self._snapshot = Snapshot(0, dict())
+        self._published = threading.Condition()  # 发布新版本时通知wait_version
+        self._thread = None
+        self._stop = threading.Event()
+        self.error = None  # api线程退出时的异常
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def snapshot(self) -> Snapshot:
+        return self._snapshot
+
+    def wait_version(self, since: int, timeout: float = None) -> int:
+        """
+            等到版本大于since或超时
+
+            Return:
+
+                int: 当前版本
+
+        """
+        with self._published:
+            self._published.wait_for(lambda: self._snapshot.version > since, timeout)
+        return self._snapshot.version
+
+    def subscribe(self, kind: str, keys: list):
+        """
+            登记订阅，已订阅的忽略；账户在open()时订阅
+        """
+        if kind == ACCOUNT:
+            return
+        keys = {(kind, key) for key in keys if key}
+        with self._lock:
+            new = keys - self._subscribed
+            self._subscribed |= new
+            self._pending |= new
+
+    def quote_table(self, symbols: list, fields: list = None) -> list:
+        """
+            行情表：每个合约一行，fields为None时为QUOTE_FIELDS全部字段
+        """
+        fields = fields or QUOTE_FIELDS
+        self.subscribe(QUOTE, symbols)
+        return self._snapshot.table(QUOTE, symbols, fields)
+
+    def position_table(self, symbols: list, fields: list = None) -> list:
+        """
+            持仓表：每个合约一行，fields为None时为POSITION_FIELDS全部字段
+        """
+        fields = fields or POSITION_FIELDS
+        self.subscribe(POSITION, symbols)
+        return self._snapshot.table(POSITION, symbols, fields)
+
+    def account_table(self, fields: list = None) -> list:
+        """
+            账户表：一行，fields为None时为ACCOUNT_FIELDS全部字段
+        """
+        return self._snapshot.table(ACCOUNT, [ACCOUNT], fields or ACCOUNT_FIELDS)
+
+    def changed_cells(self, kind: str, keys: list, fields: list, since: int) -> (int, list):
+        """
+            版本since之后变化了的单元格
+
+            Return:
+
+                (当前版本, [(行, 列, 值)])，下次以返回的版本作为since
+
+        """
+        self.subscribe(kind, keys)
+        snapshot = self._snapshot
+        return snapshot.version, snapshot.changed_cells(kind, keys, fields, since)
+
+    def open(self):
+        """
+            在当前线程创建api
+        """
+        self._api = self.api_factory()
+        if self.account:
+            self._objs[(ACCOUNT, ACCOUNT)] = self._api.get_account()
+        self._publish()
+
+    def step(self, deadline: float = None) -> int:
+        """
+            处理新订阅、等待一次行情更新并发布快照
+
+            Return:
+
+                int: 有变化的行数
+
+        """
+        self._subscribe_pending()
+        self._api.wait_update(deadline=deadline)
+        return self._publish()
+
+    def _subscribe_pending(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        for kind, key in pending:
+            if (kind, key) in self._objs:
+                continue
+            try:
+                self._objs[(kind, key)] = self._api.get_quote(key) if kind == QUOTE else self._api.get_position(key)
+            except Exception:
+                pass  # 合约代码有误：不订阅，单元格保持为空
+        return len(pending)
+
+    def _publish(self) -> int:
+        """
+            比较订阅对象与上一版快照，有变化时发布新版本；行情只检查is_changing的合约，账户、持仓行数少，每次都比较
+        """
+        current = self._snapshot
+        version = current.version + 1
+        rows = None
+        changed = 0
+        for key, obj in self._objs.items():
+            old = current.rows.get(key, None)
+            if key[0] == QUOTE and old is not None and not self._api.is_changing(obj):
+                continue
+            values = tuple(_cell(obj.get(f, None)) for f in _FIELDS[key[0]])
+            if old is not None and old[0] == values:
+                continue
+            versions = tuple(version if old is None or old[0][i] != v else old[1][i] for i, v in enumerate(values))
+            if rows is None:
+                rows = dict(current.rows)
+            rows[key] = (values, versions)
+            changed += 1
+        if rows is not None:
+            with self._published:
+                self._snapshot = Snapshot(version, rows)
+                self._published.notify_all()
+        return changed
+
+    def start(self):
+        """
+            启动api线程
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tqexcel-server", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.open()
+            while not self._stop.is_set():
+                self.step(deadline=time.time() + self.poll_interval)
+        except Exception as e:
+            self.error = e
+        finally:
+            if self._api is not None:
+                self._api.close()
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+class RangeSync:
+    """
+        把一个区域和服务的数据同步：第一次写入整个区域，之后只写版本变化了的单元格
+
+        write(行, 列, 值)由调用方提供（如写Excel单元格），行列为区域内从0开始的下标。
+    """
+
+    def __init__(self, server: MarketDataServer, kind: str, keys: list, fields: list, write):
+        """
+
+            Args:
+
+                server (MarketDataServer): 数据服务
+
+                kind (str): QUOTE、POSITION或ACCOUNT
+
+                keys (list): 各行的合约代码，ACCOUNT时忽略
+
+                fields (list): 各列的字段
+
+                write: 写单元格的函数write(行, 列, 值)
+
+        """
+        self.server = server
+        self.kind = kind
+        self.keys = [ACCOUNT] if kind == ACCOUNT else list(keys)
+        self.fields = list(fields)
+        self.write = write
+        self.version = -1  # 已写入的版本，-1为尚未写入
+
+    def sync(self) -> int:
+        """
+            写入变化的单元格
+
+            Return:
+
+                int: 写入的单元格数
+
+        """
+        self.server.subscribe(self.kind, self.keys)
+        snapshot = self.server.snapshot()
+        if self.version < 0:
+            # 首次同步：整个区域都写，没有数据的单元格写空
+            table = snapshot.table(self.kind, self.keys, self.fields)
+            cells = [(r, c, value) for r, row in enumerate(table) for c, value in enumerate(row)]
+        else:
+            cells = snapshot.changed_cells(self.kind, self.keys, self.fields, self.version)
+        for r, c, value in cells:
+            self.write(r, c, value)
+        self.version = snapshot.version
+        return len(cells)
@@ -0,0 +1,188 @@
+"""
+xlwings UDF：公式只读MarketDataServer的快照，一个公式返回整个区域的二维数组
+
+=TQ_QUOTES(A2:A100, B1:F1, TQ_VERSION())     合约代码 × 字段的行情表，字段为空时为server.QUOTE_FIELDS
+=TQ_POSITIONS(A2:A20, B1:D1, TQ_VERSION())   持仓表
+=TQ_ACCOUNT(B1:E1, TQ_VERSION())             账户
+
+单元格怎样刷新：
+- 公式：TQ_VERSION()是易失函数，作为最后一个参数传入后，每次工作表重算时公式都重新读快照（第一次调用时合约刚登记订阅，
+  返回空表，下一次重算才有数据）。Excel不会自己重算，按F9，或运行宏tq_auto_refresh：后台线程在数据服务有新版本时
+  调用Application.Calculate，最多每REFRESH_INTERVAL秒一次。
+- 区域：宏tq_watch登记区域后，tq_refresh把变化了的单元格写回工作表（不重算公式）；tq_auto_refresh也会在有新版本时写回。
+- 宏tq_stop_refresh停止后台刷新。
+
+未安装xlwings时只提供get_server()，可以在Excel之外使用数据服务。
+"""
+import threading
+
+try:
+    import xlwings as xw
+except ImportError:
+    xw = None
+
+from server import MarketDataServer, RangeSync, QUOTE, POSITION, ACCOUNT
+
+#后台刷新的最短间隔（秒）
+REFRESH_INTERVAL = 0.5
+
+_server = None
+_syncs = dict()  # {(工作簿, 工作表名, 左上角地址): RangeSync}
+_sync_lock = threading.Lock()  # 宏和后台刷新线程不同时写回
+_local = threading.local()  # 各线程自己的工作表COM对象，xlwings对象不能跨线程使用
+_refresher = None
+_stop_refresh = threading.Event()
+
+
+def get_server() -> MarketDataServer:
+    """
+        进程内唯一的数据服务，第一次调用时启动
+    """
+    global _server
+    if _server is None:
+        _server = MarketDataServer()
+        _server.start()
+    return _server
+
+
+def _keys(values) -> list:
+    """
+        区域的值转为合约代码或字段，空白单元格为""（保持行列对齐，对应的行、列为空）
+    """
+    return [str(v).strip() if v is not None else "" for v in values]
+
+
+def _sheet(book: str, name: str):
+    """
+        当前线程内的工作表对象
+    """
+    sheets = getattr(_local, "sheets", None)
+    if sheets is None:
+        sheets = _local.sheets = dict()
+    sheet = sheets.get((book, name), None)
+    if sheet is None:
+        sheet = sheets[(book, name)] = xw.Book(book).sheets[name]
+    return sheet
+
+
+def _sync_all() -> int:
+    """
+        把已登记区域中变化了的单元格写回工作表
+
+        Return:
+
+            int: 写入的单元格数
+
+    """
+    with _sync_lock:
+        return sum(sync.sync() for sync in list(_syncs.values()))
+
+
+def _refresh_loop():
+    """
+        后台刷新线程：有新版本时写回登记的区域并重算工作簿
+    """
+    try:
+        import pythoncom  # pywin32，xlwings在Windows上的依赖
+        pythoncom.CoInitialize()
+    except ImportError:
+        pythoncom = None
+    server = get_server()
+    version = server.version
+    try:
+        while not _stop_refresh.is_set():
+            new_version = server.wait_version(version, timeout=REFRESH_INTERVAL)
+            if new_version == version:
+                continue
+            try:
+                _sync_all()
+                xw.apps.active.calculate()
+                version = new_version
+            except Exception:
+                pass  # Excel正忙（如正在编辑单元格）：下次再刷新
+            _stop_refresh.wait(REFRESH_INTERVAL)
+    finally:
+        _local.sheets = None
+        if pythoncom is not None:
+            pythoncom.CoUninitialize()
+
+
+if xw is not None:
+    @xw.func
+    @xw.arg("symbols", ndim=1)
+    @xw.arg("fields", ndim=1)
+    @xw.ret(expand="table")
+    def TQ_QUOTES(symbols, fields=None, version=None):
+        """
+            version传入TQ_VERSION()，使公式随重算刷新
+        """
+        return get_server().quote_table(_keys(symbols), _keys(fields) if fields else None)
+
+    @xw.func
+    @xw.arg("symbols", ndim=1)
+    @xw.arg("fields", ndim=1)
+    @xw.ret(expand="table")
+    def TQ_POSITIONS(symbols, fields=None, version=None):
+        return get_server().position_table(_keys(symbols), _keys(fields) if fields else None)
+
+    @xw.func
+    @xw.arg("fields", ndim=1)
+    @xw.ret(expand="table")
+    def TQ_ACCOUNT(fields=None, version=None):
+        return get_server().account_table(_keys(fields) if fields else None)
+
+    @xw.func(volatile=True)
+    def TQ_VERSION():
+        """
+            当前快照版本号：易失函数，每次重算都重新求值，作为其他公式的参数使其随重算刷新
+        """
+        return get_server().version
+
+    def _watch(sheet, kind: str, address: str):
+        """
+            登记区域：左上角为类型，第一行其余为字段，第一列其余为合约代码（账户没有合约代码，数据写在字段下面一行）
+        """
+        corner = sheet.range(address)
+        fields = _keys(corner.offset(0, 1).expand("right").options(ndim=1).value)
+        keys = [] if kind == ACCOUNT else _keys(corner.offset(1, 0).expand("down").options(ndim=1).value)
+        book, name, row, column = sheet.book.fullname, sheet.name, corner.row + 1, corner.column + 1
+
+        def write(r, c, value):
+            _sheet(book, name).range((row + r, column + c)).value = value
+        _syncs[(book, name, address)] = RangeSync(get_server(), kind, keys, fields, write)
+
+    @xw.sub
+    def tq_watch():
+        """
+            把当前选中区域登记为行情表（左上角单元格写"quote"、"position"或"account"）
+        """
+        sheet = xw.books.active.sheets.active
+        selection = xw.books.active.selection
+        kind = str(selection[0, 0].value or QUOTE).strip().lower()
+        _watch(sheet, kind if kind in (QUOTE, POSITION, ACCOUNT) else QUOTE, selection[0, 0].address)
+
+    @xw.sub
+    def tq_refresh():
+        """
+            把已登记区域中变化了的单元格写回工作表
+        """
+        _sync_all()
+
+    @xw.sub
+    def tq_auto_refresh():
+        """
+            启动后台刷新：有新行情时写回登记的区域并重算工作簿（TQ_VERSION()作参数的公式随之刷新）
+        """
+        global _refresher
+        if _refresher is not None and _refresher.is_alive():
+            return
+        _stop_refresh.clear()
+        _refresher = threading.Thread(target=_refresh_loop, name="tqexcel-refresh", daemon=True)
+        _refresher.start()
+
+    @xw.sub
+    def tq_stop_refresh():
+        """
+            停止后台刷新
+        """
+        _stop_refresh.set()